@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Ozan
+
+Benchmarks for the summarization in orsum.
+Gene sets and enrichment results are generated randomly from a seed, with a
+hierarchy similar to annotations like GO and REACTOME. The rules are timed
+with different numbers of threads to obtain the speedup curve. With
+--calibrate, whole runs of different sizes are measured stage by stage, each
+in a new process, and the coefficients of the cost model used by orsum.py --estimate are fitted.
+"""
+
+from termCombinationLib import initializeTermSummary, applyRule, readGmtModel, readInputEnrichmentResultFile, RULES
+from costModel import readGmtStatistics, getStageFeatures, fitCostModel, writeCostModel, predictStageCost, STAGES
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+import io
+import multiprocessing
+import random
+import tempfile
+import time
+import os
+
+
+def createRandomGeneSets(numberOfTerms, numberOfGenes, seed):
+	"""
+	Creates random hierarchical gene sets. Each new term is either a root term
+	with random genes or a child of an existing term with a subset of its genes.
+
+	:param int numberOfTerms: Number of terms
+	:param int numberOfGenes: Number of genes
+	:param int seed: Seed of the random number generator
+	:return: **termIdToGenesDict** (*dict*) – Dictionary mapping term IDs to set of genes.
+	:return: **termIdToTermNameDict** (*dict*) – Dictionary mapping term IDs to term names.
+	"""
+
+	rng=random.Random(seed)
+	genes=['GENE{}'.format(geneNo) for geneNo in range(numberOfGenes)]
+	termIdToGenesDict=dict()
+	termIdToTermNameDict=dict()
+	termIds=[]
+	for termNo in range(numberOfTerms):
+		termId='TERM:{:07d}'.format(termNo)
+		if len(termIds)==0 or rng.random()<0.05:
+			genesOfTerm=set(rng.sample(genes, rng.randint(1, max(1, numberOfGenes//10))))
+		else:
+			parentGenes=sorted(termIdToGenesDict[rng.choice(termIds)])
+			genesOfTerm=set(rng.sample(parentGenes, rng.randint(1, len(parentGenes))))
+			#Some terms are not exact subsets of their parents
+			if rng.random()<0.3:
+				genesOfTerm.add(rng.choice(genes))
+		termIdToGenesDict[termId]=genesOfTerm
+		termIdToTermNameDict[termId]='Term {}'.format(termNo)
+		termIds.append(termId)
+	return termIdToGenesDict, termIdToTermNameDict
+
+
+def createRandomEnrichmentResults(termIds, numberOfLists, listLength, seed):
+	"""
+	Creates random enrichment results from the given terms.
+
+	:param list termIds: Term IDs to choose from
+	:param int numberOfLists: Number of enrichment results
+	:param int listLength: Number of terms in each enrichment result
+	:param int seed: Seed of the random number generator
+	:return: **termIdsListList** (*list*) – List of ranked term ID lists
+	"""
+
+	rng=random.Random(seed)
+	termIds=list(termIds)
+	return [rng.sample(termIds, min(listLength, len(termIds))) for listNo in range(numberOfLists)]
+
+
+def writeGmtFile(termIdToGenesDict, termIdToTermNameDict, gmtPath):
+	"""
+	Writes gene sets to a GMT file.
+
+	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
+	:param dict termIdToTermNameDict: Dictionary mapping term IDs to term names.
+	:param str gmtPath: Path of the GMT file
+	"""
+
+	with open(gmtPath, 'w') as f:
+		for termId, genes in termIdToGenesDict.items():
+			f.write(termId+'\t'+termIdToTermNameDict[termId]+'\t'+'\t'.join(sorted(genes))+'\n')
+
+
+def timeSummarization(termIdsListList, termIdToGenesDict, maxRepresentativeTermSize, numberOfThreads):
+	"""
+	Times the rules on the given enrichment results.
+
+	:return: **elapsedTimes** (*dict*) – Elapsed time of each rule in seconds
+	:return: **termSummary** (*list*) – Resulting term summary
+	"""
+
+	elapsedTimes=dict()
+	termSummary=initializeTermSummary(termIdsListList)
+	ruleNames=['supertermRepresentsLessSignificantSubterm']
+	if len(termIdsListList)>1:
+		ruleNames.insert(0, 'recurringTermsUnified')
+	for ruleName in ruleNames:
+		startTime=time.perf_counter()
+		termSummary=applyRule(termSummary, termIdToGenesDict, maxRepresentativeTermSize, RULES[ruleName][0], numberOfThreads)
+		elapsedTimes[ruleName]=time.perf_counter()-startTime
+	return elapsedTimes, termSummary
+
+
+def speedupCurve(termIdsListList, termIdToGenesDict, maxRepresentativeTermSize, threadCounts, repeats):
+	"""
+	Times the rules with each thread count and checks that the results do not
+	change with the number of threads.
+
+	:return: **rows** (*list*) – Thread count, best time and speedup for each thread count
+	"""
+
+	rows=[]
+	referenceSummary=None
+	serialTime=None
+	for numberOfThreads in threadCounts:
+		bestTime=None
+		for repeat in range(repeats):
+			elapsedTimes, termSummary=timeSummarization(termIdsListList, termIdToGenesDict, maxRepresentativeTermSize, numberOfThreads)
+			totalTime=sum(elapsedTimes.values())
+			if bestTime is None or totalTime<bestTime:
+				bestTime=totalTime
+		if referenceSummary is None:
+			referenceSummary=termSummary
+			serialTime=bestTime
+		elif termSummary!=referenceSummary:
+			raise RuntimeError('Result with {} threads differs from the result with {} threads.'.format(numberOfThreads, threadCounts[0]))
+		rows.append((numberOfThreads, bestTime, serialTime/bestTime))
+	return rows
+
+
+def runStages(gmtPath, inputFiles, outputFolder, maxRepresentativeTermSize, stageCallback):
+	"""
+	Runs orsum stage by stage with the default parameters, calling
+	stageCallback before and after each stage.
+
+	:param str gmtPath: Path of the GMT file
+	:param list inputFiles: Paths of the input files
+	:param str outputFolder: Path of the output folder, ending with the path separator
+	:param int maxRepresentativeTermSize: The maximum size of a representative term
+	:param function stageCallback: Function called with the stage name and whether the stage starts
+	"""
+
+	from orsum import filterEnrichmentResult, summarize, writeResults#orsum imports the plotting libraries, which are needed only here
+
+	logFile=io.StringIO()
+	with redirect_stdout(io.StringIO()):
+		stageCallback('readInputs', True)
+		termIdsListPerFile=[readInputEnrichmentResultFile(inputFile) for inputFile in inputFiles]
+		stageCallback('readInputs', False)
+		stageCallback('readGmt', True)
+		gmtModel=readGmtModel(gmtPath)
+		stageCallback('readGmt', False)
+		stageCallback('summarize', True)
+		termIdsListList=[filterEnrichmentResult(termIdsList, gmtModel, 10, int(1E6))[0] for termIdsList in termIdsListPerFile]
+		termIdsListList=[termIdsList for termIdsList in termIdsListList if len(termIdsList)>0]
+		termSummary=summarize(termIdsListList, gmtModel, maxRepresentativeTermSize, ['supertermRepresentsLessSignificantSubterm'], logFile)
+		stageCallback('summarize', False)
+		stageCallback('writeResults', True)
+		writeResults(termSummary, gmtModel, termIdsListList, ['list{}'.format(listNo) for listNo in range(len(termIdsListList))], outputFolder, 50)
+		stageCallback('writeResults', False)
+
+
+def measureStages(gmtPath, inputFiles, outputFolder, maxRepresentativeTermSize):
+	"""
+	Measures the wall time and the increase of the peak resident set size of
+	each stage of a run. It is run in a new process for each run, so the
+	memory of the earlier runs and the warm up of the plotting libraries are
+	not hidden in the peak of the process.
+
+	:param str gmtPath: Path of the GMT file
+	:param list inputFiles: Paths of the input files
+	:param str outputFolder: Path of the output folder, ending with the path separator
+	:param int maxRepresentativeTermSize: The maximum size of a representative term
+	:return: **measurement** (*dict*) – Dictionary mapping each stage to its measured seconds and memory in bytes
+	"""
+
+	from orsum import getPeakMemoryUsage
+
+	measurement={stage:dict() for stage in STAGES}
+	startValues=dict()
+	def measureStage(stage, isStart):
+		if isStart:
+			startValues[stage]=(time.perf_counter(), getPeakMemoryUsage() or 0)
+		else:
+			measurement[stage]['seconds']=time.perf_counter()-startValues[stage][0]
+			measurement[stage]['memory']=((getPeakMemoryUsage() or 0)-startValues[stage][1])*2**20
+	runStages(gmtPath, inputFiles, outputFolder, maxRepresentativeTermSize, measureStage)
+	return measurement
+
+
+def calibrateCostModel(runSizes, maxRepresentativeTermSize, seed):
+	"""
+	Measures runs of the given sizes on generated gene sets and enrichment
+	results, each in a new process, and fits the cost model to them.
+
+	:param list runSizes: Number of terms, genes, enrichment results and terms in each enrichment result of each run
+	:param int maxRepresentativeTermSize: The maximum size of a representative term
+	:param int seed: Seed of the random number generator
+	:return: **costModel** (*dict*) – Coefficients of each model, stage and feature
+	:return: **measurements** (*list*) – Features and measurements of each stage of each run
+	"""
+
+	measurements=[]
+	with tempfile.TemporaryDirectory() as workFolder:
+		#The first run only warms up the disk cache of the libraries, it is measured again
+		for numberOfTerms, numberOfGenes, numberOfLists, listLength in runSizes[:1]+runSizes:
+			termIdToGenesDict, termIdToTermNameDict=createRandomGeneSets(numberOfTerms, numberOfGenes, seed)
+			termIdsListList=createRandomEnrichmentResults(termIdToGenesDict.keys(), numberOfLists, listLength, seed)
+			gmtPath=os.path.join(workFolder, 'benchmark.gmt')
+			writeGmtFile(termIdToGenesDict, termIdToTermNameDict, gmtPath)
+			inputFiles=[]
+			for listNo, termIdsList in enumerate(termIdsListList):
+				inputFiles.append(os.path.join(workFolder, 'list{}.txt'.format(listNo)))
+				with open(inputFiles[-1], 'w') as f:
+					f.write('\n'.join(termIdsList)+'\n')
+			outputFolder=os.path.join(workFolder, 'output')+os.sep
+			os.makedirs(outputFolder, exist_ok=True)
+
+			gmtStatistics=readGmtStatistics(gmtPath, {termId for termIdsList in termIdsListList for termId in termIdsList})
+			measurement=getStageFeatures(gmtStatistics, termIdsListList, 10, int(1E6), ['supertermRepresentsLessSignificantSubterm'])[0]
+			with multiprocessing.get_context('spawn').Pool(1) as pool:
+				stageMeasurements=pool.apply(measureStages, (gmtPath, inputFiles, outputFolder, maxRepresentativeTermSize))
+			for stage in STAGES:
+				measurement[stage].update(stageMeasurements[stage])
+			measurements.append(measurement)
+	measurements=measurements[1:]
+	return fitCostModel(measurements), measurements
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser(description = 'orsum benchmarks')
+	parser.add_argument('--terms', type = int, default = 20000, help = 'Number of terms in the generated gene sets.')
+	parser.add_argument('--genes', type = int, default = 20000, help = 'Number of genes in the generated gene sets.')
+	parser.add_argument('--lists', type = int, default = 1, help = 'Number of enrichment results.')
+	parser.add_argument('--listLength', type = int, default = 10000, help = 'Number of terms in each enrichment result.')
+	parser.add_argument('--maxRepSize', type = int, default = int(1E6), help = 'The maximum size of a representative term.')
+	parser.add_argument('--threads', type = int, nargs = '+', default = [1, 2, 4, 8, min(16, os.cpu_count() or 1)], help = 'Thread counts for the speedup curve.')
+	parser.add_argument('--repeats', type = int, default = 3, help = 'Number of repeats, the best time is reported.')
+	parser.add_argument('--seed', type = int, default = 1, help = 'Seed of the random number generator.')
+	parser.add_argument('--calibrate', default = None, help = 'Path of the JSON file to write the cost model to. Runs of up to the given number of terms, genes, lists and list length are measured stage by stage instead of the speedup curve.')
+	args = parser.parse_args()
+
+	if args.calibrate is not None:
+		#Runs with more lists have fewer genes, so the number of genes per term varies independently of the number of terms
+		runSizes=[(max(1, int(args.terms*fraction)), max(1, int(args.genes*geneFraction)), numberOfLists, max(1, int(args.listLength*fraction))) for fraction in [0.1, 0.25, 0.5, 1] for numberOfLists, geneFraction in [(1, 1), (max(2, args.lists), 0.25)]]
+		costModel, measurements=calibrateCostModel(runSizes, args.maxRepSize, args.seed)
+		writeCostModel(costModel, args.calibrate)
+		print('terms\tlists\tlistLength\tstage\ttime(s)\tpredicted time(s)\tmemory(MB)\tpredicted memory(MB)')
+		for runSize, measurement in zip(runSizes, measurements):
+			for stage in STAGES:
+				print('{}\t{}\t{}\t{}\t{:.3f}\t{:.3f}\t{:.1f}\t{:.1f}'.format(runSize[0], runSize[2], runSize[3], stage, measurement[stage]['seconds'], predictStageCost(costModel, 'seconds', stage, measurement[stage]), measurement[stage]['memory']/2**20, predictStageCost(costModel, 'memory', stage, measurement[stage])/2**20))
+		exit()
+
+	termIdToGenesDict, termIdToTermNameDict=createRandomGeneSets(args.terms, args.genes, args.seed)
+	termIdsListList=createRandomEnrichmentResults(termIdToGenesDict.keys(), args.lists, args.listLength, args.seed)
+
+	print('threads\ttime(s)\tspeedup')
+	for numberOfThreads, bestTime, speedup in speedupCurve(termIdsListList, termIdToGenesDict, args.maxRepSize, sorted(set(args.threads)), args.repeats):
+		print('{}\t{:.3f}\t{:.2f}'.format(numberOfThreads, bestTime, speedup))
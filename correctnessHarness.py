@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Ozan
+
+Differential testing of the summarization engines against the reference
+implementation of orsum 1.8.0: the pairwise applyRule with its two rules,
+and the writers of the detailed and summary TSV files, the HTML file and the
+ID mapping file, which look up the ranks in the lists. Random cases, gene
+sets and enrichment results, are created from seeds; each engine summarizes
+a case and writes the result files, and its term summary and files must be
+exactly the same as those of the reference. A mismatching case is shrunk by
+removing enrichment results, terms and genes as long as the mismatch remains,
+and written as a JSON reproducer that can be replayed with --replay.
+An alternative engine is added to ENGINES.
+"""
+
+import termCombinationLib
+from termCombinationLib import initializeTermSummary, GmtModel, readGmtModel, buildContainmentIndex, summarizeMapReduce
+from termCombinationLib import writeTermSummaryFile, writeHTMLSummaryFile, writeRepresentativeToRepresentedIDsFile
+from orsum import summarize
+from benchmark import createRandomGeneSets, writeGmtFile
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import traceback
+import numpy as np
+
+
+#Result files compared between the reference and the engines
+RESULT_FILE_NAMES=['filteredResult-Detailed.tsv', 'filteredResult-Summary.tsv', 'filteredResult.html', 'filteredResultIDMapping.tsv']
+
+DEFAULT_RULE_NAMES=['supertermRepresentsLessSignificantSubterm']
+
+#Rule lists of the random cases, the default rules being more frequent
+RULE_NAMES_CHOICES=[DEFAULT_RULE_NAMES, DEFAULT_RULE_NAMES, ['recurringTermsUnified'], ['recurringTermsUnified', 'supertermRepresentsLessSignificantSubterm'], ['supertermRepresentsLessSignificantSubterm', 'recurringTermsUnified']]
+
+
+##############################################################################
+#Reference implementation, from orsum 1.8.0
+
+
+def referenceApplyRule(termSummary, termIdToGenesDict, maxRepresentativeTermSize, process):
+	"""
+	Applies the rule ("process") on each pair of terms, as applyRule of orsum 1.8.0.
+
+	:param list termSummary: Representative term list, each element is a list that contains term ID, the list of represented terms, rank
+	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
+	:param int maxRepresentativeTermSize: The maximum size of a representative term.
+	:param function process: The reference rule to be applied.
+	:return: **termSummary** (*list*) – Representative term list after applying the rule
+	"""
+
+	for idNo in range(len(termSummary)-1):
+		termId=termSummary[idNo][0]
+		if termId!=-1:
+			for idNo2 in range(idNo+1, len(termSummary)):
+				termId2=termSummary[idNo2][0]
+				if termId2!=-1:
+					termSummary=process(termSummary, termIdToGenesDict, maxRepresentativeTermSize, idNo, idNo2, termId, termId2)
+	termSummary=[e for e in termSummary if e[0]!=-1]
+	termSummary.sort(key=lambda x: x[2])
+	return termSummary
+
+
+def referenceRecurringTermsUnified(termSummary, termIdToGenesDict, maxRepresentativeTermSize, idNo, idNo2, termId, termId2):
+	"""
+	Recurring terms coming from multiple lists are unified, as in orsum 1.8.0.
+	"""
+
+	if(termId==termId2):
+		for termRepresentedByCoveredTerm in termSummary[idNo2][1]:
+			if termRepresentedByCoveredTerm not in termSummary[idNo][1]:
+				termSummary[idNo][1].append(termRepresentedByCoveredTerm)
+		termSummary[idNo2][0]=-1
+		termSummary[idNo][2]=min(termSummary[idNo][2], termSummary[idNo2][2])
+	return termSummary
+
+
+def referenceSupertermRepresentsLessSignificantSubterm(termSummary, termIdToGenesDict, maxRepresentativeTermSize, idNo, idNo2, termId, termId2):
+	"""
+	Superterms represent their subterms that are less significant, as in orsum 1.8.0.
+	"""
+
+	geneSet1=termIdToGenesDict[termId]
+	geneSet2=termIdToGenesDict[termId2]
+	if(len(geneSet1)<=maxRepresentativeTermSize):
+		if geneSet1.issuperset(geneSet2):
+			for termRepresentedByCoveredTerm in termSummary[idNo2][1]:
+				if termRepresentedByCoveredTerm not in termSummary[idNo][1]:
+					termSummary[idNo][1].append(termRepresentedByCoveredTerm)
+			termSummary[idNo2][0]=-1
+	return termSummary
+
+
+REFERENCE_RULES={
+	'recurringTermsUnified': referenceRecurringTermsUnified,
+	'supertermRepresentsLessSignificantSubterm': referenceSupertermRepresentsLessSignificantSubterm,
+}
+
+
+def referenceWriteTermSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases, termSummaryFile, termSummaryFile2):
+	"""
+	Writes the detailed and summary TSV files, as writeTermSummaryFile of orsum 1.8.0.
+	"""
+
+	with open(termSummaryFile, 'w') as f:
+		f.write('Representing term id\tRepresenting term name\tRepresenting term rank')
+		for termIdsListNo in range(len(termIdsListList)):
+			f.write('\t'+fileAliases[termIdsListNo]+ ' term id')
+			f.write('\t'+fileAliases[termIdsListNo]+ ' term name')
+			f.write('\t'+fileAliases[termIdsListNo]+ ' term rank')
+		f.write('\n')
+		for ts in termSummary:
+			f.write(ts[0]+'\t'+termIdToTermNameDict[ts[0]]+'\t'+str(ts[2])+'\n')
+			mtr=np.empty([len(ts[1]), len(termIdsListList)*3],dtype=(np.str_, 10000))
+			row=0
+			for representedTerm in ts[1]:
+				for termIdsListNo in range(len(termIdsListList)):
+					if representedTerm in termIdsListList[termIdsListNo]:
+						mtr[row, termIdsListNo*3]=representedTerm
+						mtr[row, termIdsListNo*3+1]=termIdToTermNameDict[representedTerm]
+						mtr[row, termIdsListNo*3+2]=termIdsListList[termIdsListNo].index(representedTerm)+1
+					else:
+						mtr[row, termIdsListNo*3]=''
+						mtr[row, termIdsListNo*3+1]=''
+						mtr[row, termIdsListNo*3+2]=''
+				row=row+1
+			for r in range(row):
+				f.write('\t\t')
+				for c in range(mtr.shape[1]):
+					f.write('\t'+mtr[r,c])
+				f.write('\n')
+
+	with open(termSummaryFile2, 'w') as f:
+		f.write('Representing term id\tRepresenting term name\tRepresenting term size\tRepresenting term rank\tRepresented term number')
+		for termIdsListNo in range(len(termIdsListList)):
+			f.write('\t'+fileAliases[termIdsListNo]+ ' term rank')
+		f.write('\n')
+		for ts in termSummary:
+			f.write(ts[0]+'\t'+termIdToTermNameDict[ts[0]]+'\t'+str(len(termIdToGenesDict[ts[0]]))+'\t'+str(ts[2])+'\t'+str(len(ts[1])))
+			for termIdsListNo in range(len(termIdsListList)):
+				found=None
+				for representedTerm in ts[1]:
+					try:
+						rank=termIdsListList[termIdsListNo].index(representedTerm)
+						if found==None or rank<found:
+							found=rank
+					except ValueError:
+						pass
+				if found!=None:
+					found=found+1
+				f.write('\t'+str(found))
+			f.write('\n')
+
+
+def referenceWriteHTMLSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases, termSummaryFile):
+	"""
+	Writes the HTML file, as writeHTMLSummaryFile of orsum 1.8.0.
+	"""
+
+	with open(termSummaryFile, 'w') as f:
+		f.write('<!DOCTYPE html>\n')
+		f.write('<html>\n')
+		f.write('<head>\n')
+		f.write('<title>orsum result</title>\n')
+		f.write('</head>\n')
+		f.write('<body>\n')
+		for ts in termSummary:
+			txt='\n'
+			txt=txt+'<details>'+'\n'
+			txt=txt+'<summary>'+ts[0]+' '+termIdToTermNameDict[ts[0]]+'</summary>'+'\n'
+			for termIdsListNo in range(len(termIdsListList)):
+				txt=txt+'\t'+'<p style="margin-left:40px">'+'\n'
+				if(len(fileAliases)>1):
+					txt=txt+'\t'+fileAliases[termIdsListNo]+'<br>'+'\n'
+				for representedTerm in ts[1]:
+					if representedTerm in termIdsListList[termIdsListNo]:
+						txt=txt+'\t'+representedTerm+' '+termIdToTermNameDict[representedTerm]+' (rank: '+str(termIdsListList[termIdsListNo].index(representedTerm)+1)+', term size: '+ str(len(termIdToGenesDict[representedTerm])) +')<br>'+'\n'
+				txt=txt+'\t'+'<br>'+'\n'
+				txt=txt+'\t'+'</p>'+'\n'
+			txt=txt+'</details>'+'\n'
+			f.write(txt)
+		f.write('</body>\n')
+		f.write('</html>\n')
+
+
+def referenceWriteRepresentativeToRepresentedIDsFile(termSummary, outputFile):
+	"""
+	Writes the ID mapping file, as writeRepresentativeToRepresentedIDsFile of orsum 1.8.0.
+	"""
+
+	with open(outputFile, 'w') as f:
+		f.write('Representative\tRepresented')
+		for ts in termSummary:
+			for representedID in ts[1]:
+				f.write('\n')
+				f.write(ts[0]+'\t'+representedID)
+
+
+def runReference(case, outputFolder):
+	"""
+	Summarizes a case with the reference implementation, applying the rules
+	in the order of orsum.py, and writes the result files.
+
+	:param dict case: Case created by createRandomCase
+	:param str outputFolder: Path of the folder of the result files
+	:return: **termSummary** (*list*) – Representative term list
+	"""
+
+	termIdsListList=case['termIdsListList']
+	termSummary=initializeTermSummary(termIdsListList)
+	ruleNames=list(case['ruleNames'])
+	if len(termIdsListList)>1:
+		ruleNames.insert(0, 'recurringTermsUnified')
+	for ruleName in ruleNames:
+		termSummary=referenceApplyRule(termSummary, case['termIdToGenesDict'], case['maxRepresentativeTermSize'], REFERENCE_RULES[ruleName])
+	paths=[os.path.join(outputFolder, fileName) for fileName in RESULT_FILE_NAMES]
+	referenceWriteTermSummaryFile(termSummary, case['termIdToGenesDict'], case['termIdToTermNameDict'], termIdsListList, case['fileAliases'], paths[0], paths[1])
+	referenceWriteHTMLSummaryFile(termSummary, case['termIdToGenesDict'], case['termIdToTermNameDict'], termIdsListList, case['fileAliases'], paths[2])
+	referenceWriteRepresentativeToRepresentedIDsFile(termSummary, paths[3])
+	return termSummary
+
+
+##############################################################################
+#Engines
+
+
+def writeEngineResults(termSummary, gmtModel, case, outputFolder):
+	"""
+	Writes the result files of an engine with the writers of termCombinationLib.
+	"""
+
+	paths=[os.path.join(outputFolder, fileName) for fileName in RESULT_FILE_NAMES]
+	writeTermSummaryFile(termSummary, gmtModel, case['termIdsListList'], case['fileAliases'], paths[0], paths[1])
+	writeHTMLSummaryFile(termSummary, gmtModel, case['termIdsListList'], case['fileAliases'], paths[2])
+	writeRepresentativeToRepresentedIDsFile(termSummary, paths[3])
+
+
+def runSummarize(case, outputFolder, gmtModel=None, **options):
+	"""
+	Summarizes a case with summarize of orsum.py and the given options, and
+	writes the result files.
+
+	:param dict case: Case created by createRandomCase
+	:param str outputFolder: Path of the folder of the result files
+	:param GmtModel gmtModel: GMT model of the case, created from its gene sets if None
+	:return: **termSummary** (*list*) – Representative term list
+	"""
+
+	if gmtModel is None:
+		gmtModel=GmtModel(case['termIdToGenesDict'], case['termIdToTermNameDict'])
+	#Term lists are copied, so an engine cannot change the case
+	termIdsListList=[list(termIdsList) for termIdsList in case['termIdsListList']]
+	with redirect_stdout(io.StringIO()):
+		termSummary=summarize(termIdsListList, gmtModel, case['maxRepresentativeTermSize'], case['ruleNames'], io.StringIO(), **options)
+	writeEngineResults(termSummary, gmtModel, case, outputFolder)
+	return termSummary
+
+
+def runThreadChunks(case, outputFolder):
+	"""
+	Summarizes a case with the candidates of each representative term split
+	among three threads. The cases are much smaller than
+	MIN_CANDIDATES_PER_THREAD, so it is lowered to one candidate while the
+	case is summarized.
+	"""
+
+	minCandidatesPerThread=termCombinationLib.MIN_CANDIDATES_PER_THREAD
+	termCombinationLib.MIN_CANDIDATES_PER_THREAD=1
+	try:
+		return runSummarize(case, outputFolder, numberOfThreads=3)
+	finally:
+		termCombinationLib.MIN_CANDIDATES_PER_THREAD=minCandidatesPerThread
+
+
+def runGmtFile(case, outputFolder):
+	"""
+	Summarizes a case with a GMT model read from a GMT file, keeping only the
+	terms of the enrichment results, as with --memoryBudget.
+	"""
+
+	gmtPath=os.path.join(outputFolder, 'case.gmt')
+	writeGmtFile(case['termIdToGenesDict'], case['termIdToTermNameDict'], gmtPath)
+	gmtModel=readGmtModel(gmtPath, {termId for termIdsList in case['termIdsListList'] for termId in termIdsList})
+	os.remove(gmtPath)
+	return runSummarize(case, outputFolder, gmtModel)
+
+
+def runContainmentIndex(case, outputFolder):
+	"""
+	Summarizes a case with a containment index of all the terms of the case.
+	"""
+
+	gmtModel=GmtModel(case['termIdToGenesDict'], case['termIdToTermNameDict'])
+	return runSummarize(case, outputFolder, gmtModel, containmentIndex=buildContainmentIndex(gmtModel, list(case['termIdToGenesDict'])))
+
+
+def runMapReduce(case, outputFolder):
+	"""
+	Summarizes a case with summarizeMapReduce.
+	"""
+
+	gmtModel=GmtModel(case['termIdToGenesDict'], case['termIdToTermNameDict'])
+	termSummary=summarizeMapReduce([list(termIdsList) for termIdsList in case['termIdsListList']], gmtModel, case['maxRepresentativeTermSize'], 2)
+	writeEngineResults(termSummary, gmtModel, case, outputFolder)
+	return termSummary
+
+
+#Engines: name -> (function summarizing a case and writing the result files,
+#rule lists supported, None for all)
+ENGINES={
+	'applyRule': (lambda case, outputFolder: runSummarize(case, outputFolder), None),
+	'threads': (lambda case, outputFolder: runSummarize(case, outputFolder, numberOfThreads=3), None),
+	'threadChunks': (runThreadChunks, None),
+	'noBitsets': (lambda case, outputFolder: runSummarize(case, outputFolder, maxBitsetMemory=0), None),
+	'generateRepresentatives': (lambda case, outputFolder: runSummarize(case, outputFolder, topK=sum(len(termIdsList) for termIdsList in case['termIdsListList'])), None),
+	'gmtFile': (runGmtFile, None),
+	'containmentIndex': (runContainmentIndex, None),
+	'mapReduce': (runMapReduce, [DEFAULT_RULE_NAMES]),
+}
+
+
+##############################################################################
+#Cases, comparison and shrinking
+
+
+def createRandomCase(seed):
+	"""
+	Creates a random case from a seed: hierarchical gene sets with some
+	identical gene sets, one to three enrichment results of random lengths,
+	a maximum representative term size and a list of rules. Most cases have at
+	most 30 genes, the others have enough genes for multi-word gene bitsets.
+
+	:param int seed: Seed of the random number generator
+	:return: **case** (*dict*) – Gene sets, term names, term ID lists of the enrichment results, file aliases, maximum representative term size and rule names
+	"""
+
+	rng=random.Random(seed)
+	#Most cases have few genes, so that mismatches are shrunk quickly, the
+	#others have gene bitsets of several 64-bit words
+	numberOfGenes=rng.randint(1, 30) if rng.random()<0.8 else rng.randint(650, 2000)
+	termIdToGenesDict, termIdToTermNameDict=createRandomGeneSets(rng.randint(1, 40), numberOfGenes, seed)
+	termIds=list(termIdToGenesDict)
+	for duplicateNo in range(rng.randint(0, 3)):
+		termId=rng.choice(termIds)
+		termIdToGenesDict['DUP:{}'.format(duplicateNo)]=set(termIdToGenesDict[termId])
+		termIdToTermNameDict['DUP:{}'.format(duplicateNo)]='Copy of {}'.format(termId)
+	termIds=list(termIdToGenesDict)
+	numberOfLists=rng.randint(1, 3)
+	return {
+		'termIdToGenesDict':termIdToGenesDict,
+		'termIdToTermNameDict':termIdToTermNameDict,
+		'termIdsListList':[rng.sample(termIds, rng.randint(1, len(termIds))) for listNo in range(numberOfLists)],
+		'fileAliases':['list{}'.format(listNo) for listNo in range(numberOfLists)],
+		'maxRepresentativeTermSize':rng.choice([int(1E6), rng.randint(1, numberOfGenes)]),
+		'ruleNames':list(rng.choice(RULE_NAMES_CHOICES)),
+	}
+
+
+def isEngineApplicable(engineName, case):
+	"""
+	:return: **applicable** (*bool*) – Whether the engine supports the rules of the case
+	"""
+
+	supportedRuleNames=ENGINES[engineName][1]
+	return supportedRuleNames is None or case['ruleNames'] in supportedRuleNames
+
+
+def findMismatch(case, engineName):
+	"""
+	Runs the reference and an engine on a case and compares their term
+	summaries and result files.
+
+	:param dict case: Case created by createRandomCase
+	:param str engineName: Name of the engine in ENGINES
+	:return: **mismatch** (*str*) – Description of the first difference, None if the results are the same
+	"""
+
+	with tempfile.TemporaryDirectory() as temporaryFolder:
+		referenceFolder=os.path.join(temporaryFolder, 'reference')
+		engineFolder=os.path.join(temporaryFolder, 'engine')
+		os.makedirs(referenceFolder)
+		os.makedirs(engineFolder)
+		referenceTermSummary=runReference(case, referenceFolder)
+		try:
+			engineTermSummary=ENGINES[engineName][0](case, engineFolder)
+		except Exception:
+			return 'Engine {} failed:\n{}'.format(engineName, traceback.format_exc())
+		if engineTermSummary!=referenceTermSummary:
+			return 'Term summaries differ:\nreference: {}\n{}: {}'.format(referenceTermSummary, engineName, engineTermSummary)
+		for fileName in RESULT_FILE_NAMES:
+			with open(os.path.join(referenceFolder, fileName), 'r') as f:
+				referenceLines=f.read().split('\n')
+			with open(os.path.join(engineFolder, fileName), 'r') as f:
+				engineLines=f.read().split('\n')
+			for lineNo in range(max(len(referenceLines), len(engineLines))):
+				referenceLine=referenceLines[lineNo] if lineNo<len(referenceLines) else None
+				engineLine=engineLines[lineNo] if lineNo<len(engineLines) else None
+				if referenceLine!=engineLine:
+					return '{} differs at line {}:\nreference: {!r}\n{}: {!r}'.format(fileName, lineNo+1, referenceLine, engineName, engineLine)
+	return None
+
+
+def getSmallerCases(case):
+	"""
+	Yields the cases obtained from a case by a single reduction, from the
+	largest reductions to the smallest: removing an enrichment result, the
+	gene sets not in any enrichment result, a term from an enrichment result,
+	a gene from a gene set, or a rule.
+
+	:param dict case: Case
+	:return: **smallerCase** (*dict*) – Generator of smaller cases
+	"""
+
+	def copyCase(**changes):
+		smallerCase=dict(case)
+		smallerCase.update(changes)
+		return smallerCase
+
+	termIdsListList=case['termIdsListList']
+	for listNo in range(len(termIdsListList)):
+		if len(termIdsListList)>1:
+			yield copyCase(termIdsListList=termIdsListList[:listNo]+termIdsListList[listNo+1:], fileAliases=case['fileAliases'][:listNo]+case['fileAliases'][listNo+1:])
+	inputTermIds={termId for termIdsList in termIdsListList for termId in termIdsList}
+	if len(inputTermIds)<len(case['termIdToGenesDict']):
+		yield copyCase(termIdToGenesDict={termId: genes for termId, genes in case['termIdToGenesDict'].items() if termId in inputTermIds}, termIdToTermNameDict={termId: termName for termId, termName in case['termIdToTermNameDict'].items() if termId in inputTermIds})
+	for listNo in range(len(termIdsListList)):
+		for termNo in range(len(termIdsListList[listNo])):
+			if len(termIdsListList[listNo])>1:
+				termIdsList=termIdsListList[listNo][:termNo]+termIdsListList[listNo][termNo+1:]
+				yield copyCase(termIdsListList=termIdsListList[:listNo]+[termIdsList]+termIdsListList[listNo+1:])
+	for termId, genes in case['termIdToGenesDict'].items():
+		for gene in sorted(genes):
+			termIdToGenesDict=dict(case['termIdToGenesDict'])
+			termIdToGenesDict[termId]=genes-{gene}
+			yield copyCase(termIdToGenesDict=termIdToGenesDict)
+	if len(case['ruleNames'])>1:
+		for ruleNo in range(len(case['ruleNames'])):
+			yield copyCase(ruleNames=case['ruleNames'][:ruleNo]+case['ruleNames'][ruleNo+1:])
+
+
+def shrinkCase(case, isFailing):
+	"""
+	Shrinks a failing case: the first smaller case that still fails replaces
+	the case, until no smaller case fails.
+
+	:param dict case: Failing case
+	:param function isFailing: Function returning whether a case fails
+	:return: **case** (*dict*) – Minimal failing case
+	"""
+
+	shrunk=True
+	while shrunk:
+		shrunk=False
+		for smallerCase in getSmallerCases(case):
+			if isFailing(smallerCase):
+				case=smallerCase
+				shrunk=True
+				break
+	return case
+
+
+def writeCase(case, path):
+	"""
+	Writes a case as a JSON reproducer, with the genes as sorted lists.
+
+	:param dict case: Case
+	:param str path: Path of the JSON file
+	"""
+
+	content=dict(case)
+	content['termIdToGenesDict']={termId: sorted(genes) for termId, genes in case['termIdToGenesDict'].items()}
+	with open(path, 'w') as f:
+		json.dump(content, f, indent=1)
+
+
+def readCase(path):
+	"""
+	Reads a case written by writeCase.
+
+	:param str path: Path of the JSON file
+	:return: **case** (*dict*) – Case
+	"""
+
+	with open(path, 'r') as f:
+		case=json.load(f)
+	case['termIdToGenesDict']={termId: set(genes) for termId, genes in case['termIdToGenesDict'].items()}
+	return case
+
+
+def runHarness(seeds, engineNames=None, shrink=True):
+	"""
+	Compares the engines with the reference on the random cases of the seeds
+	and stops at the first mismatch, which is shrunk to a minimal case.
+
+	:param list seeds: Seeds of the random cases
+	:param list engineNames: Names of the engines to be compared, None for all the engines
+	:param bool shrink: Whether the mismatching case is shrunk
+	:return: **failure** (*dict*) – Seed, engine name, case and mismatch of the first failure, None if there is no mismatch
+	"""
+
+	if engineNames is None:
+		engineNames=list(ENGINES)
+	for seed in seeds:
+		case=createRandomCase(seed)
+		for engineName in engineNames:
+			if not isEngineApplicable(engineName, case):
+				continue
+			if findMismatch(case, engineName) is not None:
+				if shrink:
+					case=shrinkCase(case, lambda smallerCase: isEngineApplicable(engineName, smallerCase) and findMismatch(smallerCase, engineName) is not None)
+				return {'seed':seed, 'engine':engineName, 'case':case, 'mismatch':findMismatch(case, engineName)}
+	return None
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser(description = 'Compares the summarization engines with the reference implementation on random cases')
+	parser.add_argument('--seeds', type = int, default = 200, help = 'Number of random cases. By default, seeds = 200')
+	parser.add_argument('--firstSeed', type = int, default = 0, help = 'Seed of the first case. By default, firstSeed = 0')
+	parser.add_argument('--engines', nargs = '+', default = None, choices = list(ENGINES), help = 'Engines to be compared. By default, all the engines.')
+	parser.add_argument('--noShrink', action = 'store_true', help = 'Do not shrink the mismatching case.')
+	parser.add_argument('--reproducer', default = 'reproducer.json', help = 'Path of the JSON file of the mismatching case. By default, reproducer = reproducer.json')
+	parser.add_argument('--replay', default = None, help = 'Path of a JSON reproducer to be run with the engines instead of the random cases.')
+	args = parser.parse_args()
+
+	if args.replay is not None:
+		case = readCase(args.replay)
+		mismatches = {engineName: findMismatch(case, engineName) for engineName in (args.engines or list(ENGINES)) if isEngineApplicable(engineName, case)}
+		for engineName, mismatch in mismatches.items():
+			print('{}: {}'.format(engineName, 'same as the reference' if mismatch is None else mismatch))
+		sys.exit(1 if any(mismatch is not None for mismatch in mismatches.values()) else 0)
+
+	failure = runHarness(range(args.firstSeed, args.firstSeed+args.seeds), args.engines, not args.noShrink)
+	if failure is None:
+		print('All engines are the same as the reference on {} cases.'.format(args.seeds))
+		sys.exit(0)
+	writeCase(failure['case'], args.reproducer)
+	print('Engine {} differs from the reference on the case of seed {}, written to {}.'.format(failure['engine'], failure['seed'], args.reproducer))
+	print(failure['mismatch'])
+	sys.exit(1)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Ozan
+
+Estimates of the run time and memory usage of orsum, used to size cluster
+jobs before they are started. Runs are split into four stages: reading the
+input files, reading the GMT file, the summarization and writing the results.
+The cost of each stage is a linear function of a few features of the run,
+like the number of genes in the GMT file or the number of term pairs the rules
+may compare. The features are computed from a scan of the GMT file and the
+term IDs of the input files, without building the gene sets. The coefficients
+are calibrated by benchmark.py; the default coefficients were calibrated on a
+single core of a recent x86-64 machine.
+Time coefficients are in seconds, memory coefficients in bytes. The memory of
+a stage is the increase of the peak resident set size of the process during
+the stage, so the peak memory of a run is the memory used before the run plus
+the memory of all the stages.
+"""
+
+from scipy.optimize import nnls
+import json
+import numpy as np
+
+
+STAGES=['readInputs', 'readGmt', 'summarize', 'writeResults']
+
+#Features used by the time and memory models of each stage
+COST_MODEL_FEATURES={
+	'seconds': {
+		'readInputs': ['inputTerms'],
+		'readGmt': ['gmtTerms', 'gmtGeneEntries'],
+		'summarize': ['terms', 'unifyPairs', 'rulePairs', 'rulePairWords'],
+		'writeResults': ['constant', 'terms', 'rankCells'],
+	},
+	'memory': {
+		'readInputs': ['inputTerms'],
+		'readGmt': ['loadedGmtTerms', 'loadedGmtGeneEntries'],
+		'summarize': ['terms', 'bitsetBytes'],
+		'writeResults': ['constant', 'terms', 'rankCells'],
+	},
+}
+
+DEFAULT_COST_MODEL={
+	'seconds': {
+		'readInputs': {'inputTerms': 7.72e-07},
+		'readGmt': {'gmtTerms': 0.0, 'gmtGeneEntries': 1.11e-06},
+		'summarize': {'terms': 2.57e-05, 'unifyPairs': 0.0, 'rulePairs': 3.48e-08, 'rulePairWords': 2.69e-09},
+		'writeResults': {'constant': 4.69, 'terms': 0.0, 'rankCells': 0.000232},
+	},
+	'memory': {
+		'readInputs': {'inputTerms': 328.0},
+		'readGmt': {'loadedGmtTerms': 0.0, 'loadedGmtGeneEntries': 177.0},
+		'summarize': {'terms': 12400.0, 'bitsetBytes': 0.0},
+		'writeResults': {'constant': 117000000.0, 'terms': 0.0, 'rankCells': 0.0},
+	},
+}
+
+
+def readGmtStatistics(gmtPath, termIdsToKeep):
+	"""
+	Scans a GMT file for its number of terms and gene entries. Gene sets are
+	only split for the terms in termIdsToKeep, to get their sizes and the
+	number of their distinct genes.
+
+	:param str gmtPath: Path of the GMT file
+	:param set termIdsToKeep: IDs of the terms whose sizes are needed, e.g. the terms of the input files
+	:return: **gmtStatistics** (*dict*) – Number of terms and gene entries in the GMT file, number of gene entries and distinct genes of the kept terms and the size of each kept term
+	"""
+
+	gmtStatistics={'gmtTerms':0, 'gmtGeneEntries':0, 'keptGeneEntries':0, 'keptGenes':0, 'termSizes':dict()}
+	keptGenes=set()
+	with open(gmtPath, 'r') as f:
+		for line in f:
+			line=line.strip()
+			gmtStatistics['gmtTerms']+=1
+			gmtStatistics['gmtGeneEntries']+=max(0, line.count('\t')-1)
+			termId=line.split('\t', 1)[0]
+			if termId in termIdsToKeep:
+				genes=set(line.split('\t')[2:])
+				gmtStatistics['termSizes'][termId]=len(genes)
+				gmtStatistics['keptGeneEntries']+=len(genes)
+				keptGenes.update(genes)
+	gmtStatistics['keptGenes']=len(keptGenes)
+	return gmtStatistics
+
+
+def combineGmtStatistics(gmtStatisticsList):
+	"""
+	Combines the statistics of multiple GMT files, as if they were a single GMT
+	file. The distinct genes of the files are added up, which is an upper bound.
+
+	:param list gmtStatisticsList: Statistics returned by readGmtStatistics
+	:return: **gmtStatistics** (*dict*) – Statistics of all the GMT files
+	"""
+
+	gmtStatistics={'gmtTerms':0, 'gmtGeneEntries':0, 'keptGeneEntries':0, 'keptGenes':0, 'termSizes':dict()}
+	for statistics in gmtStatisticsList:
+		for key in ['gmtTerms', 'gmtGeneEntries', 'keptGeneEntries', 'keptGenes']:
+			gmtStatistics[key]+=statistics[key]
+		gmtStatistics['termSizes'].update(statistics['termSizes'])
+	return gmtStatistics
+
+
+def getStageFeatures(gmtStatistics, termIdsListPerFile, minTermSize, maxTermSize, ruleNames, loadWholeGmt=True, maxBitsetMemory=None):
+	"""
+	Computes the features of each stage of a run. The enrichment results are
+	filtered with the term sizes in gmtStatistics like filterEnrichmentResult
+	does. Pair counts are upper bounds: each rule may compare every term with
+	every term ranked below it, but represented terms are not compared again.
+
+	:param dict gmtStatistics: Statistics returned by readGmtStatistics, with the terms of the input files kept
+	:param list termIdsListPerFile: Term IDs of the enrichment result of each input file
+	:param int minTermSize: The minimum size of the terms to be processed
+	:param int maxTermSize: The maximum size of the terms to be processed
+	:param list ruleNames: Names of the rules applied after the unification of recurring terms
+	:param bool loadWholeGmt: Whether the whole GMT file is loaded, False if only the terms of the input files are loaded
+	:param int maxBitsetMemory: The maximum memory in bytes for the gene bitsets of the rules, None for no limit
+	:return: **stageFeatures** (*dict*) – Dictionary mapping each stage to its features
+	:return: **pairComparisons** (*dict*) – Dictionary mapping each rule to the maximum number of term pairs it compares
+	"""
+
+	termSizes=gmtStatistics['termSizes']
+	termIdsListList=[]
+	for termIdsList in termIdsListPerFile:
+		termIdsList=[termId for termId in dict.fromkeys(termIdsList) if termId in termSizes and minTermSize<=termSizes[termId]<=maxTermSize]
+		if len(termIdsList)>0:
+			termIdsListList.append(termIdsList)
+	numberOfTerms=sum(len(termIdsList) for termIdsList in termIdsListList)
+	numberOfUniqueTerms=len({termId for termIdsList in termIdsListList for termId in termIdsList})
+
+	pairComparisons=dict()
+	if len(termIdsListList)>1:
+		pairComparisons['recurringTermsUnified']=numberOfTerms*(numberOfTerms-1)//2
+	for ruleName in ruleNames:
+		pairComparisons[ruleName]=pairComparisons.get(ruleName, 0)+numberOfUniqueTerms*(numberOfUniqueTerms-1)//2
+	bitsetWords=(gmtStatistics['keptGenes']+63)//64
+	bitsetBytes=numberOfUniqueTerms*bitsetWords*8 if 'supertermRepresentsLessSignificantSubterm' in ruleNames else 0
+	if maxBitsetMemory is not None and bitsetBytes>maxBitsetMemory:
+		bitsetBytes=0#Gene sets are compared without bitsets
+
+	if loadWholeGmt:
+		loadedGmt=(gmtStatistics['gmtTerms'], gmtStatistics['gmtGeneEntries'])
+	else:
+		loadedGmt=(len(termSizes), gmtStatistics['keptGeneEntries'])
+
+	stageFeatures={
+		'readInputs': {'inputTerms':sum(len(termIdsList) for termIdsList in termIdsListPerFile)},
+		'readGmt': {'gmtTerms':gmtStatistics['gmtTerms'], 'gmtGeneEntries':gmtStatistics['gmtGeneEntries'], 'loadedGmtTerms':loadedGmt[0], 'loadedGmtGeneEntries':loadedGmt[1]},
+		'summarize': {
+			'terms':numberOfTerms,
+			'unifyPairs':pairComparisons.get('recurringTermsUnified', 0),
+			'rulePairs':sum(pairComparisons[ruleName] for ruleName in ruleNames),
+			'rulePairWords':pairComparisons.get('supertermRepresentsLessSignificantSubterm', 0)*bitsetWords,
+			'bitsetBytes':bitsetBytes,
+		},
+		'writeResults': {'constant':1, 'terms':numberOfTerms, 'rankCells':numberOfUniqueTerms*len(termIdsListList)},
+	}
+	return stageFeatures, pairComparisons
+
+
+def readCostModel(costModelPath=None):
+	"""
+	Reads the coefficients of a cost model written by benchmark.py. Coefficients
+	missing from the file are taken from DEFAULT_COST_MODEL.
+
+	:param str costModelPath: Path of the JSON file of the cost model, None for the default cost model
+	:return: **costModel** (*dict*) – Coefficients of each model, stage and feature
+	"""
+
+	costModel={model:{stage:dict(coefficients) for stage, coefficients in stages.items()} for model, stages in DEFAULT_COST_MODEL.items()}
+	if costModelPath is not None:
+		with open(costModelPath, 'r') as f:
+			for model, stages in json.load(f).items():
+				for stage, coefficients in stages.items():
+					costModel[model][stage].update(coefficients)
+	return costModel
+
+
+def writeCostModel(costModel, costModelPath):
+	"""
+	Writes the coefficients of a cost model as JSON.
+
+	:param dict costModel: Coefficients of each model, stage and feature
+	:param str costModelPath: Path of the JSON file
+	"""
+
+	with open(costModelPath, 'w') as f:
+		json.dump(costModel, f, indent=1, sort_keys=True)
+
+
+def fitCostModel(measurements):
+	"""
+	Fits the coefficients of each model and stage to the measurements of
+	benchmark runs with non-negative least squares. The errors are relative to
+	the measured values, so small and large runs weigh the same. The
+	coefficients are then scaled up so that none of the measurements is
+	underestimated.
+
+	:param list measurements: For each run, a dictionary mapping each stage to its features and its measured seconds and memory
+	:return: **costModel** (*dict*) – Coefficients of each model, stage and feature
+	"""
+
+	costModel=dict()
+	for model, stages in COST_MODEL_FEATURES.items():
+		costModel[model]=dict()
+		for stage, features in stages.items():
+			featureMatrix=np.array([[measurement[stage][feature] for feature in features] for measurement in measurements], dtype=float)
+			values=np.array([max(measurement[stage][model], 0) for measurement in measurements], dtype=float)
+			weights=1/np.maximum(values, values.max()*1E-3+1E-12)
+			coefficients=nnls(featureMatrix*weights[:, None], values*weights)[0]
+			#Estimates are used as limits, so they are scaled up until no measurement is underestimated
+			predictedValues=featureMatrix.dot(coefficients)
+			isPredicted=predictedValues>0
+			if np.any(isPredicted):
+				coefficients=coefficients*max(1, np.max(values[isPredicted]/predictedValues[isPredicted]))
+			costModel[model][stage]={feature:float(coefficient) for feature, coefficient in zip(features, coefficients)}
+	return costModel
+
+
+def predictStageCost(costModel, model, stage, features):
+	"""
+	:param dict costModel: Coefficients of each model, stage and feature
+	:param str model: seconds or memory
+	:param str stage: Stage of the run
+	:param dict features: Features of the stage
+	:return: **cost** (*float*) – Predicted cost of the stage
+	"""
+	return sum(coefficient*features.get(feature, 0) for feature, coefficient in costModel[model][stage].items())
+
+
+def estimateRun(stageFeatures, pairComparisons, costModel, baselineMemory=0):
+	"""
+	Predicts the wall time of each stage and the peak memory of the process at
+	the end of each stage, and the totals of the run.
+
+	:param dict stageFeatures: Features of each stage returned by getStageFeatures
+	:param dict pairComparisons: Maximum number of pair comparisons of each rule returned by getStageFeatures
+	:param dict costModel: Coefficients of each model, stage and feature
+	:param float baselineMemory: Memory in MB used by the process before the run
+	:return: **estimate** (*dict*) – Seconds and peak memory in MB of each stage and of the run, with the pair comparisons and the features
+	"""
+
+	estimate={'stages':dict(), 'pairComparisons':pairComparisons}
+	peakMemory=baselineMemory*2**20
+	totalSeconds=0.0
+	for stage in STAGES:
+		seconds=predictStageCost(costModel, 'seconds', stage, stageFeatures[stage])
+		peakMemory=peakMemory+predictStageCost(costModel, 'memory', stage, stageFeatures[stage])
+		estimate['stages'][stage]={'seconds':round(seconds, 3), 'peakMemoryMB':round(peakMemory/2**20, 1), 'features':stageFeatures[stage]}
+		totalSeconds=totalSeconds+seconds
+	estimate['seconds']=round(totalSeconds, 3)
+	estimate['peakMemoryMB']=round(peakMemory/2**20, 1)
+	return estimate
@@ -11,17 +11,33 @@ enrichment analysis and lets the significant subterms represent their
 less significant subterms.
 """
 
-from termCombinationLib import readGmtFile, readInputEnrichmentResultFile
+from termCombinationLib import readGmtModel, readInputEnrichmentResultFile, readEnrichmentTable, buildContainmentIndex, combineGmtModels, getNamespacedTermId
+from termCombinationLib import readContainmentIndex, writeContainmentIndex, updateContainmentIndex
 from termCombinationLib import removeUnknownTerms, removeTermsSmallerThanMinTermSize, removeTermsLargerThanMaxTermSize
-from termCombinationLib import initializeTermSummary, recurringTermsUnified, supertermRepresentsLessSignificantSubterm, applyRule
+from termCombinationLib import initializeTermSummary, applyRule, generateRepresentatives, summarizeMapReduce, bootstrapRepresentatives, RULES
 from termCombinationLib import writeTermSummaryFile, writeHTMLSummaryFile, writeRepresentativeToRepresentedIDsFile, writeTermSummaryFileClustered
 from plotFunctions import orsum_plot
+from costModel import readGmtStatistics, combineGmtStatistics, getStageFeatures, readCostModel, estimateRun
+from resultCache import hashFile, createCacheKey, getCachedResult, copyCachedResult, storeResult, getCachedFilteredList, storeFilteredList, evictLeastRecentlyUsed
 from argparse import ArgumentParser, SUPPRESS
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, product
+import io
+import json
 import os
+import random
+import sys
+try:
+	import resource
+except ImportError:#Not available on Windows
+	resource=None
 
 
 VERSION='1.8.0'
 
+#Parameters that can take multiple values with --sweep
+SWEEP_PARAMETERS=['minTermSize', 'maxTermSize', 'maxRepSize']
+
 
 def argumentParserFunction():
 	"""
@@ -35,34 +51,444 @@ def argumentParserFunction():
 	# Add version
 	optional.add_argument('-v', '--version', action = 'version', version=VERSION)
 	# required arguments
-	required.add_argument('--gmt', required = True, help = 'Path of the GMT file.')
+	required.add_argument('--gmt', required = True, nargs = '+', help = 'Path of the GMT file. With multiple GMT files, each input file is summarized against each GMT file separately, or against all of them together with --acrossNamespaces.')
 	required.add_argument('--files', required = True, nargs = '+', help = 'Paths of the enrichment result files.')
 	# optional arguments
 	optional.add_argument('--fileAliases', nargs = '+', default=None, help = 'Aliases for input enrichment result files to be used in orsum results')
+	optional.add_argument('--idColumn', default = None, help = 'Name of the term ID column, for input files that are enrichment result tables with a header, e.g. from g:Profiler, GSEA or clusterProfiler. By default, input files contain one term ID per line, sorted, without a header.')
+	optional.add_argument('--scoreColumn', default = None, help = 'Name of the column used to sort the terms of enrichment result tables, e.g. p-value. By default, the order of the file is used.')
+	optional.add_argument('--sortOrder', default = 'ascending', choices = ['ascending', 'descending'], help = 'Sort order of scoreColumn, ascending when the most significant term has the smallest score. By default, sortOrder = ascending')
+	optional.add_argument('--delimiter', default = '\t', help = 'Column delimiter of enrichment result tables. By default, tab.')
+	optional.add_argument('--pValueColumn', default = None, help = 'Name of the p-value column of enrichment result tables, used with maxPValue.')
+	optional.add_argument('--maxPValue', type = float, default = None, help = 'Terms of enrichment result tables with a larger p-value are removed while reading.')
+	optional.add_argument('--fdrColumn', default = None, help = 'Name of the FDR (adjusted p-value) column of enrichment result tables, used with maxFdr.')
+	optional.add_argument('--maxFdr', type = float, default = None, help = 'Terms of enrichment result tables with a larger FDR are removed while reading.')
+	optional.add_argument('--gmtAliases', nargs = '+', default=None, help = 'Namespaces of the GMT files, used as the names of the output subfolders and as the prefixes of the term IDs with --acrossNamespaces. By default, GMT file names without extension are used.')
+	optional.add_argument('--acrossNamespaces', action = 'store_true', help = 'With multiple GMT files, summarize the terms of all the GMT files together, so a term can represent terms of other GMT files. Term IDs are prefixed with the namespaces of their GMT files; a term in several GMT files is taken from the first one.')
 	optional.add_argument('--outputFolder', default = ".", help = 'Path for the output result files. If it is not specified, results are written to the current directory.')
-	optional.add_argument('--maxRepSize', type = int, default = int(1E6), help = 'The maximum size of a representative term. Terms larger than this will not be discarded but also will not be used to represent other terms. By default, it is larger than any annotation term (1E6), which means that it has no effect.')
-	optional.add_argument('--maxTermSize', type = int, default = int(1E6), help = 'The maximum size of the terms to be processed. Larger terms will be discarded. By default, it is larger than any annotation term (1E6), which means that it has no effect.')
-	optional.add_argument('--minTermSize', type = int, default = 10, help = 'The minimum size of the terms to be processed. Smaller terms will be discarded. By default, minTermSize = 10')
+	optional.add_argument('--maxRepSize', type = int, nargs = '+', default = [int(1E6)], help = 'The maximum size of a representative term. Terms larger than this will not be discarded but also will not be used to represent other terms. By default, it is larger than any annotation term (1E6), which means that it has no effect.')
+	optional.add_argument('--maxTermSize', type = int, nargs = '+', default = [int(1E6)], help = 'The maximum size of the terms to be processed. Larger terms will be discarded. By default, it is larger than any annotation term (1E6), which means that it has no effect.')
+	optional.add_argument('--minTermSize', type = int, nargs = '+', default = [10], help = 'The minimum size of the terms to be processed. Smaller terms will be discarded. By default, minTermSize = 10')
 	optional.add_argument('--numberOfTermsToPlot', type = int, default = 50, help = 'The number of representative terms to be presented in barplot and heatmap. By default (and maximum), numberOfTermsToPlot = 50')
+	optional.add_argument('--heatmapAllTerms', action = 'store_true', help = 'Also create HeatmapAll.png, the heatmap of all the representative terms, drawn as a raster image. Above 2000 terms, consecutive terms are aggregated into a row showing their best quartile.')
+	optional.add_argument('--heatmapTileRows', type = int, default = None, help = 'With heatmapAllTerms, also create the heatmap of all the representative terms as tiles of this many terms, without aggregation (HeatmapAll-1.png, HeatmapAll-2.png, ...).')
+	optional.add_argument('--rules', nargs = '+', default = ['supertermRepresentsLessSignificantSubterm'], choices = list(RULES.keys()), help = 'Rules to be applied, in the given order, after the recurring terms in multiple lists are unified. By default, rules = supertermRepresentsLessSignificantSubterm')
+	optional.add_argument('--sweep', action = 'store_true', help = 'Run orsum for each combination of the values given to minTermSize, maxTermSize and maxRepSize. The GMT file and input files are read once, results of each combination are written to a subfolder and the number of representative terms of each combination to sweepSummary.tsv.')
+	optional.add_argument('--topK', type = int, default = None, help = 'The number of top representative terms to be reported. The summarization stops after the top K representative terms are found, the results contain only these terms. By default, all representative terms are reported.')
+	optional.add_argument('--memoryBudget', type = int, default = None, help = 'Memory budget in MB, used to reduce the memory of the run, not a hard limit. Only the terms in the input files are loaded from the GMT file and gene sets are compared with bitsets only if the bitsets fit in the budget left after reading the files. Peak memory usage is reported in the log file, with a warning if it exceeds the budget. By default, there is no budget.')
+	optional.add_argument('--cacheFolder', default = None, help = 'Path of the result cache. Results of earlier runs with the same GMT file, input files and parameters are copied from the cache instead of being computed again. Filtered terms of each input file are cached as well. Not supported with --sweep or multiple GMT files. By default, the cache is not used.')
+	optional.add_argument('--cacheMaxSize', type = int, default = 1024, help = 'The maximum size of the result cache in MB. Least recently used results are removed beyond this size. By default, cacheMaxSize = 1024')
+	optional.add_argument('--threads', type = int, default = 1, help = 'Number of threads used to apply the rules. The next representative terms are evaluated in parallel, and the candidates of terms with thousands of candidates are split among the threads. The results do not depend on the number of threads. By default, threads = 1')
+	optional.add_argument('--mapReduce', action = 'store_true', help = 'Summarize each input file separately in parallel, then merge the results. The results are the same as without this option, but recurring terms are unified without comparing all the terms of all the files. Only the default rules are supported.')
+	optional.add_argument('--containmentIndex', default = None, help = 'Path of the stored containment index, the superset relations among all the terms of the GMT file. If it exists, it is updated only for the terms added, removed or changed since the GMT release it was built for, otherwise it is built; it is then saved and used to apply the rules. Not supported with multiple GMT files.')
+	optional.add_argument('--bootstrap', type = int, default = None, help = 'Number of bootstrap replicates to assess the stability of the representative terms. In each replicate, the ranks of the input files are perturbed and the terms are summarized again; the fraction of replicates where each representative term is still a representative term is written to the Representative stability column of filteredResult-Summary.tsv. Only the default rules are supported, not supported with --sweep or multiple GMT files. By default, there is no bootstrap.')
+	optional.add_argument('--bootstrapJitter', type = float, default = 0.2, help = 'Standard deviation of the Gaussian noise added to the logarithm of the ranks in each bootstrap replicate. By default, bootstrapJitter = 0.2')
+	optional.add_argument('--bootstrapSeed', type = int, default = None, help = 'Seed of the bootstrap replicates. By default, a random seed is used and written to the log file.')
+	optional.add_argument('--estimate', action = 'store_true', help = 'Print the estimated number of pair comparisons, peak memory and wall time of each stage of the run as JSON, without running it. Only the term IDs of the input files and the term sizes are read from the GMT files. Multiple GMT files are estimated as if they were summarized together. Not supported with --sweep, --containmentIndex or --bootstrap.')
+	optional.add_argument('--costModel', default = None, help = 'Path of the JSON file of the cost model used by --estimate, written by benchmark.py --calibrate. By default, the coefficients calibrated with orsum are used.')
 	return(parser)
 
-if __name__ == "__main__":
-	# Command-line interface
+
+def getArgumentsDict(argv=None):
+	"""
+	Parses the command-line arguments. Without --sweep, minTermSize,
+	maxTermSize and maxRepSize must have a single value, which replaces the list.
+	A single GMT file replaces the list of GMT files. Enrichment result table
+	options require idColumn, and each cutoff requires its column. With
+	--mapReduce and --bootstrap, rules must be the default rules. --estimate is
+	not supported with --sweep, --containmentIndex or --bootstrap,
+	--containmentIndex with multiple GMT files, and --bootstrap and
+	--cacheFolder with --sweep or multiple GMT files.
+
+	:param list argv: Command-line arguments, None for sys.argv
+	:return: **argsDict** (*dict*) – Parsed arguments
+	"""
 	parser = argumentParserFunction()
-	args = parser.parse_args()
+	args = parser.parse_args(argv)
 	argsDict = vars(args)
+	if len(argsDict['gmt'])==1:
+		argsDict['gmt']=argsDict['gmt'][0]
+	elif argsDict['sweep']:
+		parser.error('multiple GMT files are not supported with --sweep')
+	if argsDict['threads']<1:
+		parser.error('--threads must be at least 1')
+	if argsDict['memoryBudget'] is not None and argsDict['memoryBudget']<=0:
+		parser.error('--memoryBudget must be positive')
+	if argsDict['topK'] is not None and argsDict['topK']<1:
+		parser.error('--topK must be at least 1')
+	if argsDict['heatmapTileRows'] is not None:
+		if not argsDict['heatmapAllTerms']:
+			parser.error('--heatmapTileRows requires --heatmapAllTerms')
+		if argsDict['heatmapTileRows']<1:
+			parser.error('--heatmapTileRows must be at least 1')
+	if argsDict['idColumn'] is None:
+		for parameterName in ['scoreColumn', 'pValueColumn', 'maxPValue', 'fdrColumn', 'maxFdr']:
+			if argsDict[parameterName] is not None:
+				parser.error('--{} requires --idColumn'.format(parameterName))
+	if (argsDict['maxPValue'] is None)!=(argsDict['pValueColumn'] is None):
+		parser.error('--maxPValue and --pValueColumn must be given together')
+	if (argsDict['maxFdr'] is None)!=(argsDict['fdrColumn'] is None):
+		parser.error('--maxFdr and --fdrColumn must be given together')
+	if argsDict['mapReduce'] and argsDict['rules']!=parser.get_default('rules'):
+		parser.error('--mapReduce only supports the default rules')
+	if argsDict['containmentIndex'] is not None and isinstance(argsDict['gmt'], list):
+		parser.error('--containmentIndex is not supported with multiple GMT files')
+	if argsDict['bootstrap'] is not None:
+		if argsDict['bootstrap']<1:
+			parser.error('--bootstrap must be at least 1')
+		if argsDict['rules']!=parser.get_default('rules'):
+			parser.error('--bootstrap only supports the default rules')
+		if argsDict['sweep'] or isinstance(argsDict['gmt'], list):
+			parser.error('--bootstrap is not supported with --sweep or multiple GMT files')
+	elif argsDict['bootstrapSeed'] is not None:
+		parser.error('--bootstrapSeed requires --bootstrap')
+	if argsDict['costModel'] is not None and not argsDict['estimate']:
+		parser.error('--costModel requires --estimate')
+	if argsDict['estimate'] and argsDict['sweep']:
+		parser.error('--estimate is not supported with --sweep')
+	if argsDict['estimate'] and (argsDict['containmentIndex'] is not None or argsDict['bootstrap'] is not None):
+		parser.error('--estimate is not supported with --containmentIndex or --bootstrap, their cost is not estimated')
+	if argsDict['cacheFolder'] is not None and (argsDict['sweep'] or isinstance(argsDict['gmt'], list)):
+		parser.error('--cacheFolder is not supported with --sweep or multiple GMT files')
+	if not argsDict['sweep']:
+		for parameterName in SWEEP_PARAMETERS:
+			if len(argsDict[parameterName])>1:
+				parser.error('multiple values for --{} are only allowed with --sweep'.format(parameterName))
+			argsDict[parameterName]=argsDict[parameterName][0]
+	return(argsDict)
+
+
+def getInputOptions(argsDict):
+	"""
+	Returns the options for reading the input files, which are part of the
+	cache keys since they change the terms read.
+
+	:param dict argsDict: Arguments returned by getArgumentsDict
+	:return: **inputOptions** (*list*) – Values of the options
+	"""
+	return [argsDict[parameterName] for parameterName in ['idColumn', 'scoreColumn', 'sortOrder', 'delimiter', 'pValueColumn', 'maxPValue', 'fdrColumn', 'maxFdr']]
+
+
+def readEnrichmentResult(inputFile, argsDict):
+	"""
+	Reads the term IDs of an input file, a list of term IDs or, if idColumn is
+	given, an enrichment result table with the significance cutoffs applied.
+
+	:param str inputFile: Path of the input file
+	:param dict argsDict: Arguments returned by getArgumentsDict
+	:return: **termIdsList** (*list*) – List of term IDs to be summarized
+	"""
+
+	if argsDict['idColumn'] is None:
+		return readInputEnrichmentResultFile(inputFile)
+	cutoffs=[]
+	if argsDict['maxPValue'] is not None:
+		cutoffs.append((argsDict['pValueColumn'], argsDict['maxPValue']))
+	if argsDict['maxFdr'] is not None:
+		cutoffs.append((argsDict['fdrColumn'], argsDict['maxFdr']))
+	delimiter=argsDict['delimiter'].replace('\\t', '\t')
+	return readEnrichmentTable(inputFile, argsDict['idColumn'], argsDict['scoreColumn'], argsDict['sortOrder']=='ascending', delimiter, cutoffs)
+
+
+def getPeakMemoryUsage():
+	"""
+	Returns the peak resident set size of the process in MB, None if it is not available.
+	"""
+	if resource is None:
+		return None
+	peakMemoryUsage=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform=='darwin':#In bytes on macOS, in kilobytes on Linux
+		return peakMemoryUsage/2**20
+	return peakMemoryUsage/2**10
+
+
+def filterEnrichmentResult(termIdsList, gmtModel, minTermSize, maxTermSize, printFile=None):
+	"""
+	Removes duplicate terms, terms that are not in the GMT file and terms
+	outside the term size limits from an enrichment result.
+
+	:param list termIdsList: Term IDs of the enrichment result
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param int minTermSize: The minimum size of the terms to be processed
+	:param int maxTermSize: The maximum size of the terms to be processed
+	:param file printFile: Stream of the messages about each unknown term, None for the standard output
+	:return: **termIdsListFinal** (*list*) – Term IDs list after the removals
+	:return: **messages** (*list*) – Messages about the removals, each one a pair of the text to be printed and the text to be logged
+	"""
+
+	messages=[]
+
+	originalLength=len(termIdsList)
+	termIdsList=list(dict.fromkeys(termIdsList))#Removing duplicates if they exist
+	if(originalLength>len(termIdsList)):
+		messages.append(('Removed duplicate terms. First appearances of the terms determined the ranks of the terms.', 'Removed duplicate terms; their first appearances were used to determine the ranks.\n'))
+
+	termIdsListRUT=removeUnknownTerms(termIdsList, gmtModel, printFile)
+	difRUT=len(termIdsList)-len(termIdsListRUT)
+	if(difRUT>1):
+		messages.append(('{} terms are not in GMT, they are removed.'.format(difRUT), '{} terms are not in GMT, they are removed.\n'.format(difRUT)))
+	elif(difRUT==1):
+		messages.append(('{} term is not in GMT, it is removed.'.format(difRUT), '{} term is not in GMT, it is removed.\n'.format(difRUT)))
+
+	termIdsListRTS=removeTermsSmallerThanMinTermSize(termIdsListRUT, gmtModel, minTermSize)
+	difRTS=len(termIdsListRUT)-len(termIdsListRTS)
+	if(difRTS>1):
+		messages.append(('{} terms are smaller than minTermSize={}, they are removed.'.format(difRTS, minTermSize), '{} terms are smaller than minTermSize={}, they are removed.\n'.format(difRTS, minTermSize)))
+	elif(difRTS==1):
+		messages.append(('{} term is smaller than minTermSize={}, it is removed.'.format(difRTS, minTermSize), '{} term is smaller than minTermSize={}, it is removed.\n'.format(difRTS, minTermSize)))
+
+	termIdsListRTL=removeTermsLargerThanMaxTermSize(termIdsListRTS, gmtModel, maxTermSize)
+	difRTL=len(termIdsListRTS)-len(termIdsListRTL)
+	if(difRTL>1):
+		messages.append(('{} terms are larger than maxTermSize={}, they are removed.'.format(difRTL, maxTermSize), '{} terms are larger than maxTermSize={}, they are removed.\n'.format(difRTL, maxTermSize)))
+	elif(difRTL==1):
+		messages.append(('{} term is larger than maxTermSize={}, it is removed.'.format(difRTL, maxTermSize), '{} term is larger than maxTermSize={}, it is removed.\n'.format(difRTL, maxTermSize)))
+
+	termIdsListFinal=termIdsListRTL.copy()
+
+	if len(termIdsListFinal)==0:
+		messages.append(('There is no term left to be summarized from this input file. A possible reason is that IDs in the input file do not match the IDs in the GMT file. Another possible reason is setting minTermSize parameter too high. Please check your command, the GMT file and input files.', 'There is no term left to be summarized from this input file. A possible reason is that IDs in the input file do not match the IDs in the GMT file. Another possible reason is setting minTermSize parameter too high. Please check your command, the GMT file and input files.\n'))
+
+	return termIdsListFinal, messages
+
+
+def filterEnrichmentResults(termIdsListPerFile, inputEnrichmentResultFiles, fileAliases, gmtModel, minTermSize, maxTermSize, logFile):
+	"""
+	Filters the enrichment results of all the input files with
+	filterEnrichmentResult and reports the removals. Enrichment results with
+	no term left are left out.
+
+	:param list termIdsListPerFile: Term IDs of the enrichment result of each input file
+	:param list inputEnrichmentResultFiles: Paths of the input files
+	:param list fileAliases: Alias of each input file
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param int minTermSize: The minimum size of the terms to be processed
+	:param int maxTermSize: The maximum size of the terms to be processed
+	:param file logFile: Log file
+	:return: **termIdsListList** (*list*) – Filtered term ID lists of the remaining enrichment results
+	:return: **fileAliasesToUse** (*list*) – Aliases of the remaining enrichment results
+	"""
+
+	termIdsListList=[]
+	fileAliasesToUse=[]
+	for i in range(len(inputEnrichmentResultFiles)):
+		print()
+		print('Processing', inputEnrichmentResultFiles[i])
+		logFile.write('\nProcessing {}\n'.format(inputEnrichmentResultFiles[i]))
+		termIdsListFinal, messages=filterEnrichmentResult(termIdsListPerFile[i], gmtModel, minTermSize, maxTermSize)
+		for printMessage, logMessage in messages:
+			print(printMessage)
+			logFile.write(logMessage)
+		if len(termIdsListFinal)>0:
+			termIdsListList.append(termIdsListFinal)
+			fileAliasesToUse.append(fileAliases[i])
+	logFile.write('\n')
+	return termIdsListList, fileAliasesToUse
+
+
+def summarize(termIdsListList, gmtModel, maxRepresentativeTermSize, ruleNames, logFile, numberOfThreads=1, maxBitsetMemory=None, topK=None, containmentIndex=None, mapReduce=False, printFile=None):
+	"""
+	Summarizes the filtered enrichment results. Recurring terms in multiple
+	enrichment results are unified, then the selected rules are applied.
+	If topK is given, the last rule stops after the top K representative
+	terms are found. If mapReduce is True and there are multiple enrichment
+	results, they are summarized separately and merged with
+	summarizeMapReduce, which gives the same result for the default rules.
+
+	:param list termIdsListList: Filtered term ID lists of the enrichment results
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param int maxRepresentativeTermSize: The maximum size of a representative term
+	:param list ruleNames: Names of the rules to be applied, in order
+	:param file logFile: Log file
+	:param int numberOfThreads: Number of threads used to apply the rules
+	:param int maxBitsetMemory: The maximum memory in bytes for the gene bitsets of the rules, None for no limit
+	:param int topK: The number of top representative terms to be found, None for all
+	:param ContainmentIndex containmentIndex: Precomputed superset relations of the terms, None to compare the gene sets
+	:param bool mapReduce: Whether multiple enrichment results are summarized separately and merged
+	:param file printFile: Stream of the printed messages, e.g. a buffer of a parallel run, None for the standard output
+	:return: **termSummary** (*list*) – Representative term list
+	"""
+
+	if mapReduce and len(termIdsListList)>1:
+		initialTermNumber=sum(len(termIdsList) for termIdsList in termIdsListList)
+		print('Initial term number (recurring terms in different lists are not merged yet, each one is counted): {}\n'.format(initialTermNumber), file=printFile)
+		logFile.write('Initial term number (recurring terms in different lists are not merged yet, each one is counted): {}\n\n'.format(initialTermNumber))
+		print('Each list is summarized separately, then the lists are merged: '+RULES['supertermRepresentsLessSignificantSubterm'][1], file=printFile)
+		logFile.write('Each list is summarized separately, then the lists are merged: '+RULES['supertermRepresentsLessSignificantSubterm'][1]+'\n')
+		termSummary=summarizeMapReduce(termIdsListList, gmtModel, maxRepresentativeTermSize, numberOfThreads)
+		if topK is not None:
+			termSummary=termSummary[:topK]
+			print('Top representing term number: {}\n'.format(len(termSummary)), file=printFile)
+			logFile.write('Top representing term number: {}\n\n'.format(len(termSummary)))
+		else:
+			print('Representing term number: {}\n'.format(len(termSummary)), file=printFile)
+			logFile.write('Representing term number: {}\n\n'.format(len(termSummary)))
+		return termSummary
+
+	#termSummary is a list, each element is a list that contains
+	#term ID, the list of represented terms, rank
+	termSummary=initializeTermSummary(termIdsListList)
+
+	#Rules: (function name, description).
+	#This rule is run by default if there are multiple enrichment results
+	multipleListsUnifyRule=RULES['recurringTermsUnified']
+
+	#Rules selected by the user, applied in the given order
+	rules=[RULES[ruleName] for ruleName in ruleNames]
+
+	if(len(termIdsListList)==1):
+		print('Initial term number: {}\n'.format(len(termSummary)), file=printFile)
+		logFile.write('Initial term number: {}\n\n'.format(len(termSummary)))
+	else:
+		print('Initial term number (recurring terms in different lists are not merged yet, each one is counted): {}\n'.format(len(termSummary)), file=printFile)
+		logFile.write('Initial term number (recurring terms in different lists are not merged yet, each one is counted): {}\n\n'.format(len(termSummary)))
+		#Apply multipleListsUnifyRule to unify the same terms from multiple lists
+		rules.insert(0, multipleListsUnifyRule)
+
+	#Apply rules
+	for ruleNo in range(len(rules)):
+		rule=rules[ruleNo]
+		print(rule[1], file=printFile)
+		logFile.write(rule[1]+'\n')
+		if topK is not None and ruleNo==len(rules)-1:
+			#Representative terms are final one by one in rank order,
+			#the terms below the top K are not processed
+			termSummary=list(islice(generateRepresentatives(termSummary, gmtModel, maxRepresentativeTermSize, rule[0], numberOfThreads, maxBitsetMemory, containmentIndex), topK))
+			termSummary.sort(key=lambda x: x[2])
+			print('Top representing term number: {}\n'.format(len(termSummary)), file=printFile)
+			logFile.write('Top representing term number: {}\n\n'.format(len(termSummary)))
+		else:
+			termSummary=applyRule(termSummary, gmtModel, maxRepresentativeTermSize, rule[0], numberOfThreads, maxBitsetMemory, containmentIndex)
+			print('Representing term number: {}\n'.format(len(termSummary)), file=printFile)
+			logFile.write('Representing term number: {}\n\n'.format(len(termSummary)))
+
+	return termSummary
+
+
+def writeResults(termSummary, gmtModel, termIdsListList, fileAliases, outputFolder, numberOfTermsToPlot, heatmapAllTerms=False, heatmapTileRows=None, stabilities=None):
+	"""
+	Writes the result files and creates the plots.
+
+	:param list termSummary: Representative term list
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param list termIdsListList: Filtered term ID lists of the enrichment results
+	:param list fileAliases: Aliases of the enrichment results
+	:param str outputFolder: Path of the output folder, ending with the path separator
+	:param int numberOfTermsToPlot: The number of representative terms to be presented in barplot and heatmap
+	:param bool heatmapAllTerms: Whether the heatmap of all the representative terms is created
+	:param int heatmapTileRows: Number of terms in each tile of the heatmap of all the representative terms, None for no tiles
+	:param dict stabilities: Dictionary mapping representative term IDs to their bootstrap stability, None without bootstrap
+	:return: **outputFileNames** (*list*) – Names of the files written to the output folder
+	"""
+
+	fileName=outputFolder+'filteredResult'
+
+	writeTermSummaryFile(termSummary, gmtModel, termIdsListList, fileAliases, fileName+'-Detailed.tsv', fileName+'-Summary.tsv', stabilities)
+	writeHTMLSummaryFile(termSummary, gmtModel, termIdsListList, fileAliases, fileName+'.html')
+	writeRepresentativeToRepresentedIDsFile(termSummary, fileName+'IDMapping.tsv')
+	allTermsHeatmapNames=orsum_plot(fileName+'-Summary.tsv', outputFolder, numberOfTermsToPlot, allTermsHeatmapName='HeatmapAll' if heatmapAllTerms else None, tileRows=heatmapTileRows)
+
+	if(len(termSummary)>1):
+		writeTermSummaryFileClustered(termSummary, gmtModel, termIdsListList, fileAliases, fileName+'-SummaryClustered.tsv', numberOfTermsToPlot)
+		orsum_plot(fileName+'-SummaryClustered.tsv', outputFolder, numberOfTermsToPlot, heatmapName = 'HeatmapClustered')
+		os.remove(fileName+'-SummaryClustered.tsv')
+	else:
+		orsum_plot(fileName+'-Summary.tsv', outputFolder, numberOfTermsToPlot, heatmapName = 'HeatmapClustered') #Creating this file in case some other application expects it
+
+	return ['filteredResult-Detailed.tsv', 'filteredResult-Summary.tsv', 'filteredResult.html', 'filteredResultIDMapping.tsv', 'Barplot.png', 'Heatmap.png', 'HeatmapClustered.png', 'SizesDistribution.png']+[os.path.basename(heatmapName) for heatmapName in allTermsHeatmapNames]
+
+
+def writePeakMemoryUsage(logFile, memoryBudget):
+	"""
+	Prints and logs the peak memory usage of the run.
+
+	:param file logFile: Log file
+	:param int memoryBudget: Memory budget in MB given by the user, None if it is not given
+	"""
+
+	peakMemoryUsage=getPeakMemoryUsage()
+	if peakMemoryUsage is not None:
+		print('Peak memory usage: {:.1f} MB'.format(peakMemoryUsage))
+		logFile.write('Peak memory usage: {:.1f} MB\n'.format(peakMemoryUsage))
+		if memoryBudget is not None and peakMemoryUsage>memoryBudget:
+			print('Peak memory usage exceeded memoryBudget={} MB.'.format(memoryBudget))
+			logFile.write('Peak memory usage exceeded memoryBudget={} MB.\n'.format(memoryBudget))
+
+
+def getStoredContainmentIndex(containmentIndexPath, gmtModel, logFile):
+	"""
+	Reads the stored containment index of the previous GMT release, updates
+	it for the terms added, removed or changed in the GMT model and stores it
+	again. If there is no stored index, it is built for all the terms.
+
+	:param str containmentIndexPath: Path of the stored containment index
+	:param GmtModel gmtModel: GMT model of the whole GMT file
+	:param file logFile: Log file
+	:return: **containmentIndex** (*ContainmentIndex*) – Superset relations among all the terms of the GMT file
+	"""
+
+	previousContainmentIndex=None
+	if os.path.exists(containmentIndexPath):
+		previousContainmentIndex=readContainmentIndex(containmentIndexPath)
+	containmentIndex, addedTermIds, removedTermIds, changedTermIds=updateContainmentIndex(previousContainmentIndex, gmtModel)
+	if previousContainmentIndex is None:
+		print('Containment index is built for {} terms.\n'.format(len(containmentIndex)))
+		logFile.write('Containment index is built for {} terms.\n\n'.format(len(containmentIndex)))
+	else:
+		print('Containment index is updated: {} terms added, {} terms removed, {} terms changed.\n'.format(len(addedTermIds), len(removedTermIds), len(changedTermIds)))
+		logFile.write('Containment index is updated: {} terms added, {} terms removed, {} terms changed.\n\n'.format(len(addedTermIds), len(removedTermIds), len(changedTermIds)))
+	if previousContainmentIndex is None or len(addedTermIds)+len(removedTermIds)+len(changedTermIds)>0:
+		writeContainmentIndex(containmentIndex, containmentIndexPath)
+	return containmentIndex
+
+
+def getRepresentativeStabilities(termSummary, termIdsListList, gmtModel, maxRepresentativeTermSize, numberOfReplicates, jitter, seed, numberOfThreads, containmentIndex, logFile):
+	"""
+	Runs the bootstrap replicates with perturbed ranks and returns the
+	stability of each representative term: the fraction of the replicates
+	where it is a representative term.
+
+	:param list termSummary: Representative term list
+	:param list termIdsListList: Filtered term ID lists of the enrichment results
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param int maxRepresentativeTermSize: The maximum size of a representative term
+	:param int numberOfReplicates: Number of bootstrap replicates
+	:param float jitter: Standard deviation of the noise added to the logarithm of the ranks
+	:param int seed: Seed of the bootstrap replicates
+	:param int numberOfThreads: Number of threads running the replicates
+	:param ContainmentIndex containmentIndex: Superset relations of the terms, shared by all the replicates
+	:param file logFile: Log file
+	:return: **stabilities** (*dict*) – Dictionary mapping representative term IDs to their stability
+	"""
+
+	print('Bootstrap: {} replicates, jitter {}, seed {}'.format(numberOfReplicates, jitter, seed))
+	logFile.write('Bootstrap: {} replicates, jitter {}, seed {}\n'.format(numberOfReplicates, jitter, seed))
+	representativeCounts=bootstrapRepresentatives(termIdsListList, gmtModel, maxRepresentativeTermSize, numberOfReplicates, jitter, seed, numberOfThreads, containmentIndex)
+	stabilities={ts[0]: representativeCounts[ts[0]]/numberOfReplicates for ts in termSummary}
+	if len(stabilities)>0:
+		print('Mean stability of the representative terms: {:.3f}\n'.format(sum(stabilities.values())/len(stabilities)))
+		logFile.write('Mean stability of the representative terms: {:.3f}\n\n'.format(sum(stabilities.values())/len(stabilities)))
+	return stabilities
+
+
+def startRun(argsDict):
+	"""
+	Creates the output folder and the log file of a run, writes the arguments
+	to the log file, and checks the file aliases and the number of terms to
+	be plotted.
+
+	:param dict argsDict: Arguments returned by getArgumentsDict
+	:return: **outputFolder** (*str*) – Path of the output folder, ending with the path separator
+	:return: **logFile** (*file*) – Log file of the run, closed if the file aliases do not match
+	:return: **fileAliases** (*list*) – Alias of each input file, None if the numbers of input files and aliases do not match
+	:return: **numberOfTermsToPlot** (*int*) – Number of terms to be plotted, at most 50
+	"""
 
-	# Parameters
-	gmtPath=argsDict['gmt']
 	inputEnrichmentResultFiles=argsDict['files']
 	fileAliases=argsDict['fileAliases']
 	outputFolder=argsDict['outputFolder']
-	maxRepresentativeTermSize=argsDict['maxRepSize']
-	maxTermSize=argsDict['maxTermSize']
-	minTermSize=argsDict['minTermSize']
 	numberOfTermsToPlot=argsDict['numberOfTermsToPlot']
 
-
 	if outputFolder[-1]!=os.sep:
 		outputFolder=outputFolder+os.sep
 	if not os.path.isdir(outputFolder):
@@ -74,24 +500,76 @@ if __name__ == "__main__":
 		logFile.write("{}:\t{}\n".format(k,v))
 	logFile.write('\n')
 	print('\n')
-	
-	
+
 	if fileAliases is None:
-		fileAliases=[]
-		for inputFile in inputEnrichmentResultFiles:
-			fileAliases.append(os.path.basename(inputFile))
-	else:
-		if len(fileAliases)!=len(inputEnrichmentResultFiles):
-			print('Number of input files and aliases do not match.\n')
-			logFile.write('Number of input files and aliases do not match.\n')
-			exit()
-			
+		fileAliases=[os.path.basename(inputFile) for inputFile in inputEnrichmentResultFiles]
+	elif len(fileAliases)!=len(inputEnrichmentResultFiles):
+		print('Number of input files and aliases do not match.\n')
+		logFile.write('Number of input files and aliases do not match.\n')
+		logFile.close()
+		return outputFolder, logFile, None, numberOfTermsToPlot
+
 	if numberOfTermsToPlot > 50:
 		print('Number of terms to be plotted was greater than 50, it is changed to 50.\n')
 		logFile.write('Number of terms to be plotted was greater than 50, it is changed to 50.\n')
 		numberOfTermsToPlot = 50
 
+	return outputFolder, logFile, fileAliases, numberOfTermsToPlot
+
+
+def runOrsum(argsDict, gmtModel=None):
+	"""
+	Runs orsum with the parsed command-line arguments.
+
+	:param dict argsDict: Arguments parsed by the parser of argumentParserFunction
+	:param GmtModel gmtModel: GMT model of the whole GMT file, already loaded, None to read the GMT file
+	:return: **succeeded** (*bool*) – Whether the results are written, False if the run stopped on an error written to the log file
+	"""
+
+	# Parameters
+	gmtPath=argsDict['gmt']
+	inputEnrichmentResultFiles=argsDict['files']
+	maxRepresentativeTermSize=argsDict['maxRepSize']
+	maxTermSize=argsDict['maxTermSize']
+	minTermSize=argsDict['minTermSize']
+	heatmapAllTerms=argsDict['heatmapAllTerms']
+	heatmapTileRows=argsDict['heatmapTileRows']
+	ruleNames=argsDict['rules']
+	numberOfThreads=argsDict['threads']
+	mapReduce=argsDict['mapReduce']
+	memoryBudget=argsDict['memoryBudget']
+	cacheFolder=argsDict['cacheFolder']
+	cacheMaxSize=argsDict['cacheMaxSize']
+	topK=argsDict['topK']
+	containmentIndexPath=argsDict['containmentIndex']
+	numberOfReplicates=argsDict['bootstrap']
+	bootstrapJitter=argsDict['bootstrapJitter']
+	bootstrapSeed=argsDict['bootstrapSeed']
+
+
+	outputFolder, logFile, fileAliases, numberOfTermsToPlot=startRun(argsDict)
+	if fileAliases is None:
+		return False
 
+	#The seed is chosen here to be part of the cache key and the log
+	if numberOfReplicates is not None and bootstrapSeed is None:
+		bootstrapSeed=random.randrange(2**32)
+
+
+	#Results of an earlier run with the same GMT file, input files and
+	#parameters are copied from the cache.
+	if cacheFolder is not None:
+		gmtHash=hashFile(gmtPath)
+		inputHashes=[hashFile(inputFile) for inputFile in inputEnrichmentResultFiles]
+		resultKey=createCacheKey(VERSION, gmtHash, inputHashes, getInputOptions(argsDict), fileAliases, minTermSize, maxTermSize, maxRepresentativeTermSize, ruleNames, numberOfTermsToPlot, topK, heatmapAllTerms, heatmapTileRows, numberOfReplicates, bootstrapJitter, bootstrapSeed)
+		cachedResultFolder=getCachedResult(cacheFolder, resultKey)
+		if cachedResultFolder is not None:
+			copyCachedResult(cachedResultFolder, outputFolder)
+			print('Results are copied from the cache ({}).\n'.format(cachedResultFolder))
+			logFile.write('Results are copied from the cache ({}).\n\n'.format(cachedResultFolder))
+			writePeakMemoryUsage(logFile, memoryBudget)
+			logFile.close()
+			return True
 
 
 	#Read the GMT file.
@@ -101,7 +579,29 @@ if __name__ == "__main__":
 	#file it doesn't matter which ID is used, only the overlaps between
 	#different gene sets are checked.
 
-	termIdToGenesDict, termIdToTermNameDict=readGmtFile(gmtPath)
+	#Filtered terms of the input files that were processed with the same
+	#GMT file and term size limits before are taken from the cache.
+	termIdsListPerFile=[]
+	cachedFilteredLists=[]
+	for i in range(len(inputEnrichmentResultFiles)):
+		cachedFilteredList=None
+		if cacheFolder is not None:
+			cachedFilteredList=getCachedFilteredList(cacheFolder, createCacheKey(VERSION, gmtHash, inputHashes[i], getInputOptions(argsDict), minTermSize, maxTermSize))
+		cachedFilteredLists.append(cachedFilteredList)
+		if cachedFilteredList is None:
+			termIdsListPerFile.append(readEnrichmentResult(inputEnrichmentResultFiles[i], argsDict))
+		else:
+			termIdsListPerFile.append(cachedFilteredList[0])
+
+	#All term sizes and names are looked up from the GMT model.
+	#With a memory budget or the cache, only the terms in the input files are kept,
+	#unless all the terms are needed for the stored containment index.
+	#A GMT model given by the caller, e.g. a worker, is used as it is.
+	if gmtModel is None:
+		if (memoryBudget is None and cacheFolder is None) or containmentIndexPath is not None:
+			gmtModel=readGmtModel(gmtPath)
+		else:
+			gmtModel=readGmtModel(gmtPath, {termId for termIdsList in termIdsListPerFile for termId in termIdsList})
 
 
 
@@ -113,63 +613,29 @@ if __name__ == "__main__":
 		print()
 		print('Processing', inputFile)
 		logFile.write('\nProcessing {}\n'.format(inputFile))
-		termIdsList=readInputEnrichmentResultFile(inputFile)
-		
-		originalLength=len(termIdsList)
-		termIdsList=list(dict.fromkeys(termIdsList))#Removing duplicates if they exist
-		if(originalLength>len(termIdsList)):
-			print('Removed duplicate terms. First appearances of the terms determined the ranks of the terms.')
-			logFile.write('Removed duplicate terms; their first appearances were used to determine the ranks.\n')
-
-		termIdsListRUT=removeUnknownTerms(termIdsList, termIdToGenesDict)
-		difRUT=len(termIdsList)-len(termIdsListRUT)
-		if(difRUT>1):
-			print('{} terms are not in GMT, they are removed.'.format(difRUT))
-			logFile.write('{} terms are not in GMT, they are removed.\n'.format(difRUT))
-		elif(difRUT==1):
-			print('{} term is not in GMT, it is removed.'.format(difRUT))
-			logFile.write('{} term is not in GMT, it is removed.\n'.format(difRUT))
-
-		termIdsListRTS=removeTermsSmallerThanMinTermSize(termIdsListRUT, termIdToGenesDict, minTermSize)
-		difRTS=len(termIdsListRUT)-len(termIdsListRTS)
-		if(difRTS>1):
-			print('{} terms are smaller than minTermSize={}, they are removed.'.format(difRTS, minTermSize))
-			logFile.write('{} terms are smaller than minTermSize={}, they are removed.\n'.format(difRTS, minTermSize))
-		elif(difRTS==1):
-			print('{} term is smaller than minTermSize={}, it is removed.'.format(difRTS, minTermSize))
-			logFile.write('{} term is smaller than minTermSize={}, it is removed.\n'.format(difRTS, minTermSize))
-		
-		termIdsListRTL=removeTermsLargerThanMaxTermSize(termIdsListRTS, termIdToGenesDict, maxTermSize)
-		difRTL=len(termIdsListRTS)-len(termIdsListRTL)
-		if(difRTL>1):
-			print('{} terms are larger than maxTermSize={}, they are removed.'.format(difRTL, maxTermSize))
-			logFile.write('{} terms are larger than maxTermSize={}, they are removed.\n'.format(difRTL, maxTermSize))
-		elif(difRTL==1):
-			print('{} term is larger than maxTermSize={}, it is removed.'.format(difRTL, maxTermSize))
-			logFile.write('{} term is larger than maxTermSize={}, it is removed.\n'.format(difRTL, maxTermSize))
-		
-		termIdsListFinal=termIdsListRTL.copy()
-
-		if len(termIdsListFinal)==0:
-			print('There is no term left to be summarized from this input file. A possible reason is that IDs in the input file do not match the IDs in the GMT file. Another possible reason is setting minTermSize parameter too high. Please check your command, the GMT file and input files.')
-			logFile.write('There is no term left to be summarized from this input file. A possible reason is that IDs in the input file do not match the IDs in the GMT file. Another possible reason is setting minTermSize parameter too high. Please check your command, the GMT file and input files.\n')
+
+		if cachedFilteredLists[i] is None:
+			termIdsListFinal, messages=filterEnrichmentResult(termIdsListPerFile[i], gmtModel, minTermSize, maxTermSize)
+			if cacheFolder is not None:
+				storeFilteredList(cacheFolder, createCacheKey(VERSION, gmtHash, inputHashes[i], getInputOptions(argsDict), minTermSize, maxTermSize), termIdsListFinal, messages)
 		else:
+			termIdsListFinal, messages=cachedFilteredLists[i]
+		for printMessage, logMessage in messages:
+			print(printMessage)
+			logFile.write(logMessage)
+
+		if len(termIdsListFinal)>0:
 			termIdsListList.append(termIdsListFinal)
 			fileAliasesToUse.append(fileAlias)
 
-	#termSummary is a list, each element is a list that contains
-	#term ID, the list of represented terms, rank
-	termSummary=initializeTermSummary(termIdsListList)
 	fileAliases=fileAliasesToUse
 
 	logFile.write('\n')
 
-
-	#Rules: (function name, description).
-	#This rule is run by default if there are multiple enrichment results
-	multipleListsUnifyRule=(recurringTermsUnified,'Same terms in multiple lists are unified')
-
-	supertermRepresentsLessSignificantSubtermRule=(supertermRepresentsLessSignificantSubterm, 'Superterms represent their less significant (worse ranked) subterms. This includes equal terms, i.e. the terms that annotate exactly the same set of genes.')
+	#Memory left for the gene bitsets of the rules
+	maxBitsetMemory=None
+	if memoryBudget is not None:
+		maxBitsetMemory=max(0, int((memoryBudget-(getPeakMemoryUsage() or 0))*2**20/2))
 
 
 	print('\n\n')
@@ -177,40 +643,297 @@ if __name__ == "__main__":
 	if(len(termIdsListList)==0):
 		print('There is no valid file to be summarized.')
 		logFile.write('There is no valid file to be summarized.\n')
-		exit()
-	elif(len(termIdsListList)==1):
-		print('Initial term number: {}\n'.format(len(termSummary)))
-		logFile.write('Initial term number: {}\n\n'.format(len(termSummary)))
+		logFile.close()
+		return False
+
+	#The containment index is shared by the summarization and the bootstrap
+	#replicates
+	containmentIndex=None
+	if containmentIndexPath is not None:
+		containmentIndex=getStoredContainmentIndex(containmentIndexPath, gmtModel, logFile)
+	elif numberOfReplicates is not None:
+		containmentIndex=buildContainmentIndex(gmtModel, [termId for termIdsList in termIdsListList for termId in termIdsList])
+
+	termSummary=summarize(termIdsListList, gmtModel, maxRepresentativeTermSize, ruleNames, logFile, numberOfThreads, maxBitsetMemory, topK, containmentIndex, mapReduce)
+
+	stabilities=None
+	if numberOfReplicates is not None:
+		stabilities=getRepresentativeStabilities(termSummary, termIdsListList, gmtModel, maxRepresentativeTermSize, numberOfReplicates, bootstrapJitter, bootstrapSeed, numberOfThreads, containmentIndex, logFile)
+
+	outputFileNames=writeResults(termSummary, gmtModel, termIdsListList, fileAliases, outputFolder, numberOfTermsToPlot, heatmapAllTerms, heatmapTileRows, stabilities)
+
+	if cacheFolder is not None:
+		storeResult(cacheFolder, resultKey, outputFolder, outputFileNames, termSummary)
+		evictLeastRecentlyUsed(cacheFolder, cacheMaxSize*2**20)
+
+	writePeakMemoryUsage(logFile, memoryBudget)
+
+	logFile.close()
+	return True
+
+
+def runSweep(argsDict, gmtModel=None):
+	"""
+	Runs orsum for each combination of the minTermSize, maxTermSize and
+	maxRepSize values. The GMT file and the input files are read once. The
+	superset relations among the input terms do not depend on these
+	parameters, they are found once and shared by all the combinations.
+	Results of each combination are written to a subfolder of the output
+	folder, and the number of representative terms of each combination to
+	sweepSummary.tsv.
+
+	:param dict argsDict: Arguments parsed by the parser of argumentParserFunction, with lists of values for minTermSize, maxTermSize and maxRepSize
+	:param GmtModel gmtModel: GMT model of the whole GMT file, already loaded, None to read the GMT file
+	:return: **succeeded** (*bool*) – Whether the results of at least one combination are written, False if the run stopped on an error written to the log file
+	"""
+
+	# Parameters
+	gmtPath=argsDict['gmt']
+	inputEnrichmentResultFiles=argsDict['files']
+	maxRepresentativeTermSizes=argsDict['maxRepSize']
+	maxTermSizes=argsDict['maxTermSize']
+	minTermSizes=argsDict['minTermSize']
+	heatmapAllTerms=argsDict['heatmapAllTerms']
+	heatmapTileRows=argsDict['heatmapTileRows']
+	ruleNames=argsDict['rules']
+	numberOfThreads=argsDict['threads']
+	mapReduce=argsDict['mapReduce']
+	memoryBudget=argsDict['memoryBudget']
+	topK=argsDict['topK']
+	containmentIndexPath=argsDict['containmentIndex']
+
+
+	outputFolder, logFile, fileAliases, numberOfTermsToPlot=startRun(argsDict)
+	if fileAliases is None:
+		return False
+
+	termIdsListPerFile=[readEnrichmentResult(inputFile, argsDict) for inputFile in inputEnrichmentResultFiles]
+	if gmtModel is None:
+		if containmentIndexPath is None:
+			gmtModel=readGmtModel(gmtPath, {termId for termIdsList in termIdsListPerFile for termId in termIdsList})
+		else:
+			gmtModel=readGmtModel(gmtPath)
+
+	if containmentIndexPath is None:
+		#Superset relations among the terms within the widest term size limits
+		termIds=[termId for termIdsList in termIdsListPerFile for termId in termIdsList if termId in gmtModel]
+		termIds=[termId for termId, keep in zip(termIds, gmtModel.sizeMask(termIds, minTermSize=min(minTermSizes), maxTermSize=max(maxTermSizes))) if keep]
+		containmentIndex=buildContainmentIndex(gmtModel, termIds)
 	else:
-		print('Initial term number (recurring terms in different lists are not merged yet, each one is counted): {}\n'.format(len(termSummary)))
-		logFile.write('Initial term number (recurring terms in different lists are not merged yet, each one is counted): {}\n\n'.format(len(termSummary)))
-		#Apply multipleListsUnifyRule to unify the same terms from multiple lists
-		print(multipleListsUnifyRule[1])
-		logFile.write(multipleListsUnifyRule[1]+'\n')
-		termSummary=applyRule(termSummary, termIdToGenesDict, maxRepresentativeTermSize, multipleListsUnifyRule[0])
-		print('Representing term number: {}\n'.format(len(termSummary)))
-		logFile.write('Representing term number: {}\n\n'.format(len(termSummary)))
-
-	#Apply rule
-	print(supertermRepresentsLessSignificantSubtermRule[1])
-	logFile.write(supertermRepresentsLessSignificantSubtermRule[1]+'\n')
-	termSummary=applyRule(termSummary, termIdToGenesDict, maxRepresentativeTermSize, supertermRepresentsLessSignificantSubtermRule[0])
-	print('Representing term number: {}\n'.format(len(termSummary)))
-	logFile.write('Representing term number: {}\n\n'.format(len(termSummary)))
+		containmentIndex=getStoredContainmentIndex(containmentIndexPath, gmtModel, logFile)
 
-	fileName=outputFolder+'filteredResult'
-	
+	sweepSummary=[]
+	for minTermSize, maxTermSize, maxRepresentativeTermSize in product(minTermSizes, maxTermSizes, maxRepresentativeTermSizes):
+		combinationFolder='{}minTermSize{}_maxTermSize{}_maxRepSize{}{}'.format(outputFolder, minTermSize, maxTermSize, maxRepresentativeTermSize, os.sep)
+		if not os.path.isdir(combinationFolder):
+			os.makedirs(combinationFolder)
+		print('\nminTermSize={}, maxTermSize={}, maxRepSize={}'.format(minTermSize, maxTermSize, maxRepresentativeTermSize))
+		logFile.write('\nminTermSize={}, maxTermSize={}, maxRepSize={}\n'.format(minTermSize, maxTermSize, maxRepresentativeTermSize))
 
-	writeTermSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases, fileName+'-Detailed.tsv', fileName+'-Summary.tsv')
-	writeHTMLSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases, fileName+'.html')
-	writeRepresentativeToRepresentedIDsFile(termSummary, fileName+'IDMapping.tsv')
-	orsum_plot(fileName+'-Summary.tsv', outputFolder, numberOfTermsToPlot)
+		termIdsListList, fileAliasesToUse=filterEnrichmentResults(termIdsListPerFile, inputEnrichmentResultFiles, fileAliases, gmtModel, minTermSize, maxTermSize, logFile)
 
-	if(len(termSummary)>1):
-		writeTermSummaryFileClustered(termSummary, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases, fileName+'-SummaryClustered.tsv', numberOfTermsToPlot)
-		orsum_plot(fileName+'-SummaryClustered.tsv', outputFolder, numberOfTermsToPlot, heatmapName = 'HeatmapClustered')
-		os.remove(fileName+'-SummaryClustered.tsv')
+		if(len(termIdsListList)==0):
+			print('There is no valid file to be summarized.')
+			logFile.write('There is no valid file to be summarized.\n')
+			sweepSummary.append((minTermSize, maxTermSize, maxRepresentativeTermSize, 0, 0))
+			continue
+
+		termSummary=summarize(termIdsListList, gmtModel, maxRepresentativeTermSize, ruleNames, logFile, numberOfThreads, None, topK, containmentIndex, mapReduce)
+		writeResults(termSummary, gmtModel, termIdsListList, fileAliasesToUse, combinationFolder, numberOfTermsToPlot, heatmapAllTerms, heatmapTileRows)
+		sweepSummary.append((minTermSize, maxTermSize, maxRepresentativeTermSize, sum(len(termIdsList) for termIdsList in termIdsListList), len(termSummary)))
+
+	with open(outputFolder+'sweepSummary.tsv', 'w') as f:
+		f.write('minTermSize\tmaxTermSize\tmaxRepSize\tInitial term number\tRepresenting term number\n')
+		for row in sweepSummary:
+			f.write('\t'.join(str(value) for value in row)+'\n')
+
+	writePeakMemoryUsage(logFile, memoryBudget)
+
+	logFile.close()
+	#Combinations with no valid file have no initial term
+	return any(row[3]>0 for row in sweepSummary)
+
+
+def runMultiGmt(argsDict):
+	"""
+	Runs orsum with multiple GMT files. The input files are read once and the
+	GMT files are read into GMT models sharing the numbering of the genes.
+	By default, the input files are summarized against each GMT file, the
+	rules of the GMT files are applied in parallel and the results of each
+	GMT file are written to a subfolder named after its namespace. With
+	acrossNamespaces, the GMT models are combined and the terms of all the GMT
+	files are summarized together, with term IDs prefixed by their namespaces.
+	A term in several GMT files is taken from the first one.
+
+	:param dict argsDict: Arguments parsed by the parser of argumentParserFunction, with a list of GMT files
+	:return: **succeeded** (*bool*) – Whether the results are written, False if the run stopped on an error written to the log file
+	"""
+
+	# Parameters
+	gmtPaths=argsDict['gmt']
+	namespaces=argsDict['gmtAliases']
+	acrossNamespaces=argsDict['acrossNamespaces']
+	inputEnrichmentResultFiles=argsDict['files']
+	maxRepresentativeTermSize=argsDict['maxRepSize']
+	maxTermSize=argsDict['maxTermSize']
+	minTermSize=argsDict['minTermSize']
+	heatmapAllTerms=argsDict['heatmapAllTerms']
+	heatmapTileRows=argsDict['heatmapTileRows']
+	ruleNames=argsDict['rules']
+	numberOfThreads=argsDict['threads']
+	mapReduce=argsDict['mapReduce']
+	memoryBudget=argsDict['memoryBudget']
+	topK=argsDict['topK']
+
+
+	outputFolder, logFile, fileAliases, numberOfTermsToPlot=startRun(argsDict)
+	if fileAliases is None:
+		return False
+
+	if namespaces is None:
+		namespaces=[os.path.splitext(os.path.basename(gmtPath))[0] for gmtPath in gmtPaths]
+	elif len(namespaces)!=len(gmtPaths):
+		print('Number of GMT files and aliases do not match.\n')
+		logFile.write('Number of GMT files and aliases do not match.\n')
+		logFile.close()
+		return False
+	if len(set(namespaces))<len(namespaces):
+		print('Namespaces of the GMT files are not unique, please give unique aliases with --gmtAliases.\n')
+		logFile.write('Namespaces of the GMT files are not unique, please give unique aliases with --gmtAliases.\n')
+		logFile.close()
+		return False
+
+	#The input files are read once, and only their terms are kept from the
+	#GMT files. Genes are numbered once for all the GMT files.
+	termIdsListPerFile=[readEnrichmentResult(inputFile, argsDict) for inputFile in inputEnrichmentResultFiles]
+	inputTermIds={termId for termIdsList in termIdsListPerFile for termId in termIdsList}
+	geneIds=[]
+	geneIdToIndex=dict()
+	gmtModels=[readGmtModel(gmtPath, inputTermIds, geneIds, geneIdToIndex) for gmtPath in gmtPaths]
+
+	if acrossNamespaces:
+		gmtModel=combineGmtModels(gmtModels, namespaces)
+		#Each input term is replaced by its namespaced ID in the first GMT file
+		#it is in, in the order of the GMT files, so the ranks are kept
+		namespacedTermIdsListPerFile=[]
+		for inputFile, termIdsList in zip(inputEnrichmentResultFiles, termIdsListPerFile):
+			namespacedTermIdsList=[]
+			numberOfSharedTerms=0
+			for termId in termIdsList:
+				termNamespaces=[namespace for namespace, namespaceGmtModel in zip(namespaces, gmtModels) if termId in namespaceGmtModel]
+				if len(termNamespaces)>1:
+					numberOfSharedTerms+=1
+				namespacedTermIdsList.append(getNamespacedTermId(termNamespaces[0], termId) if len(termNamespaces)>0 else termId)
+			if(numberOfSharedTerms>1):
+				print('{} terms of {} are in several GMT files, the namespace of the first one is used.'.format(numberOfSharedTerms, inputFile))
+				logFile.write('{} terms of {} are in several GMT files, the namespace of the first one is used.\n'.format(numberOfSharedTerms, inputFile))
+			elif(numberOfSharedTerms==1):
+				print('{} term of {} is in several GMT files, the namespace of the first one is used.'.format(numberOfSharedTerms, inputFile))
+				logFile.write('{} term of {} is in several GMT files, the namespace of the first one is used.\n'.format(numberOfSharedTerms, inputFile))
+			namespacedTermIdsListPerFile.append(namespacedTermIdsList)
+		termIdsListList, fileAliasesToUse=filterEnrichmentResults(namespacedTermIdsListPerFile, inputEnrichmentResultFiles, fileAliases, gmtModel, minTermSize, maxTermSize, logFile)
+		runs=[(None, gmtModel, termIdsListList, fileAliasesToUse)] if len(termIdsListList)>0 else []
 	else:
-		orsum_plot(fileName+'-Summary.tsv', outputFolder, numberOfTermsToPlot, heatmapName = 'HeatmapClustered') #Creating this file in case some other application expects it
+		runs=[]
+		for namespace, gmtModel in zip(namespaces, gmtModels):
+			print('\nNamespace', namespace)
+			logFile.write('\nNamespace {}\n'.format(namespace))
+			termIdsListList, fileAliasesToUse=filterEnrichmentResults(termIdsListPerFile, inputEnrichmentResultFiles, fileAliases, gmtModel, minTermSize, maxTermSize, logFile)
+			if len(termIdsListList)>0:
+				runs.append((namespace, gmtModel, termIdsListList, fileAliasesToUse))
+
+	print('\n\n')
+
+	if(len(runs)==0):
+		print('There is no valid file to be summarized.')
+		logFile.write('There is no valid file to be summarized.\n')
+		logFile.close()
+		return False
+
+	#Memory left for the gene bitsets of the rules, shared by the parallel runs
+	maxBitsetMemory=None
+	if memoryBudget is not None:
+		maxBitsetMemory=max(0, int((memoryBudget-(getPeakMemoryUsage() or 0))*2**20/2/len(runs)))
+
+	#Rules of the namespaces are applied in parallel, each one printing and
+	#logging to its own buffers, which are printed and copied to the log file
+	#in the order of the namespaces
+	def summarizeRun(run):
+		runOutput=io.StringIO()
+		runLog=io.StringIO()
+		termSummary=summarize(run[2], run[1], maxRepresentativeTermSize, ruleNames, runLog, numberOfThreads, maxBitsetMemory, topK, None, mapReduce, runOutput)
+		return termSummary, runOutput.getvalue(), runLog.getvalue()
+
+	with ThreadPoolExecutor(len(runs)) as executor:
+		summaries=list(executor.map(summarizeRun, runs))
+
+	#Plots are not thread-safe, results are written one by one
+	for (namespace, gmtModel, termIdsListList, fileAliasesToUse), (termSummary, runOutput, runLog) in zip(runs, summaries):
+		runOutputFolder=outputFolder
+		if namespace is not None:
+			print('\nNamespace', namespace)
+			logFile.write('\nNamespace {}\n'.format(namespace))
+			runOutputFolder=outputFolder+namespace+os.sep
+			if not os.path.isdir(runOutputFolder):
+				os.makedirs(runOutputFolder)
+		print(runOutput, end='')
+		logFile.write(runLog)
+		writeResults(termSummary, gmtModel, termIdsListList, fileAliasesToUse, runOutputFolder, numberOfTermsToPlot, heatmapAllTerms, heatmapTileRows)
+
+	writePeakMemoryUsage(logFile, memoryBudget)
 
 	logFile.close()
+	return True
+
+
+def runEstimate(argsDict):
+	"""
+	Prints the estimated cost of the run as JSON, without running it. The
+	input files are read, but the GMT files are only scanned for their numbers
+	of terms and gene entries and the sizes and genes of the input terms.
+
+	:param dict argsDict: Arguments returned by getArgumentsDict
+	:return: **estimate** (*dict*) – Estimate returned by estimateRun
+	"""
+
+	#The memory used by the process before the run, e.g. by the libraries
+	baselineMemory=getPeakMemoryUsage() or 0
+	gmtPaths=argsDict['gmt'] if isinstance(argsDict['gmt'], list) else [argsDict['gmt']]
+	termIdsListPerFile=[readEnrichmentResult(inputFile, argsDict) for inputFile in argsDict['files']]
+	inputTermIds={termId for termIdsList in termIdsListPerFile for termId in termIdsList}
+	gmtStatistics=combineGmtStatistics([readGmtStatistics(gmtPath, inputTermIds) for gmtPath in gmtPaths])
+	maxBitsetMemory=None
+	if argsDict['memoryBudget'] is not None:
+		maxBitsetMemory=max(0, int((argsDict['memoryBudget']-baselineMemory)*2**20/2))
+	loadWholeGmt=argsDict['memoryBudget'] is None and argsDict['cacheFolder'] is None
+	stageFeatures, pairComparisons=getStageFeatures(gmtStatistics, termIdsListPerFile, argsDict['minTermSize'], argsDict['maxTermSize'], argsDict['rules'], loadWholeGmt, maxBitsetMemory)
+	estimate=estimateRun(stageFeatures, pairComparisons, readCostModel(argsDict['costModel']), baselineMemory)
+	print(json.dumps(estimate, indent=1))
+	return estimate
+
+
+def runFromArguments(argsDict, gmtModel=None):
+	"""
+	Runs orsum in the mode selected by the arguments: an estimate, a
+	parameter sweep, multiple GMT files or a single run.
+
+	:param dict argsDict: Arguments returned by getArgumentsDict
+	:param GmtModel gmtModel: GMT model of the whole GMT file of a single GMT run, already loaded, None to read the GMT file
+	:return: **succeeded** (*bool*) – Whether the run succeeded, False if it stopped on an error written to the log file
+	"""
+
+	if argsDict['estimate']:
+		runEstimate(argsDict)
+		return True
+	elif argsDict['sweep']:
+		return runSweep(argsDict, gmtModel)
+	elif isinstance(argsDict['gmt'], list):
+		return runMultiGmt(argsDict)
+	else:
+		return runOrsum(argsDict, gmtModel)
+
+
+if __name__ == "__main__":
+	# Command-line interface
+	if not runFromArguments(getArgumentsDict()):
+		sys.exit(1)
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Ozan
+
+Long-running orsum server for interactive use, e.g. by a web front end.
+The GMT files are read once when the server starts, and summarization jobs
+are sent over HTTP, on a localhost port or on a Unix socket, as JSON with
+the term ID lists of the enrichment results. Jobs wait in a bounded queue
+and are run by a pool of worker threads sharing the GMT models; when the
+queue is full, new jobs are rejected with status 503 instead of piling up.
+The results are the files written by writeTermSummaryFile and
+writeRepresentativeToRepresentedIDsFile, returned in the JSON response or
+written to a subfolder of the output root of the server. Latency and queue
+depth are reported at /metrics.
+
+Endpoints:
+	POST /summarize: runs a job and returns its results
+	GET /metrics: queue depth, job counts and latencies
+	GET /health: names of the loaded GMT files
+"""
+
+from orsum import filterEnrichmentResult, summarize
+from termCombinationLib import readGmtModel, writeTermSummaryFile, writeRepresentativeToRepresentedIDsFile, RULES
+from argparse import ArgumentParser
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+import http.client
+import io
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+import traceback
+
+
+#Names of the result files of a job
+RESULT_FILE_NAMES=['filteredResult-Detailed.tsv', 'filteredResult-Summary.tsv', 'filteredResultIDMapping.tsv']
+
+#Default parameters of a job, the same as the defaults of orsum.py
+DEFAULT_JOB_PARAMETERS={'fileAliases':None, 'minTermSize':10, 'maxTermSize':int(1E6), 'maxRepSize':int(1E6), 'rules':['supertermRepresentsLessSignificantSubterm'], 'topK':None, 'outputFolder':None}
+
+#Types of the job parameters, None is only allowed for the parameters with
+#None as default
+JOB_PARAMETER_TYPES={'gmt':str, 'fileAliases':list, 'minTermSize':int, 'maxTermSize':int, 'maxRepSize':int, 'rules':list, 'topK':int, 'outputFolder':str}
+TYPE_NAMES={str:'a string', list:'a list of strings', int:'an integer'}
+
+#Number of recent jobs whose latencies are reported in the metrics
+LATENCY_WINDOW=1000
+
+
+class QueueFullError(Exception):
+	"""
+	Raised when a job is submitted while the job queue is full.
+	"""
+
+
+class JobError(Exception):
+	"""
+	Raised when a job is invalid, e.g. its GMT file is not loaded or its
+	output folder is outside the output root.
+	"""
+
+
+class Job:
+	"""
+	A summarization job waiting in the queue. The worker running it sets
+	result, or error if it fails, and then the event.
+	"""
+
+	def __init__(self, parameters):
+		"""
+		:param dict parameters: Parameters of the job, with the defaults of DEFAULT_JOB_PARAMETERS
+		"""
+
+		self.parameters=parameters
+		self.submitted=time.time()
+		self.started=None
+		self.finished=None
+		self.result=None
+		self.error=None
+		self.traceback=None
+		self.event=threading.Event()
+
+
+class OrsumService:
+	"""
+	GMT models, job queue and worker threads of the server, and the metrics
+	of the jobs. The GMT models are only read by the workers, so they are
+	shared without a lock.
+	"""
+
+	def __init__(self, gmtModels, numberOfWorkers=2, queueSize=16, outputRoot=None):
+		"""
+		:param dict gmtModels: Dictionary mapping GMT names to GMT models
+		:param int numberOfWorkers: Number of worker threads running the jobs
+		:param int queueSize: The maximum number of jobs waiting to be run
+		:param str outputRoot: Folder under which the jobs write their result files, None to only return their contents
+		"""
+
+		self.gmtModels=gmtModels
+		self.outputRoot=None if outputRoot is None else os.path.realpath(outputRoot)
+		self.numberOfWorkers=numberOfWorkers
+		self.jobQueue=queue.Queue(queueSize)
+		self.workers=[]
+		self.lock=threading.Lock()
+		self.runningJobs=0
+		self.counts={'completed':0, 'failed':0, 'rejected':0}
+		self.latencies=deque(maxlen=LATENCY_WINDOW)
+		self.queueWaits=deque(maxlen=LATENCY_WINDOW)
+		self.started=time.time()
+
+	def start(self):
+		"""
+		Starts the worker threads.
+		"""
+
+		for workerNo in range(self.numberOfWorkers):
+			worker=threading.Thread(target=self.work, name='orsum-worker-{}'.format(workerNo), daemon=True)
+			worker.start()
+			self.workers.append(worker)
+
+	def stop(self):
+		"""
+		Stops the worker threads after the jobs in the queue.
+		"""
+
+		for worker in self.workers:
+			self.jobQueue.put(None)
+		for worker in self.workers:
+			worker.join()
+		self.workers=[]
+
+	def enqueue(self, parameters):
+		"""
+		Checks the parameters of a job and puts it in the queue without waiting.
+
+		:param dict parameters: Parameters of the job, see runJob
+		:return: **job** (*Job*) – Queued job
+		"""
+
+		job=Job(self.getJobParameters(parameters))
+		try:
+			self.jobQueue.put_nowait(job)
+		except queue.Full:
+			with self.lock:
+				self.counts['rejected']+=1
+			raise QueueFullError('The job queue is full ({} jobs).'.format(self.jobQueue.maxsize))
+		return job
+
+	def submit(self, parameters, timeout=None):
+		"""
+		Puts a job in the queue and waits for its result.
+
+		:param dict parameters: Parameters of the job, see runJob
+		:param float timeout: The maximum number of seconds to wait, None to wait until the job is finished
+		:return: **result** (*dict*) – Result of the job returned by runJob
+		"""
+
+		job=self.enqueue(parameters)
+		if not job.event.wait(timeout):
+			raise TimeoutError('The job is not finished in {} seconds.'.format(timeout))
+		if job.error is not None:
+			raise job.error
+		return job.result
+
+	def getJobParameters(self, parameters):
+		"""
+		Checks the parameters of a job and adds the defaults. The output
+		folder, relative to the output root, is replaced by its real path.
+
+		:param dict parameters: Parameters of the job
+		:return: **jobParameters** (*dict*) – Parameters with the defaults
+		"""
+
+		if not isinstance(parameters, dict):
+			raise JobError('The job must be a JSON object.')
+		unknownParameters=set(parameters)-set(DEFAULT_JOB_PARAMETERS)-{'gmt', 'enrichmentResults'}
+		if len(unknownParameters)>0:
+			raise JobError('Unknown parameters: {}'.format(', '.join(sorted(unknownParameters))))
+		jobParameters=dict(DEFAULT_JOB_PARAMETERS)
+		jobParameters.update(parameters)
+		for name, parameterType in JOB_PARAMETER_TYPES.items():
+			value=jobParameters.get(name)
+			if value is None and DEFAULT_JOB_PARAMETERS.get(name) is None:
+				continue
+			#bool is a subclass of int
+			if not isinstance(value, parameterType) or isinstance(value, bool) or (parameterType is list and not all(isinstance(item, str) for item in value)):
+				raise JobError('{} must be {}.'.format(name, TYPE_NAMES[parameterType]))
+		if jobParameters['topK'] is not None and jobParameters['topK']<1:
+			raise JobError('topK must be at least 1.')
+		if jobParameters.get('gmt') is None:
+			if len(self.gmtModels)!=1:
+				raise JobError('gmt must be one of {}.'.format(', '.join(sorted(self.gmtModels))))
+			jobParameters['gmt']=next(iter(self.gmtModels))
+		elif jobParameters['gmt'] not in self.gmtModels:
+			raise JobError('GMT {} is not loaded, it must be one of {}.'.format(jobParameters['gmt'], ', '.join(sorted(self.gmtModels))))
+		enrichmentResults=jobParameters.get('enrichmentResults')
+		if not isinstance(enrichmentResults, list) or len(enrichmentResults)==0 or not all(isinstance(termIdsList, list) for termIdsList in enrichmentResults):
+			raise JobError('enrichmentResults must be a list of term ID lists.')
+		if jobParameters['fileAliases'] is None:
+			jobParameters['fileAliases']=['Result {}'.format(listNo+1) for listNo in range(len(enrichmentResults))]
+		elif len(jobParameters['fileAliases'])!=len(enrichmentResults):
+			raise JobError('Number of enrichment results and aliases do not match.')
+		for ruleName in jobParameters['rules']:
+			if ruleName not in RULES:
+				raise JobError('Unknown rule {}.'.format(ruleName))
+		if jobParameters['outputFolder'] is not None:
+			jobParameters['outputFolder']=self.getOutputFolder(jobParameters['outputFolder'])
+		return jobParameters
+
+	def getOutputFolder(self, outputFolder):
+		"""
+		Checks that the output folder of a job is a relative path within the
+		output root, after resolving '..' and symbolic links.
+
+		:param str outputFolder: Output folder of the job, relative to the output root
+		:return: **outputFolder** (*str*) – Real path of the output folder
+		"""
+
+		if self.outputRoot is None:
+			raise JobError('outputFolder is not allowed, the server has no output root.')
+		if os.path.isabs(outputFolder):
+			raise JobError('outputFolder must be relative to the output root.')
+		realOutputFolder=os.path.realpath(os.path.join(self.outputRoot, outputFolder))
+		if os.path.commonpath([self.outputRoot, realOutputFolder])!=self.outputRoot:
+			raise JobError('outputFolder must be within the output root.')
+		return realOutputFolder
+
+	def work(self):
+		"""
+		Runs the jobs of the queue until it gets None.
+		"""
+
+		while True:
+			job=self.jobQueue.get()
+			if job is None:
+				return
+			job.started=time.time()
+			with self.lock:
+				self.runningJobs+=1
+			try:
+				job.result=runJob(self.gmtModels[job.parameters['gmt']], job.parameters)
+			except Exception as e:
+				job.error=e
+				job.traceback=traceback.format_exc()
+			job.finished=time.time()
+			with self.lock:
+				self.runningJobs-=1
+				self.counts['failed' if job.error is not None else 'completed']+=1
+				self.latencies.append(job.finished-job.submitted)
+				self.queueWaits.append(job.started-job.submitted)
+			job.event.set()
+
+	def getMetrics(self):
+		"""
+		:return: **metrics** (*dict*) – Queue depth and capacity, number of running, completed, failed and rejected jobs, and statistics of the latencies (from submission to result) and queue waits of the recent jobs, in seconds
+		"""
+
+		with self.lock:
+			metrics={
+				'uptime':time.time()-self.started,
+				'workers':self.numberOfWorkers,
+				'queueDepth':self.jobQueue.qsize(),
+				'queueCapacity':self.jobQueue.maxsize,
+				'runningJobs':self.runningJobs,
+				'completedJobs':self.counts['completed'],
+				'failedJobs':self.counts['failed'],
+				'rejectedJobs':self.counts['rejected'],
+				'latency':getLatencyStatistics(self.latencies),
+				'queueWait':getLatencyStatistics(self.queueWaits),
+			}
+		return metrics
+
+
+def getLatencyStatistics(latencies):
+	"""
+	:param collections.deque latencies: Latencies in seconds
+	:return: **statistics** (*dict*) – Number, mean, median, 90th and 99th percentile and maximum of the latencies, None if there are no latencies
+	"""
+
+	if len(latencies)==0:
+		return None
+	sortedLatencies=sorted(latencies)
+	def getPercentile(percentile):
+		return sortedLatencies[min(len(sortedLatencies)-1, int(percentile/100*len(sortedLatencies)))]
+	return {'count':len(sortedLatencies), 'mean':sum(sortedLatencies)/len(sortedLatencies), 'p50':getPercentile(50), 'p90':getPercentile(90), 'p99':getPercentile(99), 'max':sortedLatencies[-1]}
+
+
+def runJob(gmtModel, parameters):
+	"""
+	Filters and summarizes the enrichment results of a job like orsum.py,
+	and writes the results with writeTermSummaryFile and
+	writeRepresentativeToRepresentedIDsFile. Plots are not created. The
+	writers only print I/O errors, so the result files are removed before
+	writing and an IOError is raised if any of them is missing afterwards.
+	Messages printed by orsum.py are printed to the output of the job, not to
+	the standard output of the server shared by all the jobs.
+
+	:param GmtModel gmtModel: GMT model of the job
+	:param dict parameters: Parameters of the job: enrichmentResults, the term ID lists of the enrichment results, and fileAliases, minTermSize, maxTermSize, maxRepSize, rules, topK as in orsum.py. If outputFolder, checked by OrsumService.getOutputFolder, is given, the result files are written there, otherwise their contents are returned.
+	:return: **result** (*dict*) – Number of representative terms, log and printed output of the job, and for each result file its contents, or its path if outputFolder is given
+	"""
+
+	logFile=io.StringIO()
+	output=io.StringIO()
+	termIdsListList=[]
+	fileAliases=[]
+	for termIdsList, fileAlias in zip(parameters['enrichmentResults'], parameters['fileAliases']):
+		print('\nProcessing', fileAlias, file=output)
+		logFile.write('\nProcessing {}\n'.format(fileAlias))
+		termIdsListFinal, messages=filterEnrichmentResult([str(termId) for termId in termIdsList], gmtModel, parameters['minTermSize'], parameters['maxTermSize'], output)
+		for printMessage, logMessage in messages:
+			print(printMessage, file=output)
+			logFile.write(logMessage)
+		if len(termIdsListFinal)>0:
+			termIdsListList.append(termIdsListFinal)
+			fileAliases.append(fileAlias)
+	logFile.write('\n')
+
+	termSummary=[]
+	if len(termIdsListList)==0:
+		print('There is no valid file to be summarized.', file=output)
+		logFile.write('There is no valid file to be summarized.\n')
+	else:
+		termSummary=summarize(termIdsListList, gmtModel, parameters['maxRepSize'], parameters['rules'], logFile, topK=parameters['topK'], printFile=output)
+
+	outputFolder=parameters['outputFolder']
+	with tempfile.TemporaryDirectory() as temporaryFolder:
+		folder=temporaryFolder if outputFolder is None else outputFolder
+		os.makedirs(folder, exist_ok=True)
+		paths=[os.path.join(folder, fileName) for fileName in RESULT_FILE_NAMES]
+		for path in paths:
+			if os.path.exists(path):
+				os.remove(path)
+		writeTermSummaryFile(termSummary, gmtModel, termIdsListList, fileAliases, paths[0], paths[1])
+		writeRepresentativeToRepresentedIDsFile(termSummary, paths[2])
+		missingFileNames=[fileName for fileName, path in zip(RESULT_FILE_NAMES, paths) if not os.path.isfile(path)]
+		if len(missingFileNames)>0:
+			raise IOError('Result files could not be written: {}'.format(', '.join(missingFileNames)))
+		files=dict()
+		for fileName, path in zip(RESULT_FILE_NAMES, paths):
+			if outputFolder is None:
+				with open(path, 'r') as f:
+					files[fileName]=f.read()
+			else:
+				files[fileName]=os.path.abspath(path)
+	return {'representativeTermNumber':len(termSummary), 'log':logFile.getvalue(), 'output':output.getvalue(), 'files':files}
+
+
+class OrsumRequestHandler(BaseHTTPRequestHandler):
+	"""
+	HTTP request handler of the server, with the service in server.service.
+	Requests wait for the result of their job, while the jobs run on the
+	worker threads of the service.
+	"""
+
+	protocol_version='HTTP/1.1'
+
+	def sendJson(self, status, content, headers=None):
+		body=json.dumps(content).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		for name, value in (headers or dict()).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		service=self.server.service
+		if self.path=='/metrics':
+			self.sendJson(200, service.getMetrics())
+		elif self.path=='/health':
+			self.sendJson(200, {'gmts':sorted(service.gmtModels)})
+		else:
+			self.sendJson(404, {'error':'Unknown path {}'.format(self.path)})
+
+	def do_POST(self):
+		service=self.server.service
+		body=self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		if self.path!='/summarize':
+			self.sendJson(404, {'error':'Unknown path {}'.format(self.path)})
+			return
+		try:
+			result=service.submit(json.loads(body.decode('utf-8')))
+		except (ValueError, JobError) as e:#Invalid JSON or job
+			self.sendJson(400, {'error':str(e)})
+		except QueueFullError as e:
+			self.sendJson(503, {'error':str(e)}, {'Retry-After':'1'})
+		except Exception as e:
+			self.sendJson(500, {'error':str(e)})
+		else:
+			self.sendJson(200, result)
+
+	def address_string(self):
+		#Clients of a Unix socket have no address
+		return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix-socket'
+
+	def log_message(self, format, *args):
+		if not self.server.quiet:
+			BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+	"""
+	HTTP server on a Unix socket, handling each request in a thread.
+	"""
+
+	daemon_threads=True
+
+	def server_bind(self):
+		UnixStreamServer.server_bind(self)
+		self.server_name='localhost'
+		self.server_port=0
+
+
+def createServer(service, port=None, socketPath=None, host='127.0.0.1', quiet=False):
+	"""
+	Creates the HTTP server of a service, on a port of host or on a Unix
+	socket. An existing Unix socket file is replaced.
+
+	:param OrsumService service: Service running the jobs
+	:param int port: Port number, 0 for any free port, None to use socketPath
+	:param str socketPath: Path of the Unix socket, used if port is None
+	:param str host: Host name or address of the server, localhost by default
+	:param bool quiet: Whether the requests are not logged to stderr
+	:return: **server** (*socketserver.BaseServer*) – Server, to be run with serve_forever
+	"""
+
+	if port is not None:
+		server=ThreadingHTTPServer((host, port), OrsumRequestHandler)
+	else:
+		if os.path.exists(socketPath):
+			os.remove(socketPath)
+		server=ThreadingUnixHTTPServer(socketPath, OrsumRequestHandler)
+	server.service=service
+	server.quiet=quiet
+	return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+	"""
+	HTTP client connection to a server on a Unix socket.
+	"""
+
+	def __init__(self, socketPath, timeout=None):
+		http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+		self.socketPath=socketPath
+
+	def connect(self):
+		self.sock=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		if self.timeout is not None:
+			self.sock.settimeout(self.timeout)
+		self.sock.connect(self.socketPath)
+
+
+def sendRequest(method, path, content=None, port=None, socketPath=None, host='127.0.0.1', timeout=None):
+	"""
+	Sends a request to an orsum server and returns the JSON response.
+
+	:param str method: HTTP method, GET or POST
+	:param str path: Path of the endpoint, e.g. /summarize
+	:param dict content: JSON content of a POST request
+	:param int port: Port number of the server, None to use socketPath
+	:param str socketPath: Path of the Unix socket of the server
+	:param str host: Host of the server
+	:param float timeout: Socket timeout in seconds, None for no timeout
+	:return: **status** (*int*) – HTTP status code
+	:return: **response** (*dict*) – JSON response
+	"""
+
+	connection=http.client.HTTPConnection(host, port, timeout=timeout) if port is not None else UnixHTTPConnection(socketPath, timeout)
+	try:
+		body=None if content is None else json.dumps(content).encode('utf-8')
+		connection.request(method, path, body, {'Content-Type':'application/json'} if body is not None else dict())
+		response=connection.getresponse()
+		return response.status, json.loads(response.read().decode('utf-8'))
+	finally:
+		connection.close()
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser(description = 'orsum server running summarization jobs sent over HTTP')
+	parser.add_argument('--gmt', required = True, nargs = '+', help = 'Paths of the GMT files, read when the server starts.')
+	parser.add_argument('--gmtAliases', nargs = '+', default = None, help = 'Names of the GMT files used in the jobs. By default, GMT file names without extension are used.')
+	transport = parser.add_mutually_exclusive_group(required = True)
+	transport.add_argument('--port', type = int, help = 'Port of the HTTP server on localhost.')
+	transport.add_argument('--socket', help = 'Path of the Unix socket of the HTTP server.')
+	parser.add_argument('--host', default = '127.0.0.1', help = 'Address of the HTTP server with --port. By default, host = 127.0.0.1')
+	parser.add_argument('--workers', type = int, default = 2, help = 'Number of worker threads running the jobs. By default, workers = 2')
+	parser.add_argument('--queueSize', type = int, default = 16, help = 'The maximum number of jobs waiting to be run; further jobs are rejected with status 503. By default, queueSize = 16')
+	parser.add_argument('--outputRoot', default = None, help = 'Folder under which the jobs can write their result files, with outputFolder relative to it. By default, outputFolder is not allowed and the contents of the result files are returned.')
+	parser.add_argument('--quiet', action = 'store_true', help = 'Do not log the requests.')
+	args = parser.parse_args()
+
+	gmtAliases = args.gmtAliases if args.gmtAliases is not None else [os.path.splitext(os.path.basename(gmtPath))[0] for gmtPath in args.gmt]
+	if len(gmtAliases) != len(args.gmt) or len(set(gmtAliases)) < len(gmtAliases):
+		parser.error('GMT aliases must be unique, one for each GMT file')
+	gmtModels = {gmtAlias: readGmtModel(gmtPath) for gmtAlias, gmtPath in zip(gmtAliases, args.gmt)}
+	service = OrsumService(gmtModels, args.workers, args.queueSize, args.outputRoot)
+	service.start()
+	server = createServer(service, args.port, args.socket, args.host, args.quiet)
+	print('orsum server is ready at {}'.format('http://{}:{}'.format(args.host, server.server_address[1]) if args.port is not None else args.socket))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		service.stop()
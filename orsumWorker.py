@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Ozan
+
+Batch execution of orsum runs through a work queue on a shared filesystem.
+A job is a JSON file with the command-line arguments of an orsum run. The
+queue folder contains four subfolders: pending, claimed, done and failed.
+Jobs are submitted to pending, and a worker claims a job by renaming it into
+claimed; the rename is atomic, so exactly one worker gets each job, without a
+broker service. Finished jobs are moved to done or failed together with their
+status, and a completion marker is written to the output folder of each
+successful run. Any number of workers can be started on any host sharing the
+filesystem. GMT models are cached as pickle files keyed by the hash of the GMT
+file, so each GMT file is parsed once for all the workers.
+While a job runs, its worker updates the modification time of the claimed job
+file every HEARTBEAT_INTERVAL seconds. Jobs of workers that died, e.g. on the
+loss of a node or an out-of-memory kill, stay in claimed without updates, and
+are moved back to pending by requeueStaleJobs (the requeue command).
+"""
+
+from orsum import getArgumentsDict, runFromArguments
+from termCombinationLib import readGmtModel
+from resultCache import hashFile
+from argparse import ArgumentParser, REMAINDER
+import json
+import os
+import pickle
+import socket
+import threading
+import time
+import traceback
+
+
+PENDING_FOLDER='pending'
+CLAIMED_FOLDER='claimed'
+DONE_FOLDER='done'
+FAILED_FOLDER='failed'
+COMPLETION_MARKER='orsum.done'
+
+#Seconds between the updates of the modification time of a claimed job file
+HEARTBEAT_INTERVAL=60.0
+
+
+def createQueue(queueFolder):
+	"""
+	Creates the subfolders of the queue if they do not exist.
+
+	:param str queueFolder: Path of the queue folder
+	"""
+
+	for folder in [PENDING_FOLDER, CLAIMED_FOLDER, DONE_FOLDER, FAILED_FOLDER]:
+		os.makedirs(os.path.join(queueFolder, folder), exist_ok=True)
+
+
+def submitJob(queueFolder, arguments, jobName=None):
+	"""
+	Submits an orsum run to the queue. The job file is written under a
+	temporary name and renamed into pending, so workers never see a partial job.
+
+	:param str queueFolder: Path of the queue folder
+	:param list arguments: Command-line arguments of orsum.py
+	:param str jobName: Name of the job, by default created from the submission time and process
+	:return: **jobName** (*str*) – Name of the job
+	"""
+
+	createQueue(queueFolder)
+	if jobName is None:
+		jobName='{:.6f}-{}-{}'.format(time.time(), socket.gethostname(), os.getpid())
+	jobPath=os.path.join(queueFolder, PENDING_FOLDER, jobName+'.json')
+	temporaryPath=os.path.join(queueFolder, '{}.json.tmp-{}'.format(jobName, os.getpid()))
+	with open(temporaryPath, 'w') as f:
+		json.dump({'arguments':list(arguments), 'submitted':time.time()}, f)
+	os.rename(temporaryPath, jobPath)
+	return jobName
+
+
+def claimJob(queueFolder, workerId):
+	"""
+	Claims the oldest pending job by renaming it into claimed. If another
+	worker renames it first, the next job is tried. The modification time of
+	the claimed job file is set to the claim time.
+
+	:param str queueFolder: Path of the queue folder
+	:param str workerId: ID of the worker, added to the name of the claimed job
+	:return: **claimedJob** (*tuple*) – Name of the job and path of the claimed job file, None if there is no pending job
+	"""
+
+	pendingFolder=os.path.join(queueFolder, PENDING_FOLDER)
+	for fileName in sorted(os.listdir(pendingFolder)):
+		if not fileName.endswith('.json'):
+			continue
+		jobName=fileName[:-5]
+		claimedPath=os.path.join(queueFolder, CLAIMED_FOLDER, '{}@{}.json'.format(jobName, workerId))
+		try:
+			os.rename(os.path.join(pendingFolder, fileName), claimedPath)
+		except OSError:#Claimed by another worker
+			continue
+		os.utime(claimedPath)
+		return jobName, claimedPath
+	return None
+
+
+def keepClaimAlive(claimedPath, stopEvent, heartbeatInterval=HEARTBEAT_INTERVAL):
+	"""
+	Updates the modification time of a claimed job file every
+	heartbeatInterval seconds until stopEvent is set, so that the job is not
+	taken for the job of a dead worker.
+
+	:param str claimedPath: Path of the claimed job file
+	:param threading.Event stopEvent: Event set when the job is finished
+	:param float heartbeatInterval: Seconds between the updates
+	"""
+
+	while not stopEvent.wait(heartbeatInterval):
+		try:
+			os.utime(claimedPath)
+		except OSError:#Requeued or finished
+			return
+
+
+def requeueStaleJobs(queueFolder, olderThan):
+	"""
+	Moves the claimed jobs whose files have not been updated for olderThan
+	seconds back to pending, to be claimed again. Their workers are taken to
+	be dead, so olderThan must be well above the heartbeat interval of the
+	workers and the clock differences between the hosts.
+
+	:param str queueFolder: Path of the queue folder
+	:param float olderThan: Seconds since the last update of a claimed job file
+	:return: **jobNames** (*list*) – Names of the requeued jobs
+	"""
+
+	createQueue(queueFolder)
+	claimedFolder=os.path.join(queueFolder, CLAIMED_FOLDER)
+	jobNames=[]
+	for fileName in sorted(os.listdir(claimedFolder)):
+		if not fileName.endswith('.json'):
+			continue
+		claimedPath=os.path.join(claimedFolder, fileName)
+		jobName=fileName[:-5].rsplit('@', 1)[0]
+		try:
+			if time.time()-os.path.getmtime(claimedPath)<olderThan:
+				continue
+			os.rename(claimedPath, os.path.join(queueFolder, PENDING_FOLDER, jobName+'.json'))
+		except OSError:#Finished in the meantime
+			continue
+		jobNames.append(jobName)
+	return jobNames
+
+
+def finishJob(queueFolder, jobName, claimedPath, status):
+	"""
+	Moves a claimed job to done or failed, with its status added.
+
+	:param str queueFolder: Path of the queue folder
+	:param str jobName: Name of the job
+	:param str claimedPath: Path of the claimed job file
+	:param dict status: Status of the run, with 'succeeded' set
+	"""
+
+	with open(claimedPath, 'r') as f:
+		job=json.load(f)
+	job.update(status)
+	with open(claimedPath, 'w') as f:
+		json.dump(job, f)
+	os.rename(claimedPath, os.path.join(queueFolder, DONE_FOLDER if status['succeeded'] else FAILED_FOLDER, jobName+'.json'))
+
+
+def getCachedGmtModel(gmtCacheFolder, gmtPath, loadedGmtModels=None):
+	"""
+	Returns the GMT model of a GMT file from the GMT cache, keyed by the hash
+	of the file. If it is not cached, the GMT file is read and the model is
+	stored under a temporary name and renamed, so other workers never read a
+	partial model.
+
+	:param str gmtCacheFolder: Path of the GMT cache folder
+	:param str gmtPath: Path of the GMT file
+	:param dict loadedGmtModels: Dictionary mapping hashes to GMT models already loaded by this worker, updated with the model
+	:return: **gmtModel** (*GmtModel*) – GMT model of the whole GMT file
+	"""
+
+	gmtHash=hashFile(gmtPath)
+	if loadedGmtModels is not None and gmtHash in loadedGmtModels:
+		return loadedGmtModels[gmtHash]
+	modelPath=os.path.join(gmtCacheFolder, gmtHash+'.pickle')
+	try:
+		with open(modelPath, 'rb') as f:
+			gmtModel=pickle.load(f)
+	except (IOError, EOFError, pickle.UnpicklingError):
+		gmtModel=readGmtModel(gmtPath)
+		os.makedirs(gmtCacheFolder, exist_ok=True)
+		temporaryPath='{}.tmp-{}-{}'.format(modelPath, socket.gethostname(), os.getpid())
+		with open(temporaryPath, 'wb') as f:
+			pickle.dump(gmtModel, f, protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(temporaryPath, modelPath)
+	if loadedGmtModels is not None:
+		loadedGmtModels[gmtHash]=gmtModel
+	return gmtModel
+
+
+def runJob(claimedPath, gmtCacheFolder=None, loadedGmtModels=None):
+	"""
+	Runs the orsum job in a claimed job file. On success, the completion
+	marker is written to the output folder of the run. A run stopped on an
+	error written to its log file, e.g. when there is no valid file to be
+	summarized, fails without the completion marker.
+
+	:param str claimedPath: Path of the claimed job file
+	:param str gmtCacheFolder: Path of the GMT cache folder, None not to cache GMT models
+	:param dict loadedGmtModels: Dictionary mapping hashes to GMT models already loaded by this worker
+	:return: **status** (*dict*) – Whether the run succeeded, its start and end times and the error if it failed
+	"""
+
+	startTime=time.time()
+	try:
+		with open(claimedPath, 'r') as f:
+			job=json.load(f)
+		argsDict=getArgumentsDict(job['arguments'])
+		gmtModel=None
+		if gmtCacheFolder is not None and not isinstance(argsDict['gmt'], list):
+			gmtModel=getCachedGmtModel(gmtCacheFolder, argsDict['gmt'], loadedGmtModels)
+		if not runFromArguments(argsDict, gmtModel):
+			return {'succeeded':False, 'started':startTime, 'finished':time.time(), 'error':'orsum stopped without results, see {}'.format(os.path.join(argsDict['outputFolder'], 'log.txt'))}
+		with open(os.path.join(argsDict['outputFolder'], COMPLETION_MARKER), 'w') as f:
+			f.write('{}\n'.format(time.time()))
+		return {'succeeded':True, 'started':startTime, 'finished':time.time()}
+	except (Exception, SystemExit):#orsum exits on invalid arguments and unreadable files
+		return {'succeeded':False, 'started':startTime, 'finished':time.time(), 'error':traceback.format_exc()}
+
+
+def work(queueFolder, gmtCacheFolder=None, exitWhenEmpty=False, pollInterval=5.0, workerId=None, heartbeatInterval=HEARTBEAT_INTERVAL):
+	"""
+	Claims and runs jobs until the queue is empty, or forever if exitWhenEmpty
+	is False, checking the queue every pollInterval seconds when it is empty.
+	The claimed job file is kept alive with keepClaimAlive while a job runs.
+
+	:param str queueFolder: Path of the queue folder
+	:param str gmtCacheFolder: Path of the GMT cache folder, None not to cache GMT models
+	:param bool exitWhenEmpty: Whether the worker stops when there is no pending job
+	:param float pollInterval: Seconds to wait before checking an empty queue again
+	:param str workerId: ID of the worker, by default host name and process ID
+	:param float heartbeatInterval: Seconds between the updates of the claimed job file
+	:return: **jobNames** (*list*) – Names of the jobs run by the worker
+	"""
+
+	createQueue(queueFolder)
+	if workerId is None:
+		workerId='{}-{}'.format(socket.gethostname(), os.getpid())
+	loadedGmtModels=dict()
+	jobNames=[]
+	while True:
+		claimedJob=claimJob(queueFolder, workerId)
+		if claimedJob is None:
+			if exitWhenEmpty:
+				return jobNames
+			time.sleep(pollInterval)
+			continue
+		jobName, claimedPath=claimedJob
+		stopEvent=threading.Event()
+		heartbeat=threading.Thread(target=keepClaimAlive, args=(claimedPath, stopEvent, heartbeatInterval), daemon=True)
+		heartbeat.start()
+		try:
+			status=runJob(claimedPath, gmtCacheFolder, loadedGmtModels)
+		finally:
+			stopEvent.set()
+			heartbeat.join()
+		status['worker']=workerId
+		finishJob(queueFolder, jobName, claimedPath, status)
+		jobNames.append(jobName)
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser(description = 'orsum work queue on a shared filesystem')
+	subparsers = parser.add_subparsers(dest = 'command', required = True)
+	submitParser = subparsers.add_parser('submit', help = 'Submit an orsum run, given by the orsum.py arguments after --.')
+	submitParser.add_argument('--queue', required = True, help = 'Path of the queue folder.')
+	submitParser.add_argument('--jobName', default = None, help = 'Name of the job. By default, it is created from the submission time, host and process.')
+	submitParser.add_argument('arguments', nargs = REMAINDER, help = 'orsum.py arguments.')
+	workParser = subparsers.add_parser('work', help = 'Run the jobs in the queue.')
+	workParser.add_argument('--queue', required = True, help = 'Path of the queue folder.')
+	workParser.add_argument('--gmtCache', default = None, help = 'Path of the folder caching the GMT models, shared by the workers. By default, GMT files are read for each job.')
+	workParser.add_argument('--exitWhenEmpty', action = 'store_true', help = 'Stop when there is no pending job. By default, the worker waits for new jobs.')
+	workParser.add_argument('--pollInterval', type = float, default = 5.0, help = 'Seconds to wait before checking an empty queue again. By default, pollInterval = 5')
+	requeueParser = subparsers.add_parser('requeue', help = 'Move the claimed jobs of dead workers back to pending.')
+	requeueParser.add_argument('--queue', required = True, help = 'Path of the queue folder.')
+	requeueParser.add_argument('--olderThan', type = float, required = True, help = 'Seconds since the last update of a claimed job file, by its worker every {:g} seconds, after which the job is requeued.'.format(HEARTBEAT_INTERVAL))
+	args = parser.parse_args()
+
+	if args.command == 'submit':
+		arguments = args.arguments[1:] if args.arguments[:1] == ['--'] else args.arguments
+		print(submitJob(args.queue, arguments, args.jobName))
+	elif args.command == 'requeue':
+		for jobName in requeueStaleJobs(args.queue, args.olderThan):
+			print(jobName)
+	else:
+		work(args.queue, args.gmtCache, args.exitWhenEmpty, args.pollInterval)
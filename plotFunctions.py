@@ -17,6 +17,7 @@ import seaborn as sns
 import pandas as ps
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
+import matplotlib.ticker as ticker
 
 # FUNCTIONS
 
@@ -48,14 +49,14 @@ def orsum_readResultFile(inputFile):
 		with open(inputFile, 'r') as resultsFileHandler:
 			headerLine = resultsFileHandler.readline()
 			lheaderLine = headerLine.rstrip('\n').split('\t')
-			for r in range(5, len(lheaderLine)):
-				if lheaderLine[r].endswith(' term rank'):
-					lheaderLine[r] = lheaderLine[r][:-10]
-				resultsId.append(lheaderLine[r])
+			# Rank columns of the analyses, other columns like the stability are skipped
+			rankColumns = [r for r in range(5, len(lheaderLine)) if lheaderLine[r].endswith(' term rank')]
+			for r in rankColumns:
+				resultsId.append(lheaderLine[r][:-10])
 			for line in resultsFileHandler:
 				lLine = line.rstrip('\n').split('\t')
 				indRanks = []
-				for r in range(5, len(lLine)):
+				for r in rankColumns:
 					if(lLine[r] == 'None'):
 						indRanks.append(np.nan)
 					else:
@@ -110,6 +111,7 @@ def orsum_barplot(df, nbTerm, sizeMax, sizeMin, plotName, ticks):
 	plt.xlim(0, max(df_filt['sizes']))
 	# Save and close plot
 	plt.savefig(plotName, bbox_inches = 'tight', dpi = 300)
+	plt.close()
 
 def orsum_heatmap(allRanks_array, df, nbTerm, plotName, conditionName, palette_cmap, ticks):
 	"""
@@ -137,6 +139,7 @@ def orsum_heatmap(allRanks_array, df, nbTerm, plotName, conditionName, palette_c
 	ax.collections[0].colorbar.ax.set_ylim(df['ranks'].max(), 0)
 	# Save and close plot
 	plt.savefig(plotName, bbox_inches = 'tight', dpi = 300)
+	plt.close()
 
 def calculateQuartileFromRanks(allRanks_array):
 	"""
@@ -148,26 +151,11 @@ def calculateQuartileFromRanks(allRanks_array):
 	"""
 	# Calcul quartiles for each condition
 	allRanks_df = ps.DataFrame(allRanks_array)
-	Q_array = allRanks_df.quantile(q=[0.25, 0.50, 0.75])
-	# Create new array with quartiles
-	allQ = []
-	for line in allRanks_array:
-		quantiles = []
-		for ind in range(len(line)):
-			rank = line[ind]
-			if (np.isnan(rank)):
-				quantiles.append(np.nan)
-			else:
-				if rank <= Q_array[ind][0.25]:
-					quantiles.append(1)
-				if Q_array[ind][0.25] < rank <= Q_array[ind][0.50]:
-					quantiles.append(2)
-				if Q_array[ind][0.50] < rank <= Q_array[ind][0.75]:
-					quantiles.append(3)
-				if rank > Q_array[ind][0.75]:
-					quantiles.append(4)
-		quantiles_array = np.array(quantiles)
-		allQ.append(quantiles_array)
+	Q_array = allRanks_df.quantile(q=[0.25, 0.50, 0.75]).to_numpy()
+	# Create new array with quartiles, all the ranks of a condition at once
+	allRanks_array = np.asarray(allRanks_array, dtype = float)
+	allQ = 1.0 + (allRanks_array > Q_array[0]) + (allRanks_array > Q_array[1]) + (allRanks_array > Q_array[2])
+	allQ[np.isnan(allRanks_array)] = np.nan
 	return(allQ)
 
 
@@ -207,6 +195,113 @@ def orsum_heatmap_quartile_quantitative(quartiles_array, df, nbTerm, plotName, c
 	plt.savefig(plotName, bbox_inches = 'tight', dpi = 300)
 	plt.close()
 
+def aggregateRows(array, maxRows):
+	"""
+	Aggregate consecutive rows of an array so that it has at most maxRows rows.
+	Each block of rows is replaced by its minimum in each condition, ignoring
+	missing values, so the best quartile of the block is displayed.
+
+	:param numpy.ndarray array: Array with the quartile for each analysis
+	:param int maxRows: Maximum number of rows
+
+	:returns:
+		- **aggregated** (*numpy.ndarray*) – Array with at most maxRows rows
+		- **blockSize** (*int*) – Number of rows aggregated in each row
+	"""
+	if(len(array) <= maxRows):
+		return(array, 1)
+	blockSize = int(np.ceil(len(array) / maxRows))
+	nbBlocks = int(np.ceil(len(array) / blockSize))
+	padded = np.full((nbBlocks * blockSize, array.shape[1]), np.nan)
+	padded[:len(array)] = array
+	aggregated = np.fmin.reduce(padded.reshape(nbBlocks, blockSize, array.shape[1]), axis = 1)
+	return(aggregated, blockSize)
+
+
+def orsum_heatmap_large(quartiles_array, df, plotName, conditionName, maxRows = 2000, maxLabels = 100, firstTerm = 1):
+	"""
+	Create and save heatmap of the quartiles of all the representative terms.
+	The quartiles are drawn as a single raster image instead of a patch for
+	each cell, so the render time grows linearly with the number of cells.
+	Above maxRows, consecutive rows are aggregated by aggregateRows.
+	Term and analysis names are displayed up to maxLabels rows and columns,
+	otherwise rows are numbered by the position of the terms.
+	Same discrete color map as orsum_heatmap_quartile_quantitative.
+
+	:param numpy.ndarray quartiles_array: Array with the quartile for each analysis. Created by calculateQuartileFromRanks() function.
+	:param pandas.DataFrame df: Data frame with 4 columns (sizes, labels, ranks, colors). Created by orsum_readResultFile() function.
+	:param str plotName: Path and name of the plot created by this function.
+	:param list conditionName: List of analysis names.
+	:param int maxRows: Maximum number of rows of the image.
+	:param int maxLabels: Maximum number of term or analysis names displayed.
+	:param int firstTerm: Position of the first term, used to number the rows.
+
+	:return: **plotName** (*str*) – Path and name of the plot created by this function, with extension.
+	"""
+	# Color for heatmap
+	nbMax = 4
+	quartilePalette_cmap = sns.cubehelix_palette(light=.8, n_colors=nbMax, as_cmap=True, reverse=True).with_extremes(bad = 'white')
+	bounds = [1, 2, 3, 4, 5]
+	norm = colors.BoundaryNorm(bounds, quartilePalette_cmap.N)
+
+	array, blockSize = aggregateRows(np.asarray(quartiles_array, dtype = float), maxRows)
+	nbRows, nbColumns = array.shape
+	showTermNames = blockSize == 1 and nbRows <= maxLabels
+	# Create plot
+	sns.set(font_scale = 0.5)
+	figsize = (min(max(6, 0.25 * nbColumns), 40), min(max(6, 0.15 * nbRows), 40) if showTermNames else 12)
+	fig, ax = plt.subplots(figsize = figsize)
+	image = ax.imshow(np.ma.masked_invalid(array), cmap = quartilePalette_cmap, norm = norm, aspect = 'auto', interpolation = 'nearest')
+	ax.grid(False)
+	ax.set_title('Representative term ranks', fontsize = 10)
+	# Labels
+	if(nbColumns <= maxLabels):
+		ax.set_xticks(range(nbColumns))
+		ax.set_xticklabels(conditionName, rotation = 90)
+	else:
+		ax.set_xlabel('{} analyses'.format(nbColumns))
+	if(showTermNames):
+		ax.set_yticks(range(nbRows))
+		ax.set_yticklabels(df['labels'][0:nbRows])
+	else:
+		ax.yaxis.set_major_locator(ticker.MaxNLocator(integer = True))
+		ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, position: '{}'.format(int(y) * blockSize + firstTerm)))
+		if(blockSize > 1):
+			ax.set_ylabel('Representative terms ({} terms per row, best quartile shown)'.format(blockSize))
+		else:
+			ax.set_ylabel('Representative terms')
+	# Colorbar
+	colorbar = fig.colorbar(image, ax = ax, shrink = 0.5)
+	colorbar.ax.set_ylim(5, 1)
+	colorbar.set_ticks([1.5, 2.5, 3.5, 4.5])
+	colorbar.set_ticklabels(["Q1", "Q2", "Q3", "Q4"])
+	colorbar.set_label("Quartiles")
+	# Save and close plot
+	fig.savefig(plotName + '.png', bbox_inches = 'tight', dpi = 300 if max(figsize) <= 20 else 150)
+	plt.close(fig)
+	return(plotName + '.png')
+
+
+def orsum_heatmap_tiles(quartiles_array, df, plotName, conditionName, tileRows):
+	"""
+	Create and save the heatmap of all the representative terms as tiles of
+	tileRows terms, without aggregation. Tiles are numbered from 1.
+
+	:param numpy.ndarray quartiles_array: Array with the quartile for each analysis. Created by calculateQuartileFromRanks() function.
+	:param pandas.DataFrame df: Data frame with 4 columns (sizes, labels, ranks, colors). Created by orsum_readResultFile() function.
+	:param str plotName: Path and name of the plots created by this function, without tile number.
+	:param list conditionName: List of analysis names.
+	:param int tileRows: Number of terms in each tile.
+
+	:return: **plotNames** (*list*) – Paths and names of the plots created by this function, with extension.
+	"""
+	plotNames = []
+	for tileNo, start in enumerate(range(0, len(quartiles_array), tileRows)):
+		tilePlotName = '{}-{}'.format(plotName, tileNo + 1)
+		plotNames.append(orsum_heatmap_large(quartiles_array = quartiles_array[start:start + tileRows], df = df[start:start + tileRows], plotName = tilePlotName, conditionName = conditionName, maxRows = tileRows, maxLabels = tileRows, firstTerm = start + 1))
+	return(plotNames)
+
+
 def orsum_linePlot(df, plotName):
 	"""
 	Create and save scatterplot of the size of represented terms from orsum.py.
@@ -227,6 +322,7 @@ def orsum_linePlot(df, plotName):
 	plt.ylabel('Number of represented terms', fontsize = 15)
 	# Save and close plot
 	plt.savefig(plotName, bbox_inches = 'tight', dpi = 300)
+	plt.close()
 
 def createBoundaries4Colorbar(df, step):
 	"""
@@ -246,7 +342,7 @@ def createBoundaries4Colorbar(df, step):
 	return(boundariesCB)
 
 
-def orsum_plot(inputFile, outputDir, threshold, heatmapName = 'Heatmap'):
+def orsum_plot(inputFile, outputDir, threshold, heatmapName = 'Heatmap', allTermsHeatmapName = None, tileRows = None):
 	"""
 	Main function.
 
@@ -258,6 +354,10 @@ def orsum_plot(inputFile, outputDir, threshold, heatmapName = 'Heatmap'):
 	:param str inputFile: Path name of the orsum results file (termSummaryXX-Summary.tsv).
 	:param str outputDir: Folder path name to write the results.
 	:param int threshold: Number of top results you want to display (MAX = 50)
+	:param str allTermsHeatmapName: Name of the heatmap of all the representative terms, None not to create it.
+	:param int tileRows: Number of terms in each tile of the heatmap of all the representative terms, None not to create tiles.
+
+	:return: **allTermsHeatmapNames** (*list*) – Paths and names of the heatmaps of all the representative terms
 	"""
 	# PARAMETERS
 	barplotName = '{}{}{}'.format(outputDir, os.sep, 'Barplot')
@@ -278,4 +378,11 @@ def orsum_plot(inputFile, outputDir, threshold, heatmapName = 'Heatmap'):
 	orsum_barplot(df = df, nbTerm = threshold, sizeMax = df['ranks'].max(), sizeMin = df['ranks'].min(), plotName = barplotName, ticks = boundariesCB)
 	#orsum_heatmap(allRanks_array = allRanks_array, df = df, nbTerm = threshold, plotName = heatmapName, conditionName = resultsId, palette_cmap = palette_cmap, ticks = boundariesCB)
 	orsum_heatmap_quartile_quantitative(quartiles_array = allQuartiles_array, df = df, nbTerm = threshold, plotName = heatmapQuartQuantitativeName, conditionName = resultsId)
+	allTermsHeatmapNames = []
+	if(allTermsHeatmapName is not None):
+		allTermsHeatmapName = '{}{}{}'.format(outputDir, os.sep, allTermsHeatmapName)
+		allTermsHeatmapNames.append(orsum_heatmap_large(quartiles_array = allQuartiles_array, df = df, plotName = allTermsHeatmapName, conditionName = resultsId))
+		if(tileRows is not None):
+			allTermsHeatmapNames.extend(orsum_heatmap_tiles(quartiles_array = allQuartiles_array, df = df, plotName = allTermsHeatmapName, conditionName = resultsId, tileRows = tileRows))
+	return(allTermsHeatmapNames)
 
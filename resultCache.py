@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Ozan
+
+Content-addressed cache of orsum results.
+Keys are hashes of the contents of the GMT and input files, the parameters and
+the orsum version. The cache folder contains two subfolders:
+results, with one folder of output files and term summary per key, and
+filteredLists, with one JSON file of filtered terms per input file and key.
+Entries are evicted in least recently used order when the cache is larger
+than its maximum size.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+
+RESULTS_FOLDER='results'
+FILTERED_LISTS_FOLDER='filteredLists'
+TERM_SUMMARY_FILE='termSummary.json'
+
+
+def hashFile(filePath):
+	"""
+	Returns the SHA-256 hash of the content of a file.
+
+	:param str filePath: Path of the file
+	:return: **fileHash** (*str*) – Hexadecimal hash
+	"""
+
+	fileHash=hashlib.sha256()
+	with open(filePath, 'rb') as f:
+		for block in iter(lambda: f.read(2**20), b''):
+			fileHash.update(block)
+	return fileHash.hexdigest()
+
+
+def createCacheKey(*parts):
+	"""
+	Returns a cache key for the given parts, which must be JSON serializable.
+
+	:return: **key** (*str*) – Hexadecimal hash of the parts
+	"""
+
+	return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def getCachedResult(cacheFolder, key):
+	"""
+	Returns the folder of the cached result with the given key and marks it
+	as recently used.
+
+	:param str cacheFolder: Path of the cache folder
+	:param str key: Cache key
+	:return: **resultFolder** (*str*) – Folder of the cached result, None if it is not in the cache
+	"""
+
+	resultFolder=os.path.join(cacheFolder, RESULTS_FOLDER, key)
+	if not os.path.isdir(resultFolder):
+		return None
+	os.utime(resultFolder)
+	return resultFolder
+
+
+def copyCachedResult(resultFolder, outputFolder):
+	"""
+	Copies the output files of a cached result to the output folder.
+
+	:param str resultFolder: Folder of the cached result
+	:param str outputFolder: Path of the output folder
+	"""
+
+	for fileName in os.listdir(resultFolder):
+		if fileName!=TERM_SUMMARY_FILE:
+			shutil.copyfile(os.path.join(resultFolder, fileName), os.path.join(outputFolder, fileName))
+
+
+def readCachedTermSummary(resultFolder):
+	"""
+	Reads the term summary of a cached result.
+
+	:param str resultFolder: Folder of the cached result
+	:return: **termSummary** (*list*) – Representative term list
+	"""
+
+	with open(os.path.join(resultFolder, TERM_SUMMARY_FILE), 'r') as f:
+		return json.load(f)
+
+
+def storeResult(cacheFolder, key, outputFolder, fileNames, termSummary):
+	"""
+	Stores the output files and the term summary of a run in the cache. The
+	files are copied to a temporary folder which is then renamed, so other
+	processes never see a partially stored result.
+
+	:param str cacheFolder: Path of the cache folder
+	:param str key: Cache key
+	:param str outputFolder: Path of the output folder of the run
+	:param list fileNames: Names of the output files in the output folder
+	:param list termSummary: Representative term list
+	"""
+
+	resultFolder=os.path.join(cacheFolder, RESULTS_FOLDER, key)
+	temporaryFolder='{}.tmp-{}'.format(resultFolder, os.getpid())
+	os.makedirs(temporaryFolder, exist_ok=True)
+	for fileName in fileNames:
+		shutil.copyfile(os.path.join(outputFolder, fileName), os.path.join(temporaryFolder, fileName))
+	with open(os.path.join(temporaryFolder, TERM_SUMMARY_FILE), 'w') as f:
+		json.dump(termSummary, f)
+	try:
+		os.rename(temporaryFolder, resultFolder)
+	except OSError:#Stored by another process in the meantime
+		shutil.rmtree(temporaryFolder, ignore_errors=True)
+
+
+def getCachedFilteredList(cacheFolder, key):
+	"""
+	Returns the cached filtered terms of an input file and marks them as
+	recently used.
+
+	:param str cacheFolder: Path of the cache folder
+	:param str key: Cache key
+	:return: **filteredList** (*tuple*) – Filtered term IDs and the messages of the filtering, None if they are not in the cache
+	"""
+
+	filePath=os.path.join(cacheFolder, FILTERED_LISTS_FOLDER, key+'.json')
+	try:
+		with open(filePath, 'r') as f:
+			filteredList=json.load(f)
+	except (IOError, ValueError):
+		return None
+	os.utime(filePath)
+	return filteredList['termIds'], filteredList['messages']
+
+
+def storeFilteredList(cacheFolder, key, termIdsList, messages):
+	"""
+	Stores the filtered terms of an input file in the cache.
+
+	:param str cacheFolder: Path of the cache folder
+	:param str key: Cache key
+	:param list termIdsList: Filtered term IDs
+	:param list messages: Messages of the filtering
+	"""
+
+	folder=os.path.join(cacheFolder, FILTERED_LISTS_FOLDER)
+	os.makedirs(folder, exist_ok=True)
+	filePath=os.path.join(folder, key+'.json')
+	temporaryFilePath='{}.tmp-{}'.format(filePath, os.getpid())
+	with open(temporaryFilePath, 'w') as f:
+		json.dump({'termIds':termIdsList, 'messages':messages}, f)
+	os.replace(temporaryFilePath, filePath)
+
+
+def getCacheEntries(cacheFolder):
+	"""
+	Lists the entries in the cache.
+
+	:param str cacheFolder: Path of the cache folder
+	:return: **entries** (*list*) – Last use time, size in bytes and path of each entry
+	"""
+
+	entries=[]
+	resultsFolder=os.path.join(cacheFolder, RESULTS_FOLDER)
+	if os.path.isdir(resultsFolder):
+		for key in os.listdir(resultsFolder):
+			if '.tmp-' not in key:
+				resultFolder=os.path.join(resultsFolder, key)
+				size=sum(os.path.getsize(os.path.join(resultFolder, fileName)) for fileName in os.listdir(resultFolder))
+				entries.append((os.path.getmtime(resultFolder), size, resultFolder))
+	filteredListsFolder=os.path.join(cacheFolder, FILTERED_LISTS_FOLDER)
+	if os.path.isdir(filteredListsFolder):
+		for fileName in os.listdir(filteredListsFolder):
+			if '.tmp-' not in fileName:
+				filePath=os.path.join(filteredListsFolder, fileName)
+				entries.append((os.path.getmtime(filePath), os.path.getsize(filePath), filePath))
+	return entries
+
+
+def evictLeastRecentlyUsed(cacheFolder, maxCacheSize):
+	"""
+	Removes the least recently used entries until the cache is not larger
+	than maxCacheSize.
+
+	:param str cacheFolder: Path of the cache folder
+	:param int maxCacheSize: The maximum size of the cache in bytes
+	:return: **removedPaths** (*list*) – Paths of the removed entries
+	"""
+
+	entries=sorted(getCacheEntries(cacheFolder))
+	cacheSize=sum(entry[1] for entry in entries)
+	removedPaths=[]
+	for lastUseTime, size, path in entries:
+		if cacheSize<=maxCacheSize:
+			break
+		if os.path.isdir(path):
+			shutil.rmtree(path, ignore_errors=True)
+		else:
+			os.remove(path)
+		cacheSize=cacheSize-size
+		removedPaths.append(path)
+	return removedPaths
@@ -10,40 +10,317 @@ Functions for filtering
 import numpy as np
 from scipy.cluster.hierarchy import dendrogram, linkage
 import pandas as pd
+from scipy.sparse import csr_matrix
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import hashlib
+import os
+from collections.abc import Mapping
+
+#When rules are applied with multiple threads, the candidates of a
+#representative term are split into chunks at least this large. Terms with
+#fewer candidates are evaluated in batches of one representative term per
+#thread.
+MIN_CANDIDATES_PER_THREAD=4096
+
+#Separator between the namespace of a GMT file and the term ID
+NAMESPACE_SEPARATOR=':'
 
 ##############################################################################
 
 
 
-def applyRule(termSummary, termIdToGenesDict, maxRepresentativeTermSize, process):
+def applyRule(termSummary, termIdToGenesDict, maxRepresentativeTermSize, process, numberOfThreads=1, maxMemory=None, containmentIndex=None):
 	"""
-	This function applies the specified rule ("process") on each pair of terms.
+	This function applies the specified rule ("process") on the terms of termSummary.
+	Starting with the top term, each representative term is given to the rule
+	together with the indices of all the representative terms ranked below it,
+	and the rule returns a boolean mask marking the ones it represents.
+	Representative terms are always processed one by one in rank order, with
+	multiple threads the candidates of each representative term are split
+	among the threads, so the result does not depend on numberOfThreads.
 
 	:param list termSummary: Representative term list to be summarized with the application of rules. It is a list, each element is a list that contains term ID, the list of represented terms, rank
 	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
 	:param int maxRepresentativeTermSize: The maximum size of a representative term. Terms bigger than this size will not be discarded but also will not be able to represent other terms.
 	:param function process: The rule to be applied.
+	:param int numberOfThreads: Number of threads evaluating the rule.
+	:param int maxMemory: The maximum memory in bytes for the gene bitsets of the terms, None for no limit. Above it, gene sets are compared without bitsets.
+	:param ContainmentIndex containmentIndex: Precomputed superset relations of the terms, None to compare the gene sets.
 	:return: **termSummary** (*list*) – Representative term list after applying the rule
 	"""
 
-	#Starting with the top terms, term pairs are picked from the termSummary
-	#and the rule is applied to them.
-	for idNo in range(len(termSummary)-1):
-		termId=termSummary[idNo][0]
-		if termId!=-1:#Check if the term is still a representative term
-			for idNo2 in range(idNo+1, len(termSummary)):
-				termId2=termSummary[idNo2][0]
-				if  termId2!=-1:#Check if the term is still a representative term
-					termSummary=process(termSummary, termIdToGenesDict, maxRepresentativeTermSize, idNo, idNo2, termId, termId2)
-
-	#Remove terms that are represented by other terms
-	termSummary=[e for e in termSummary if e[0]!=-1]
+	#Terms that are represented by other terms are not generated
+	termSummary=list(generateRepresentatives(termSummary, termIdToGenesDict, maxRepresentativeTermSize, process, numberOfThreads, maxMemory, containmentIndex))
 	#Sort termSummary by rank (first term has the best/smallest rank)
 	termSummary.sort(key=lambda x: x[2])
 
 	return termSummary
 
 
+def generateRepresentatives(termSummary, termIdToGenesDict, maxRepresentativeTermSize, process, numberOfThreads=1, maxMemory=None, containmentIndex=None):
+	"""
+	Applies the rule like applyRule, but yields the representative terms one
+	at a time. A term is yielded as soon as its status is final: after the
+	terms ranked above it are processed it cannot be represented any more, and
+	after it is given to the rule its list of represented terms is complete.
+	The caller can stop early, e.g. after the top K representative terms, and
+	the terms below are never given to the rule as representatives, apart
+	from the rest of the batch with multiple threads.
+	Terms are yielded in the order of termSummary, which is the rank order
+	when termSummary is sorted by rank.
+
+	:param list termSummary: Representative term list to be summarized with the application of rules. It is a list, each element is a list that contains term ID, the list of represented terms, rank
+	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
+	:param int maxRepresentativeTermSize: The maximum size of a representative term.
+	:param function process: The rule to be applied.
+	:param int numberOfThreads: Number of threads evaluating the rule.
+	:param int maxMemory: The maximum memory in bytes for the gene bitsets of the terms, None for no limit.
+	:param ContainmentIndex containmentIndex: Precomputed superset relations of the terms, None to compare the gene sets.
+	:return: **representative** (*list*) – Generator of the remaining termSummary elements
+	"""
+
+	termIndex=indexTermSummary(termSummary, termIdToGenesDict, maxRepresentativeTermSize, maxMemory, containmentIndex)
+	isRepresentative=np.array([ts[0]!=-1 for ts in termSummary], dtype=bool)
+	executor=ThreadPoolExecutor(numberOfThreads) if numberOfThreads>1 else None
+
+	try:
+		#Starting with the top terms, each representative term is checked against
+		#all the representative terms below it in a single call to the rule.
+		idNo=0
+		while idNo<len(termSummary):
+			if not isRepresentative[idNo]:#Check if the term is still a representative term
+				idNo+=1
+				continue
+			candidateIdNos=np.flatnonzero(isRepresentative[idNo+1:])+(idNo+1)
+			if executor is None or len(candidateIdNos)//MIN_CANDIDATES_PER_THREAD>=2:
+				batch=[(idNo, candidateIdNos, evaluateRule(process, termIndex, idNo, candidateIdNos, executor, numberOfThreads))]
+			else:
+				batch=evaluateRuleBatch(process, termIndex, isRepresentative, idNo, executor, numberOfThreads)
+			#Results of the batch are applied in rank order. A term represented
+			#by a term above it in the batch is skipped, and only the candidates
+			#that are still representative terms are represented.
+			for batchIdNo, batchCandidateIdNos, isRepresented in batch:
+				if isRepresentative[batchIdNo]:
+					representedIdNos=batchCandidateIdNos[isRepresented&isRepresentative[batchCandidateIdNos]]
+					representTerms(termSummary, batchIdNo, representedIdNos)
+					isRepresentative[representedIdNos]=False
+					yield termSummary[batchIdNo]
+			idNo=batch[-1][0]+1
+	finally:
+		if executor is not None:
+			executor.shutdown()
+
+
+def evaluateRule(process, termIndex, idNo, candidateIdNos, executor=None, numberOfThreads=1):
+	"""
+	Calls the rule for a representative term and its candidates. If an
+	executor is given and there are at least two MIN_CANDIDATES_PER_THREAD
+	candidates, the candidates are split into chunks evaluated in parallel;
+	terms with fewer candidates are evaluated in batches by evaluateRuleBatch. NumPy releases the GIL in the array
+	operations of the rules, so the threads run on multiple cores. A rule only
+	looks at the representative term and each candidate, therefore the
+	concatenated masks are the same as the mask of a single call.
+
+	:param function process: The rule to be applied.
+	:param dict termIndex: Term index created by indexTermSummary
+	:param int idNo: Index of the representative term in termSummary
+	:param numpy.ndarray candidateIdNos: Indices of the candidate terms in termSummary
+	:param concurrent.futures.ThreadPoolExecutor executor: Executor running the chunks, None for a single call
+	:param int numberOfThreads: Number of threads of the executor
+	:return: **isRepresented** (*numpy.ndarray*) – Boolean mask of the candidates represented by the term
+	"""
+
+	numberOfChunks=min(numberOfThreads, len(candidateIdNos)//MIN_CANDIDATES_PER_THREAD)
+	if executor is None or numberOfChunks<2:
+		return process(termIndex, idNo, candidateIdNos)
+	chunks=np.array_split(candidateIdNos, numberOfChunks)
+	return np.concatenate(list(executor.map(lambda chunk: process(termIndex, idNo, chunk), chunks)))
+
+
+def evaluateRuleBatch(process, termIndex, isRepresentative, idNo, executor, numberOfThreads):
+	"""
+	Calls the rule for the next representative terms from idNo, one term per
+	thread, each one with the representative terms below it as candidates.
+	Rules only compare the representative term with each candidate, so the
+	mask of a term stays valid after the terms above it in the batch are
+	applied: only the candidates they represent have to be left out.
+
+	:param function process: The rule to be applied.
+	:param dict termIndex: Term index created by indexTermSummary
+	:param numpy.ndarray isRepresentative: Boolean mask of the terms that are still representative terms
+	:param int idNo: Index of the first representative term of the batch in termSummary
+	:param concurrent.futures.ThreadPoolExecutor executor: Executor running the rule calls
+	:param int numberOfThreads: Number of threads of the executor, the maximum size of the batch
+	:return: **batch** (*list*) – Index of each representative term of the batch, in order, with its candidates and the mask of the candidates it represents
+	"""
+
+	batchIdNos=np.flatnonzero(isRepresentative[idNo:])[:numberOfThreads]+idNo
+	candidateIdNosList=[np.flatnonzero(isRepresentative[batchIdNo+1:])+(batchIdNo+1) for batchIdNo in batchIdNos]
+	def evaluate(batchNo):
+		if len(candidateIdNosList[batchNo])==0:
+			return np.zeros(0, dtype=bool)
+		return process(termIndex, batchIdNos[batchNo], candidateIdNosList[batchNo])
+	return list(zip(batchIdNos, candidateIdNosList, executor.map(evaluate, range(len(batchIdNos)))))
+
+
+def representTerms(termSummary, idNo, representedIdNos):
+	"""
+	Lets the term at idNo represent the terms at representedIdNos.
+	Terms represented by the covered terms are copied under the representative
+	term, in order and without repetition. The covered terms are marked with -1.
+	The representative term gets the minimum of the ranks, which leaves its
+	rank unchanged when termSummary is sorted by rank.
+
+	:param list termSummary: Representative term list to be summarized
+	:param int idNo: Index of the representative term in termSummary
+	:param numpy.ndarray representedIdNos: Indices of the terms to be represented, in ascending order
+	"""
+
+	if len(representedIdNos)==0:
+		return
+	representedTerms=termSummary[idNo][1]
+	representedTermsSet=set(representedTerms)
+	for idNo2 in representedIdNos:
+		for termRepresentedByCoveredTerm in termSummary[idNo2][1]:
+			if termRepresentedByCoveredTerm not in representedTermsSet:
+				representedTerms.append(termRepresentedByCoveredTerm)
+				representedTermsSet.add(termRepresentedByCoveredTerm)
+		termSummary[idNo2][0]=-1
+		termSummary[idNo][2]=min(termSummary[idNo][2], termSummary[idNo2][2])
+
+
+def indexTermSummary(termSummary, termIdToGenesDict, maxRepresentativeTermSize, maxMemory=None, containmentIndex=None):
+	"""
+	Creates the term index given to the rules. Term sizes and gene bitsets are
+	computed on first use, so the rules that do not need them do not require
+	the genes of the terms. The lock guards this computation when the rules are
+	evaluated by multiple threads.
+
+	:param list termSummary: Representative term list to be summarized
+	:param GmtModel termIdToGenesDict: GMT model of the gene sets. A dictionary mapping term IDs to set of genes is also accepted.
+	:param int maxRepresentativeTermSize: The maximum size of a representative term.
+	:param int maxMemory: The maximum memory in bytes for the gene bitsets, None for no limit.
+	:param ContainmentIndex containmentIndex: Precomputed superset relations of the terms, None to compare the gene sets.
+	:return: **termIndex** (*dict*) – Term IDs of termSummary as an array and the information needed by the rules
+	"""
+
+	termIndex=dict()
+	termIndex['termIds']=np.array([ts[0] for ts in termSummary], dtype=object)
+	termIndex['gmtModel']=getGmtModel(termIdToGenesDict)
+	termIndex['maxRepresentativeTermSize']=maxRepresentativeTermSize
+	termIndex['maxMemory']=maxMemory
+	termIndex['containmentIndex']=containmentIndex
+	termIndex['containmentPositions']=None
+	termIndex['modelIndices']=None
+	termIndex['termSizes']=None
+	termIndex['geneBits']=None
+	termIndex['lock']=threading.RLock()
+	return termIndex
+
+
+def getModelIndices(termIndex):
+	"""
+	Returns the GMT model indices of the terms in the term index.
+
+	:param dict termIndex: Term index created by indexTermSummary
+	:return: **modelIndices** (*numpy.ndarray*) – Index of each term in the GMT model
+	"""
+
+	with termIndex['lock']:
+		if termIndex['modelIndices'] is None:
+			termIndex['modelIndices']=termIndex['gmtModel'].getIndices(termIndex['termIds'])
+	return termIndex['modelIndices']
+
+
+def getTermSizes(termIndex):
+	"""
+	Returns the sizes of the terms in the term index.
+
+	:param dict termIndex: Term index created by indexTermSummary
+	:return: **termSizes** (*numpy.ndarray*) – Size of each term
+	"""
+
+	with termIndex['lock']:
+		if termIndex['termSizes'] is None:
+			termIndex['termSizes']=termIndex['gmtModel'].termSizes[getModelIndices(termIndex)]
+	return termIndex['termSizes']
+
+
+def getTermGeneBits(termIndex):
+	"""
+	Returns the genes of the terms in the term index as bitsets. Each row is a
+	term, each bit is a gene among the genes of the terms in the term index.
+	If the bitsets would need more memory than termIndex['maxMemory'], they
+	are not created and None is returned.
+
+	:param dict termIndex: Term index created by indexTermSummary
+	:return: **geneBits** (*numpy.ndarray*) – 2D uint64 array of gene bitsets
+	"""
+
+	with termIndex['lock']:
+		if termIndex['geneBits'] is None:
+			gmtModel=termIndex['gmtModel']
+			rows, geneIndices=gmtModel.getGeneIndices(getModelIndices(termIndex))
+			#Only the genes of these terms get a bit
+			uniqueGeneIndices, bitNos=np.unique(geneIndices, return_inverse=True)
+			shape=(len(termIndex['termIds']), (len(uniqueGeneIndices)+63)//64)
+			if termIndex['maxMemory'] is not None and shape[0]*shape[1]*8>termIndex['maxMemory']:
+				termIndex['geneBits']=False
+			else:
+				bitNos=bitNos.astype(np.uint64)
+				geneBits=np.zeros(shape, dtype=np.uint64)
+				np.bitwise_or.at(geneBits, (rows, (bitNos>>np.uint64(6)).astype(np.int64)), np.left_shift(np.uint64(1), bitNos&np.uint64(63)))
+				termIndex['geneBits']=geneBits
+	if termIndex['geneBits'] is False:
+		return None
+	return termIndex['geneBits']
+
+
+def getContainmentPositions(termIndex):
+	"""
+	Returns the positions of the terms in the term index in its containment index.
+
+	:param dict termIndex: Term index created by indexTermSummary
+	:return: **containmentPositions** (*numpy.ndarray*) – Position of each term in the containment index
+	"""
+
+	with termIndex['lock']:
+		if termIndex['containmentPositions'] is None:
+			termIndex['containmentPositions']=termIndex['containmentIndex'].getIndices(termIndex['termIds'])
+	return termIndex['containmentPositions']
+
+
+def areSubsets(termIndex, idNo, idNos):
+	"""
+	Checks whether the genes of each term at idNos are all among the genes of
+	the term at idNo. If the term index has a containment index, the
+	precomputed relations are used. Otherwise, gene bitsets are used if they
+	fit in the memory limit, or else the genes of each term at idNos that are
+	in the term at idNo are counted, which needs memory only proportional to
+	the number of genes.
+
+	:param dict termIndex: Term index created by indexTermSummary
+	:param int idNo: Index of the term in termSummary, supposed to be superset
+	:param numpy.ndarray idNos: Indices of the terms in termSummary, supposed to be subsets
+	:return: **isSubset** (*numpy.ndarray*) – Boolean mask of the terms at idNos that are subsets
+	"""
+
+	if termIndex['containmentIndex'] is not None:
+		containmentPositions=getContainmentPositions(termIndex)
+		subtermIndices=termIndex['containmentIndex'].subtermIndices[containmentPositions[idNo]]
+		return np.isin(containmentPositions[idNos], subtermIndices) | (containmentPositions[idNos]==containmentPositions[idNo])
+	geneBits=getTermGeneBits(termIndex)
+	if geneBits is not None:
+		return ~np.any(geneBits[idNos] & ~geneBits[idNo], axis=1)
+	gmtModel=termIndex['gmtModel']
+	modelIndices=getModelIndices(termIndex)
+	isGeneOfTerm=np.zeros(len(gmtModel.geneIds), dtype=bool)
+	isGeneOfTerm[gmtModel.getGeneIndices(modelIndices[[idNo]])[1]]=True
+	rows, geneIndices=gmtModel.getGeneIndices(modelIndices[idNos])
+	return np.bincount(rows, weights=isGeneOfTerm[geneIndices], minlength=len(idNos))==getTermSizes(termIndex)[idNos]
+
+
 ##############################################################################
 ##############################################################################
 ##############################################################################
@@ -51,70 +328,274 @@ def applyRule(termSummary, termIdToGenesDict, maxRepresentativeTermSize, process
 '''
 General description on how rules work:
 
-Rules take information on two terms from the termSummary.
-These two terms are evaluated whether they satisfy the conditions of the rule.
-If term A will represent term B, the terms represented by term B
-(this includes itself) are appended to the list of terms represented by
-term A. Term B's termId which is stored in termSummary[idNoB][0] is set to -1
+A rule takes one representative term and the indices of the candidate terms,
+the representative terms ranked below it, in the termSummary. All the
+candidates are evaluated at once, and the rule returns a boolean mask of the
+candidates that satisfy its conditions. Rules only decide, they do not change
+termSummary. If term A represents term B, applyRule appends the terms
+represented by term B (this includes itself) to the list of terms represented
+by term A. Term B's termId which is stored in termSummary[idNoB][0] is set to -1
 to mark that it is not a representative term any more. termId information is
 not lost because it is already copied under term A (termSummary[idNoA][1]).
 '''
 
 
-def recurringTermsUnified(termSummary, termIdToGenesDict, maxRepresentativeTermSize, idNo, idNo2, termId, termId2):
+def recurringTermsUnified(termIndex, idNo, candidateIdNos):
 	'''
 	Recurring terms coming from multiple lists are unified.
 	This rule is run by default if there are multiple enrichment results.
 
-	:param list termSummary: Representative term list to be summarized
-	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
-	:param int maxRepresentativeTermSize: The maximum size of a representative term. Terms bigger than this size will not be discarded but also will not be able to represent other terms.
-	:param int idNo: Index of the first term handled in this function in termSummary
-	:param int idNo: Index of the second term handled in this function in termSummary
-	:param str termId: Term ID of the first term handled in this function
-	:param str termId2: Term ID of the second term handled in this function
-	:return: **termSummary** (*list*) – Representative term list after applying the rule
+	:param dict termIndex: Term index created by indexTermSummary
+	:param int idNo: Index of the representative term in termSummary
+	:param numpy.ndarray candidateIdNos: Indices of the candidate terms in termSummary
+	:return: **isRepresented** (*numpy.ndarray*) – Boolean mask of the candidates represented by the term
 	'''
 
-	if(termId==termId2):
-		#Terms represented by the second term are copied under the first term
-		for termRepresentedByCoveredTerm in termSummary[idNo2][1]:
-			if termRepresentedByCoveredTerm not in termSummary[idNo][1]:
-				termSummary[idNo][1].append(termRepresentedByCoveredTerm)
-		termSummary[idNo2][0]=-1
-		#Minimum of the ranks is assigned as the rank for this representative term
-		termSummary[idNo][2]=min(termSummary[idNo][2], termSummary[idNo2][2])
-	return termSummary
+	termIds=termIndex['termIds']
+	return termIds[candidateIdNos]==termIds[idNo]
 
 
 
-def supertermRepresentsLessSignificantSubterm(termSummary, termIdToGenesDict, maxRepresentativeTermSize, idNo, idNo2, termId, termId2):
+def supertermRepresentsLessSignificantSubterm(termIndex, idNo, candidateIdNos):
 	'''
 	Superterms represent their subterms that are less significant.
 	The rule also works for the terms with the same list of genes.
 
-	:param list termSummary: Representative term list to be summarized
-	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
-	:param int maxRepresentativeTermSize: The maximum size of a representative term. Terms bigger than this size will not be discarded but also will not be able to represent other terms.
-	:param int idNo: Index of the first term handled in this function in termSummary
-	:param int idNo: Index of the second term handled in this function in termSummary
-	:param str termId: Term ID of the first term handled in this function
-	:param str termId2: Term ID of the second term handled in this function
-	:return: **termSummary** (*list*) – Representative term list after applying the rule
+	:param dict termIndex: Term index created by indexTermSummary
+	:param int idNo: Index of the representative term in termSummary, supposed to be superset
+	:param numpy.ndarray candidateIdNos: Indices of the candidate terms in termSummary, supposed to be subsets
+	:return: **isRepresented** (*numpy.ndarray*) – Boolean mask of the candidates represented by the term
 	'''
 
-	geneSet1=termIdToGenesDict[termId]#Supposed to be superset and representative
-	geneSet2=termIdToGenesDict[termId2]#Supposed to be subset and be represented
-	if(len(geneSet1)<=maxRepresentativeTermSize):
-		if geneSet1.issuperset(geneSet2):
-			#Terms represented by the second term are copied under the first term
-			for termRepresentedByCoveredTerm in termSummary[idNo2][1]:
-				if termRepresentedByCoveredTerm not in termSummary[idNo][1]:
-					termSummary[idNo][1].append(termRepresentedByCoveredTerm)
-			termSummary[idNo2][0]=-1
+	termSizes=getTermSizes(termIndex)
+	if termSizes[idNo]>termIndex['maxRepresentativeTermSize']:
+		return np.zeros(len(candidateIdNos), dtype=bool)
+	#A subset cannot be larger than its superset, only the others are compared
+	isRepresented=termSizes[candidateIdNos]<=termSizes[idNo]
+	isRepresented[isRepresented]=areSubsets(termIndex, idNo, candidateIdNos[isRepresented])
+	return isRepresented
+
+
+#Rules that can be selected: name -> (function name, description)
+RULES={
+	'recurringTermsUnified': (recurringTermsUnified, 'Same terms in multiple lists are unified'),
+	'supertermRepresentsLessSignificantSubterm': (supertermRepresentsLessSignificantSubterm, 'Superterms represent their less significant (worse ranked) subterms. This includes equal terms, i.e. the terms that annotate exactly the same set of genes.'),
+}
+
+
+
+def reduceEnrichmentResult(termIdsList, gmtModel, maxRepresentativeTermSize, numberOfThreads=1):
+	"""
+	Map step of the map-reduce summarization. Finds the candidate
+	representative terms of a single enrichment result: the terms that are not
+	contained by a term ranked above them that can represent other terms. A
+	term that is not a candidate in any enrichment result cannot be a
+	representative term of the merged summary.
+
+	:param list termIdsList: Term IDs of the enrichment result, without duplicates
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param int maxRepresentativeTermSize: The maximum size of a representative term.
+	:param int numberOfThreads: Number of threads counting the overlaps
+	:return: **candidateTermIds** (*list*) – Candidate representative term IDs in rank order
+	:return: **rankTable** (*dict*) – Dictionary mapping the term IDs of the enrichment result to ranks
+	"""
+
+	positions=np.arange(len(termIdsList))
+	isCapable=gmtModel.termSizes[gmtModel.getIndices(termIdsList)]<=maxRepresentativeTermSize
+	capableTermIds=[termId for termId, capable in zip(termIdsList, isCapable) if capable]
+	firstSupertermNos=findFirstSuperterms(gmtModel, termIdsList, positions, capableTermIds, positions[isCapable], numberOfThreads)
+	candidateTermIds=[termId for termId, firstSupertermNo in zip(termIdsList, firstSupertermNos) if firstSupertermNo==-1]
+	return candidateTermIds, createRankTables([termIdsList])[0]
+
+
+def mergeReducedEnrichmentResults(reducedResults, gmtModel, maxRepresentativeTermSize, numberOfThreads=1):
+	"""
+	Reduce step of the map-reduce summarization. Recurring terms are unified
+	with their best rank, ties going to the first enrichment result, which is
+	the order of initializeTermSummary followed by recurringTermsUnified.
+	supertermRepresentsLessSignificantSubterm keeps a term as a representative
+	term only if no term ranked above it contains it and can represent other
+	terms. The first such term would be a representative term itself, so it
+	is a candidate in the enrichment result giving its best rank, and it is
+	enough to look for it among the candidates. Each of the other terms is
+	represented by the first representative term ranked above it that
+	contains it. The result is the same as applying recurringTermsUnified and
+	supertermRepresentsLessSignificantSubterm to all the enrichment results.
+
+	:param list reducedResults: Candidate term IDs and rank table of each enrichment result, as returned by reduceEnrichmentResult
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param int maxRepresentativeTermSize: The maximum size of a representative term.
+	:param int numberOfThreads: Number of threads counting the overlaps
+	:return: **termSummary** (*list*) – Representative term list
+	"""
+
+	bestRanks=dict()
+	for listNo in range(len(reducedResults)):
+		for termId, rank in reducedResults[listNo][1].items():
+			if termId not in bestRanks or (rank, listNo)<bestRanks[termId]:
+				bestRanks[termId]=(rank, listNo)
+	termIds=sorted(bestRanks, key=bestRanks.get)
+	positions={termId: position for position, termId in enumerate(termIds)}
+	candidateTermIdsSet={termId for candidateTermIds, rankTable in reducedResults for termId in candidateTermIds}
+
+	def findRepresentatives(termIds, representativeTermIds):
+		termPositions=np.array([positions[termId] for termId in termIds], dtype=np.int64)
+		isCapable=gmtModel.termSizes[gmtModel.getIndices(representativeTermIds)]<=maxRepresentativeTermSize
+		capableTermIds=[termId for termId, capable in zip(representativeTermIds, isCapable) if capable]
+		capablePositions=np.array([positions[termId] for termId in capableTermIds], dtype=np.int64)
+		return capableTermIds, findFirstSuperterms(gmtModel, termIds, termPositions, capableTermIds, capablePositions, numberOfThreads)
+
+	candidateTermIds=[termId for termId in termIds if termId in candidateTermIdsSet]
+	capableTermIds, firstSupertermNos=findRepresentatives(candidateTermIds, candidateTermIds)
+	termSummary=[[termId, [termId], bestRanks[termId][0]] for termId, firstSupertermNo in zip(candidateTermIds, firstSupertermNos) if firstSupertermNo==-1]
+
+	representatives={ts[0]: ts for ts in termSummary}
+	representedTermIds=[termId for termId in termIds if termId not in representatives]
+	if len(representedTermIds)>0:
+		capableTermIds, firstRepresentativeNos=findRepresentatives(representedTermIds, list(representatives))
+		for termId, representativeNo in zip(representedTermIds, firstRepresentativeNos):
+			representatives[capableTermIds[representativeNo]][1].append(termId)
+		for ts in termSummary:
+			ts[1].sort(key=positions.get)
+
 	return termSummary
 
 
+def summarizeMapReduce(termIdsListList, termIdToGenesDict, maxRepresentativeTermSize, numberOfThreads=1):
+	"""
+	Summarizes multiple enrichment results in two stages: each enrichment
+	result is reduced to its candidate representative terms in parallel with
+	reduceEnrichmentResult, then the reduced results are merged with
+	mergeReducedEnrichmentResults. The result is the same as unifying the
+	recurring terms and applying supertermRepresentsLessSignificantSubterm to
+	the concatenated enrichment results. Instead of the term by term
+	application of the rules, superterms are found with sparse matrix
+	products, within each enrichment result and among the unique terms.
+
+	:param list termIdsListList: Term ID lists of the enrichment results, without duplicates
+	:param GmtModel termIdToGenesDict: GMT model of the gene sets. A dictionary mapping term IDs to set of genes is also accepted.
+	:param int maxRepresentativeTermSize: The maximum size of a representative term.
+	:param int numberOfThreads: Number of threads reducing the enrichment results and counting the overlaps in the merge.
+	:return: **termSummary** (*list*) – Representative term list
+	"""
+
+	gmtModel=getGmtModel(termIdToGenesDict)
+	with ThreadPoolExecutor(numberOfThreads) as executor:
+		reducedResults=list(executor.map(lambda termIdsList: reduceEnrichmentResult(termIdsList, gmtModel, maxRepresentativeTermSize), termIdsListList))
+	return mergeReducedEnrichmentResults(reducedResults, gmtModel, maxRepresentativeTermSize, numberOfThreads)
+
+
+def getJitteredRanks(listLengths, jitter, seedSequences):
+	"""
+	Returns the ranks of the terms of the enrichment results in bootstrap
+	replicates. In each replicate, Gaussian noise with standard deviation
+	jitter is added to the logarithm of the ranks of each enrichment result,
+	and the terms are ranked again by the perturbed values. Neighbouring
+	terms are swapped more often than distant ones, and a term ranked 10 is
+	moved as much relative to its rank as a term ranked 1000. Each replicate
+	has its own random number generator, so the ranks of a replicate do not
+	depend on the replicates computed with it.
+
+	:param list listLengths: Number of terms of each enrichment result
+	:param float jitter: Standard deviation of the noise added to the logarithm of the ranks
+	:param list seedSequences: numpy.random.SeedSequence of each replicate
+	:return: **jitteredRanks** (*numpy.ndarray*) – 2D array, for each replicate the rank of each term of the concatenated enrichment results (starting from 1)
+	"""
+
+	logRanks=np.concatenate([np.zeros(0)]+[np.log(np.arange(1, listLength+1)) for listLength in listLengths])
+	noise=np.array([np.random.default_rng(seedSequence).standard_normal(len(logRanks)) for seedSequence in seedSequences]).reshape(len(seedSequences), len(logRanks))
+	perturbedLogRanks=logRanks+jitter*noise
+	jitteredRanks=np.empty(perturbedLogRanks.shape, dtype=np.int64)
+	start=0
+	for listLength in listLengths:
+		order=np.argsort(perturbedLogRanks[:, start:start+listLength], axis=1, kind='stable')
+		np.put_along_axis(jitteredRanks[:, start:start+listLength], order, np.arange(1, listLength+1)[np.newaxis, :], axis=1)
+		start+=listLength
+	return jitteredRanks
+
+
+def getRepresentationPairs(termIds, gmtModel, maxRepresentativeTermSize, containmentIndex):
+	"""
+	Returns the pairs of terms where the first term can represent the second
+	one if it is ranked above it: the first term contains the second one and
+	is not larger than maxRepresentativeTermSize.
+
+	:param list termIds: Unique term IDs
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param int maxRepresentativeTermSize: The maximum size of a representative term.
+	:param ContainmentIndex containmentIndex: Superset relations among the terms, or a larger set of terms
+	:return: **supertermNos** (*numpy.ndarray*) – Index of the superterm of each pair in termIds
+	:return: **subtermNos** (*numpy.ndarray*) – Index of the subterm of each pair in termIds
+	"""
+
+	containmentPositions=containmentIndex.getIndices(termIds)
+	termNos=np.full(len(containmentIndex), -1, dtype=np.int64)
+	termNos[containmentPositions]=np.arange(len(termIds))
+	isCapable=gmtModel.termSizes[gmtModel.getIndices(termIds)]<=maxRepresentativeTermSize
+	supertermParts=[np.zeros(0, dtype=np.int64)]
+	subtermParts=[np.zeros(0, dtype=np.int64)]
+	for termNo in np.flatnonzero(isCapable):
+		subtermNos=termNos[containmentIndex.subtermIndices[containmentPositions[termNo]]]
+		subtermNos=subtermNos[subtermNos>=0]
+		supertermParts.append(np.full(len(subtermNos), termNo, dtype=np.int64))
+		subtermParts.append(subtermNos)
+	return np.concatenate(supertermParts), np.concatenate(subtermParts)
+
+
+def bootstrapRepresentatives(termIdsListList, gmtModel, maxRepresentativeTermSize, numberOfReplicates, jitter, seed=None, numberOfThreads=1, containmentIndex=None, maxChunkSize=2**24):
+	"""
+	Counts how often each term is a representative term when the ranks of the
+	enrichment results are perturbed by getJitteredRanks. With the default
+	rules, recurring terms are unified with their best rank, ties going to
+	the first enrichment result, and a term is a representative term if and
+	only if no term ranked above it contains it and can represent other terms
+	(see mergeReducedEnrichmentResults). The pairs of terms that can represent
+	each other are found once, so each replicate only compares the ranks of
+	the terms of each pair, for a chunk of replicates at a time. The chunks
+	are processed by multiple threads; the counts do not depend on the number
+	of threads.
+
+	:param list termIdsListList: Filtered term ID lists of the enrichment results
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param int maxRepresentativeTermSize: The maximum size of a representative term.
+	:param int numberOfReplicates: Number of bootstrap replicates
+	:param float jitter: Standard deviation of the noise added to the logarithm of the ranks
+	:param int seed: Seed of the random number generators, None for a random seed
+	:param int numberOfThreads: Number of threads processing the chunks of replicates
+	:param ContainmentIndex containmentIndex: Superset relations of the terms, built for the terms of the enrichment results if None
+	:param int maxChunkSize: The maximum number of rank comparisons in a chunk of replicates, which bounds the memory of a thread
+	:return: **representativeCounts** (*dict*) – Dictionary mapping term IDs to the number of replicates where they are representative terms
+	"""
+
+	gmtModel=getGmtModel(gmtModel)
+	termIds=list(dict.fromkeys(termId for termIdsList in termIdsListList for termId in termIdsList))
+	termNoOf={termId: termNo for termNo, termId in enumerate(termIds)}
+	entryTermNos=np.array([termNoOf[termId] for termIdsList in termIdsListList for termId in termIdsList], dtype=np.int64)
+	entryListNos=np.concatenate([np.zeros(0, dtype=np.int64)]+[np.full(len(termIdsList), listNo, dtype=np.int64) for listNo, termIdsList in enumerate(termIdsListList)])
+	if containmentIndex is None:
+		containmentIndex=buildContainmentIndex(gmtModel, termIds)
+	supertermNos, subtermNos=getRepresentationPairs(termIds, gmtModel, maxRepresentativeTermSize, containmentIndex)
+	seedSequences=np.random.SeedSequence(seed).spawn(numberOfReplicates)
+	chunkSize=max(1, maxChunkSize//max(1, len(supertermNos), len(entryTermNos)))
+
+	def processChunk(start):
+		chunkSeedSequences=seedSequences[start:start+chunkSize]
+		#Rank and enrichment result of the best entry of each term, as one number
+		entryKeys=getJitteredRanks([len(termIdsList) for termIdsList in termIdsListList], jitter, chunkSeedSequences)*len(termIdsListList)+entryListNos
+		replicateOffsets=np.arange(len(chunkSeedSequences))[:, np.newaxis]*len(termIds)
+		bestKeys=np.full(len(chunkSeedSequences)*len(termIds), np.iinfo(np.int64).max, dtype=np.int64)
+		np.minimum.at(bestKeys, (replicateOffsets+entryTermNos).ravel(), entryKeys.ravel())
+		bestKeys=bestKeys.reshape(len(chunkSeedSequences), len(termIds))
+		isRepresented=bestKeys[:, supertermNos]<bestKeys[:, subtermNos]
+		representedCounts=np.bincount((replicateOffsets+subtermNos)[isRepresented], minlength=len(chunkSeedSequences)*len(termIds))
+		return np.count_nonzero(representedCounts.reshape(len(chunkSeedSequences), len(termIds))==0, axis=0)
+
+	representativeCounts=np.zeros(len(termIds), dtype=np.int64)
+	with ThreadPoolExecutor(numberOfThreads) as executor:
+		for chunkCounts in executor.map(processChunk, range(0, numberOfReplicates, chunkSize)):
+			representativeCounts+=chunkCounts
+	return dict(zip(termIds, representativeCounts.tolist()))
+
 
 ##############################################################################
 ##############################################################################
@@ -150,6 +631,481 @@ def readGmtFile(gmtPath):
 	return termIdToGenesDict, termIdToTermNameDict
 
 
+def readGmtModel(gmtPath, termIdsToKeep=None, geneIds=None, geneIdToIndex=None):
+	"""
+	Read GMT file into a GmtModel. The file is read line by line, and if
+	termIdsToKeep is given, only the genes and names of those terms are kept.
+	GMT models of multiple files can share the numbering of the genes by
+	giving them the same geneIds and geneIdToIndex.
+
+	:param str gmtPath: Path of the GMT file
+	:param set termIdsToKeep: IDs of the terms to be kept, None to keep all the terms
+	:param list geneIds: Gene IDs numbered so far, extended with the new genes. None for a new numbering.
+	:param dict geneIdToIndex: Dictionary mapping the gene IDs numbered so far to gene indices, given together with geneIds.
+	:return: **gmtModel** (*GmtModel*) – GMT model of the gene sets
+	"""
+
+	termIdToGenesDict=dict()#term ID to set of genes mapping
+	termIdToTermNameDict=dict()#term ID to term name mapping
+	try:
+		with open(gmtPath, 'r') as f:
+			for line in f:
+				tokens=line.strip().split('\t')
+				termId=tokens[0]
+				if termIdsToKeep is None or termId in termIdsToKeep:
+					termIdToGenesDict[termId]=set(tokens[2:])
+					termIdToTermNameDict[termId]=tokens[1]
+	except IOError:
+		print("I/O error while reading gmt file.")
+	return GmtModel(termIdToGenesDict, termIdToTermNameDict, geneIds, geneIdToIndex)
+
+
+def getGmtModel(termIdToGenesDict):
+	"""
+	Returns the given GMT model, or creates one from a dictionary mapping term
+	IDs to set of genes.
+
+	:param GmtModel termIdToGenesDict: GMT model or dictionary mapping term IDs to set of genes.
+	:return: **gmtModel** (*GmtModel*) – GMT model of the gene sets
+	"""
+
+	if isinstance(termIdToGenesDict, GmtModel):
+		return termIdToGenesDict
+	return GmtModel(termIdToGenesDict)
+
+
+class GmtModel(Mapping):
+	"""
+	Gene sets of a GMT file, indexed once and used by the filters, the rules
+	and the writers.
+	Terms are numbered in the order they are given. termIds maps term index to
+	term ID and termIdToIndex term ID to term index, termNames maps term index
+	to term name and termSizes, a NumPy array, term index to term size.
+	Genes are numbered as well; the gene indices of term i are
+	geneIndices[geneIndexPointers[i]:geneIndexPointers[i+1]].
+	The numbering of the genes, geneIds and geneIdToIndex, can be shared by
+	the GMT models of multiple files; it is extended with the genes of each
+	new model, so the gene indices of all the models stay comparable.
+	As a mapping, it maps term IDs to set of genes like termIdToGenesDict.
+	"""
+
+	def __init__(self, termIdToGenesDict, termIdToTermNameDict=None, geneIds=None, geneIdToIndex=None):
+		"""
+		:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
+		:param dict termIdToTermNameDict: Dictionary mapping term IDs to term names.
+		:param list geneIds: Gene IDs numbered so far, extended with the new genes. None for a new numbering.
+		:param dict geneIdToIndex: Dictionary mapping the gene IDs numbered so far to gene indices, given together with geneIds.
+		"""
+
+		if termIdToTermNameDict is None:
+			termIdToTermNameDict=dict()
+		self.termIds=list(termIdToGenesDict.keys())
+		self.termIdToIndex={termId:index for index, termId in enumerate(self.termIds)}
+		self.termNames=[termIdToTermNameDict.get(termId, '') for termId in self.termIds]
+		self.geneIds=[] if geneIds is None else geneIds
+		self.geneIdToIndex=dict() if geneIdToIndex is None else geneIdToIndex
+		geneIndices=[]
+		for termId in self.termIds:
+			for gene in termIdToGenesDict[termId]:
+				geneIndex=self.geneIdToIndex.get(gene)
+				if geneIndex is None:
+					geneIndex=len(self.geneIds)
+					self.geneIdToIndex[gene]=geneIndex
+					self.geneIds.append(gene)
+				geneIndices.append(geneIndex)
+		self.termSizes=np.array([len(termIdToGenesDict[termId]) for termId in self.termIds], dtype=np.int64)
+		self.geneIndexPointers=np.zeros(len(self.termIds)+1, dtype=np.int64)
+		np.cumsum(self.termSizes, out=self.geneIndexPointers[1:])
+		self.geneIndices=np.array(geneIndices, dtype=np.int32)
+
+	def __getitem__(self, termId):
+		index=self.termIdToIndex[termId]
+		return {self.geneIds[geneIndex] for geneIndex in self.geneIndices[self.geneIndexPointers[index]:self.geneIndexPointers[index+1]]}
+
+	def __iter__(self):
+		return iter(self.termIds)
+
+	def __len__(self):
+		return len(self.termIds)
+
+	def __contains__(self, termId):
+		return termId in self.termIdToIndex
+
+	def getIndices(self, termIds):
+		"""
+		:param list termIds: Term IDs
+		:return: **indices** (*numpy.ndarray*) – Term indices of the terms
+		"""
+		return np.array([self.termIdToIndex[termId] for termId in termIds], dtype=np.int64)
+
+	def getTermSize(self, termId):
+		return int(self.termSizes[self.termIdToIndex[termId]])
+
+	def getTermName(self, termId):
+		return self.termNames[self.termIdToIndex[termId]]
+
+	def getGeneIndices(self, indices):
+		"""
+		Returns the gene indices of the given terms, concatenated.
+
+		:param numpy.ndarray indices: Term indices
+		:return: **rows** (*numpy.ndarray*) – Position of the term in indices for each gene index
+		:return: **geneIndices** (*numpy.ndarray*) – Gene indices of the terms
+		"""
+		lengths=self.termSizes[indices]
+		rows=np.repeat(np.arange(len(indices)), lengths)
+		offsets=np.arange(lengths.sum())-np.repeat(np.cumsum(lengths)-lengths, lengths)
+		return rows, self.geneIndices[np.repeat(self.geneIndexPointers[indices], lengths)+offsets]
+
+	def sizeMask(self, termIds, minTermSize=None, maxTermSize=None, maxRepresentativeTermSize=None):
+		"""
+		Checks the sizes of the given terms against the given thresholds at once.
+
+		:param list termIds: Term IDs, all in the GMT
+		:param int minTermSize: The minimum size of the terms
+		:param int maxTermSize: The maximum size of the terms
+		:param int maxRepresentativeTermSize: The maximum size of a representative term
+		:return: **mask** (*numpy.ndarray*) – Boolean mask of the terms within all the given thresholds
+		"""
+		termSizes=self.termSizes[self.getIndices(termIds)]
+		mask=np.ones(len(termSizes), dtype=bool)
+		if minTermSize is not None:
+			mask&=termSizes>=minTermSize
+		if maxTermSize is not None:
+			mask&=termSizes<=maxTermSize
+		if maxRepresentativeTermSize is not None:
+			mask&=termSizes<=maxRepresentativeTermSize
+		return mask
+
+
+def getNamespacedTermId(namespace, termId):
+	"""
+	:param str namespace: Namespace of the GMT file of the term
+	:param str termId: Term ID in the GMT file
+	:return: **namespacedTermId** (*str*) – Term ID prefixed with the namespace
+	"""
+	return namespace+NAMESPACE_SEPARATOR+termId
+
+
+def combineGmtModels(gmtModels, namespaces):
+	"""
+	Combines GMT models sharing the numbering of the genes into a single GMT
+	model. Term IDs are prefixed with the namespace of their model, so the
+	same term ID can appear in multiple models. The gene indices are copied
+	as they are, genes are not numbered again.
+
+	:param list gmtModels: GMT models sharing geneIds and geneIdToIndex
+	:param list namespaces: Namespace of each GMT model
+	:return: **gmtModel** (*GmtModel*) – GMT model of the gene sets of all the models
+	"""
+
+	if any(gmtModel.geneIds is not gmtModels[0].geneIds for gmtModel in gmtModels):
+		raise ValueError('GMT models do not share the numbering of the genes.')
+	combinedGmtModel=GmtModel(dict(), geneIds=gmtModels[0].geneIds, geneIdToIndex=gmtModels[0].geneIdToIndex)
+	combinedGmtModel.termIds=[getNamespacedTermId(namespace, termId) for gmtModel, namespace in zip(gmtModels, namespaces) for termId in gmtModel.termIds]
+	combinedGmtModel.termIdToIndex={termId:index for index, termId in enumerate(combinedGmtModel.termIds)}
+	combinedGmtModel.termNames=[termName for gmtModel in gmtModels for termName in gmtModel.termNames]
+	combinedGmtModel.termSizes=np.concatenate([combinedGmtModel.termSizes]+[gmtModel.termSizes for gmtModel in gmtModels])
+	combinedGmtModel.geneIndexPointers=np.zeros(len(combinedGmtModel.termIds)+1, dtype=np.int64)
+	np.cumsum(combinedGmtModel.termSizes, out=combinedGmtModel.geneIndexPointers[1:])
+	combinedGmtModel.geneIndices=np.concatenate([combinedGmtModel.geneIndices]+[gmtModel.geneIndices for gmtModel in gmtModels])
+	return combinedGmtModel
+
+
+class ContainmentIndex:
+	"""
+	Superset relations among a set of terms: for each term, the other terms
+	whose genes are all among its genes. The relations do not depend on term
+	size limits or ranks, so an index can be shared by runs with different
+	parameters.
+	termIds maps position to term ID and termIdToIndex term ID to position.
+	subtermIndices[i] is the sorted array of positions of the subterms of the
+	term at position i. The index of all the terms of a GMT release also keeps
+	termHashes, the hash of the genes of each term, to find the terms changed
+	in the next release.
+	"""
+
+	def __init__(self, termIds, subtermIndices, termHashes=None):
+		"""
+		:param list termIds: Term IDs
+		:param list subtermIndices: For each term, sorted NumPy array of the positions of its subterms
+		:param list termHashes: Hash of the genes of each term, None if they are not kept
+		"""
+
+		self.termIds=list(termIds)
+		self.termIdToIndex={termId:index for index, termId in enumerate(self.termIds)}
+		self.subtermIndices=subtermIndices
+		self.termHashes=termHashes
+
+	def __len__(self):
+		return len(self.termIds)
+
+	def __contains__(self, termId):
+		return termId in self.termIdToIndex
+
+	def getIndices(self, termIds):
+		"""
+		:param list termIds: Term IDs
+		:return: **indices** (*numpy.ndarray*) – Positions of the terms in the index
+		"""
+		return np.array([self.termIdToIndex[termId] for termId in termIds], dtype=np.int64)
+
+	def getSubterms(self, termId):
+		"""
+		:param str termId: Term ID
+		:return: **subtermIds** (*list*) – IDs of the subterms of the term
+		"""
+		return [self.termIds[index] for index in self.subtermIndices[self.termIdToIndex[termId]]]
+
+	def getRelations(self):
+		"""
+		:return: **relations** (*set*) – Set of (superterm ID, subterm ID) pairs
+		"""
+		return {(self.termIds[index], self.termIds[subtermIndex]) for index in range(len(self.termIds)) for subtermIndex in self.subtermIndices[index]}
+
+
+def buildContainmentIndex(gmtModel, termIds, blockSize=1024):
+	"""
+	Finds the superset relations among the given terms. The term-gene matrix
+	is multiplied by its transpose, a block of terms at a time, to count the
+	overlapping genes of each pair of terms; term j is a subterm of term i if
+	all the genes of j overlap with i.
+
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param list termIds: IDs of the terms, all in the GMT model
+	:param int blockSize: Number of terms processed at a time, which bounds the memory of the overlap counts
+	:return: **containmentIndex** (*ContainmentIndex*) – Superset relations among the terms
+	"""
+
+	termIds=list(dict.fromkeys(termIds))
+	indices=gmtModel.getIndices(termIds)
+	termSizes=gmtModel.termSizes[indices]
+	rows, geneIndices=gmtModel.getGeneIndices(indices)
+	uniqueGeneIndices, columns=np.unique(geneIndices, return_inverse=True)
+	geneMatrix=csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)), shape=(len(termIds), len(uniqueGeneIndices)))
+	transposedGeneMatrix=geneMatrix.T.tocsr()
+	#Terms without genes are subterms of every term but do not overlap with any
+	emptyTermIndices=np.flatnonzero(termSizes==0)
+
+	subtermIndices=[]
+	for start in range(0, len(termIds), blockSize):
+		overlaps=(geneMatrix[start:start+blockSize] @ transposedGeneMatrix).tocoo()
+		isSubterm=overlaps.data==termSizes[overlaps.col]
+		supertermRows=overlaps.row[isSubterm]
+		subtermColumns=overlaps.col[isSubterm]
+		order=np.lexsort((subtermColumns, supertermRows))
+		supertermRows=supertermRows[order]
+		subtermColumns=subtermColumns[order]
+		boundaries=np.searchsorted(supertermRows, np.arange(min(blockSize, len(termIds)-start)+1))
+		for blockRow in range(len(boundaries)-1):
+			index=start+blockRow
+			subterms=np.union1d(subtermColumns[boundaries[blockRow]:boundaries[blockRow+1]], emptyTermIndices)
+			subtermIndices.append(subterms[subterms!=index].astype(np.int64))
+	return ContainmentIndex(termIds, subtermIndices)
+
+
+def writeContainmentIndex(containmentIndex, containmentIndexPath):
+	"""
+	Writes a containment index to a NumPy .npz file. The file is written under
+	a temporary name and renamed, so other processes never read a partial index.
+
+	:param ContainmentIndex containmentIndex: Containment index with termHashes
+	:param str containmentIndexPath: Path of the file
+	"""
+
+	subtermIndexPointers=np.zeros(len(containmentIndex)+1, dtype=np.int64)
+	np.cumsum([len(subterms) for subterms in containmentIndex.subtermIndices], out=subtermIndexPointers[1:])
+	subtermIndices=np.concatenate([np.zeros(0, dtype=np.int64)]+containmentIndex.subtermIndices)
+	temporaryPath='{}.tmp-{}'.format(containmentIndexPath, os.getpid())
+	with open(temporaryPath, 'wb') as f:
+		np.savez_compressed(f, termIds=np.array(containmentIndex.termIds, dtype=str), termHashes=np.array(containmentIndex.termHashes, dtype=str), subtermIndexPointers=subtermIndexPointers, subtermIndices=subtermIndices)
+	os.replace(temporaryPath, containmentIndexPath)
+
+
+def readContainmentIndex(containmentIndexPath):
+	"""
+	Reads a containment index written by writeContainmentIndex.
+
+	:param str containmentIndexPath: Path of the file
+	:return: **containmentIndex** (*ContainmentIndex*) – Containment index with termHashes
+	"""
+
+	with np.load(containmentIndexPath) as arrays:
+		subtermIndexPointers=arrays['subtermIndexPointers']
+		subtermIndices=arrays['subtermIndices']
+		return ContainmentIndex(arrays['termIds'].tolist(), [subtermIndices[subtermIndexPointers[position]:subtermIndexPointers[position+1]] for position in range(len(subtermIndexPointers)-1)], arrays['termHashes'].tolist())
+
+
+def getTermGeneHashes(gmtModel, indices):
+	"""
+	Returns a hash of the genes of each given term, which does not depend on
+	the order of the genes or on their numbering in the GMT model.
+
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param numpy.ndarray indices: Term indices
+	:return: **termHashes** (*list*) – Hexadecimal hash of the genes of each term
+	"""
+
+	termHashes=[]
+	for index in indices:
+		genes=sorted(gmtModel.geneIds[geneIndex] for geneIndex in gmtModel.geneIndices[gmtModel.geneIndexPointers[index]:gmtModel.geneIndexPointers[index+1]])
+		termHashes.append(hashlib.sha1('\t'.join(genes).encode('utf-8')).hexdigest())
+	return termHashes
+
+
+def diffGmtRelease(containmentIndex, gmtModel, termHashes):
+	"""
+	Compares the terms of a GMT release with the release indexed by a
+	containment index.
+
+	:param ContainmentIndex containmentIndex: Containment index of all the terms of the previous release, with termHashes
+	:param GmtModel gmtModel: GMT model of the new release
+	:param list termHashes: Hash of the genes of each term of gmtModel, returned by getTermGeneHashes
+	:return: **addedTermIds** (*list*) – IDs of the terms only in the new release
+	:return: **removedTermIds** (*list*) – IDs of the terms only in the previous release
+	:return: **changedTermIds** (*list*) – IDs of the terms whose genes changed
+	"""
+
+	addedTermIds=[]
+	changedTermIds=[]
+	for termId, termHash in zip(gmtModel.termIds, termHashes):
+		position=containmentIndex.termIdToIndex.get(termId)
+		if position is None:
+			addedTermIds.append(termId)
+		elif containmentIndex.termHashes[position]!=termHash:
+			changedTermIds.append(termId)
+	removedTermIds=[termId for termId in containmentIndex.termIds if termId not in gmtModel]
+	return addedTermIds, removedTermIds, changedTermIds
+
+
+def updateContainmentIndex(containmentIndex, gmtModel, blockSize=1024):
+	"""
+	Updates the containment index of all the terms of a previous GMT release
+	for a new release. The relations between two terms that are unchanged in
+	the new release are copied, the relations of the added and changed terms
+	with all the terms are computed with sparse matrix products, and the
+	removed terms are left out. The result is the same as buildContainmentIndex
+	on all the terms of the new release. Without a previous index, the index is
+	built for all the terms.
+
+	:param ContainmentIndex containmentIndex: Containment index of all the terms of the previous release, with termHashes, None to build a new one
+	:param GmtModel gmtModel: GMT model of the new release
+	:param int blockSize: Number of added and changed terms processed at a time, which bounds the memory of the overlap counts
+	:return: **updatedContainmentIndex** (*ContainmentIndex*) – Containment index of all the terms of the new release, with termHashes
+	:return: **addedTermIds** (*list*) – IDs of the terms only in the new release
+	:return: **removedTermIds** (*list*) – IDs of the terms only in the previous release
+	:return: **changedTermIds** (*list*) – IDs of the terms whose genes changed
+	"""
+
+	termIds=gmtModel.termIds
+	termHashes=getTermGeneHashes(gmtModel, np.arange(len(termIds)))
+	if containmentIndex is None:
+		updatedContainmentIndex=buildContainmentIndex(gmtModel, termIds, blockSize)
+		updatedContainmentIndex.termHashes=termHashes
+		return updatedContainmentIndex, list(termIds), [], []
+
+	addedTermIds, removedTermIds, changedTermIds=diffGmtRelease(containmentIndex, gmtModel, termHashes)
+	affectedIndices=gmtModel.getIndices(addedTermIds+changedTermIds)
+	affectedIndices.sort()
+	isAffected=np.zeros(len(termIds), dtype=bool)
+	isAffected[affectedIndices]=True
+	#Positions of the unchanged terms in the previous index and in the new
+	#index, -1 for the other terms
+	unchangedIndices=np.flatnonzero(~isAffected)
+	oldPositions=np.full(len(termIds), -1, dtype=np.int64)
+	oldPositions[unchangedIndices]=containmentIndex.getIndices([termIds[index] for index in unchangedIndices])
+	newPositions=np.full(len(containmentIndex), -1, dtype=np.int64)
+	newPositions[oldPositions[unchangedIndices]]=unchangedIndices
+
+	#Relations of the affected terms with all the terms, in both directions
+	termSizes=gmtModel.termSizes
+	rows, geneIndices=gmtModel.getGeneIndices(np.arange(len(termIds)))
+	geneMatrix=csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, geneIndices)), shape=(len(termIds), len(gmtModel.geneIds)))
+	transposedGeneMatrix=geneMatrix.T.tocsr()
+	supertermParts=[]
+	subtermParts=[]
+	for start in range(0, len(affectedIndices), blockSize):
+		blockIndices=affectedIndices[start:start+blockSize]
+		overlaps=(geneMatrix[blockIndices] @ transposedGeneMatrix).tocoo()
+		affectedRows=blockIndices[overlaps.row]
+		isSubterm=overlaps.data==termSizes[overlaps.col]
+		isSuperterm=overlaps.data==termSizes[affectedRows]
+		supertermParts+=[affectedRows[isSubterm], overlaps.col[isSuperterm]]
+		subtermParts+=[overlaps.col[isSubterm], affectedRows[isSuperterm]]
+	#Terms without genes are subterms of every term but do not overlap with any
+	emptyIndices=np.flatnonzero(termSizes==0)
+	for emptyIndex in emptyIndices:
+		if isAffected[emptyIndex]:
+			supertermParts.append(np.arange(len(termIds)))
+			subtermParts.append(np.full(len(termIds), emptyIndex))
+	supertermParts.append(np.repeat(affectedIndices, len(emptyIndices)))
+	subtermParts.append(np.tile(emptyIndices, len(affectedIndices)))
+	superterms=np.concatenate([np.zeros(0, dtype=np.int64)]+[np.asarray(part, dtype=np.int64) for part in supertermParts])
+	subterms=np.concatenate([np.zeros(0, dtype=np.int64)]+[np.asarray(part, dtype=np.int64) for part in subtermParts])
+	order=np.lexsort((subterms, superterms))
+	superterms=superterms[order]
+	subterms=subterms[order]
+	boundaries=np.searchsorted(superterms, np.arange(len(termIds)+1))
+
+	subtermIndices=[]
+	for index in range(len(termIds)):
+		newSubterms=subterms[boundaries[index]:boundaries[index+1]]
+		if not isAffected[index]:
+			oldSubterms=newPositions[containmentIndex.subtermIndices[oldPositions[index]]]
+			newSubterms=np.concatenate((newSubterms, oldSubterms[oldSubterms>=0]))
+		newSubterms=np.unique(newSubterms)
+		subtermIndices.append(newSubterms[newSubterms!=index].astype(np.int64))
+	return ContainmentIndex(termIds, subtermIndices, termHashes), addedTermIds, removedTermIds, changedTermIds
+
+
+def findFirstSuperterms(gmtModel, termIds, termPositions, supertermIds, supertermPositions, numberOfThreads=1, blockSize=1024):
+	"""
+	For each term, finds the first superterm candidate positioned before it
+	that contains all its genes. The overlapping genes of the terms and the
+	candidates are counted with sparse matrix products, a block of terms at a
+	time, the blocks are processed by multiple threads.
+
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param list termIds: IDs of the terms, all in the GMT model
+	:param numpy.ndarray termPositions: Position of each term
+	:param list supertermIds: IDs of the superterm candidates sorted by position, all in the GMT model
+	:param numpy.ndarray supertermPositions: Position of each superterm candidate, in ascending order
+	:param int numberOfThreads: Number of threads processing the blocks
+	:param int blockSize: Number of terms processed at a time by a thread, which bounds the memory of the overlap counts
+	:return: **firstSupertermNos** (*numpy.ndarray*) – Index of the first superterm of each term in supertermIds, -1 if there is none
+	"""
+
+	def getGeneMatrix(indices):
+		rows, geneIndices=gmtModel.getGeneIndices(indices)
+		return csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, geneIndices)), shape=(len(indices), len(gmtModel.geneIds)))
+
+	indices=gmtModel.getIndices(termIds)
+	termSizes=gmtModel.termSizes[indices]
+	geneMatrix=getGeneMatrix(indices)
+	transposedSupertermGeneMatrix=getGeneMatrix(gmtModel.getIndices(supertermIds)).T.tocsr()
+	firstSupertermNos=np.full(len(termIds), -1, dtype=np.int64)
+
+	def processBlock(start):
+		overlaps=(geneMatrix[start:start+blockSize] @ transposedSupertermGeneMatrix).tocoo()
+		rows=overlaps.row+start
+		isSuperterm=(overlaps.data==termSizes[rows]) & (supertermPositions[overlaps.col]<termPositions[rows])
+		found=np.full(min(blockSize, len(termIds)-start), len(supertermIds), dtype=np.int64)
+		np.minimum.at(found, overlaps.row[isSuperterm], overlaps.col[isSuperterm])
+		firstSupertermNos[start:start+len(found)]=np.where(found<len(supertermIds), found, -1)
+
+	if numberOfThreads>1:
+		with ThreadPoolExecutor(numberOfThreads) as executor:
+			list(executor.map(processBlock, range(0, len(termIds), blockSize)))
+	else:
+		for start in range(0, len(termIds), blockSize):
+			processBlock(start)
+	#Terms without genes are contained by every term but do not overlap with any
+	for termNo in np.flatnonzero(termSizes==0):
+		if len(supertermIds)>0 and supertermPositions[0]<termPositions[termNo]:
+			firstSupertermNos[termNo]=0
+	return firstSupertermNos
+
+
 ##############################################################################
 ##############################################################################
 ##############################################################################
@@ -177,65 +1133,96 @@ def readInputEnrichmentResultFile(inputEnrichmentResultFile):
 	return termIdsList
 
 
-def removeUnknownTerms(termIdsList, termIdToGenesDict):
+def readEnrichmentTable(inputEnrichmentResultFile, idColumn, scoreColumn=None, ascending=True, delimiter='\t', cutoffs=None, chunkSize=100000):
+	"""
+	Read an enrichment result table with a header, e.g. from g:Profiler, GSEA
+	or clusterProfiler. Only the needed columns are parsed, in chunks, and the
+	rows that do not pass the cutoffs are dropped from each chunk, so they
+	never reach the summarization. If scoreColumn is given, the terms are
+	sorted by score, otherwise they are kept in the order of the file.
+
+	:param str inputEnrichmentResultFile: Path of the enrichment result table
+	:param str idColumn: Name of the column of term IDs
+	:param str scoreColumn: Name of the column used to rank the terms, None to keep the order of the file
+	:param bool ascending: Whether the most significant term has the smallest score, e.g. for p-values
+	:param str delimiter: Column delimiter
+	:param list cutoffs: List of (column name, maximum value) pairs, e.g. for p-values and FDR. Rows with a larger or missing value are removed.
+	:param int chunkSize: Number of rows parsed at a time
+	:return: **termIdsList** (*list*) – List of term IDs to be summarized
+	"""
+
+	if cutoffs is None:
+		cutoffs=[]
+	columns=list(dict.fromkeys([idColumn]+([scoreColumn] if scoreColumn is not None else [])+[column for column, maximum in cutoffs]))
+	termIdsChunks=[]
+	scoreChunks=[]
+	try:
+		for chunk in pd.read_csv(inputEnrichmentResultFile, sep=delimiter, usecols=columns, dtype={idColumn:str}, float_precision='round_trip', chunksize=chunkSize):
+			keep=np.ones(len(chunk), dtype=bool)
+			for column, maximum in cutoffs:
+				keep&=(pd.to_numeric(chunk[column], errors='coerce')<=maximum).to_numpy()
+			chunk=chunk[keep]
+			termIdsChunks.append(chunk[idColumn].str.strip().to_numpy())
+			if scoreColumn is not None:
+				scoreChunks.append(pd.to_numeric(chunk[scoreColumn], errors='coerce').to_numpy(dtype=float))
+	except (IOError, ValueError) as e:
+		print("Error while reading a file to be summarized: {}".format(e))
+		exit()
+
+	termIds=np.concatenate(termIdsChunks) if len(termIdsChunks)>0 else np.array([], dtype=object)
+	if scoreColumn is not None and len(termIds)>0:
+		scores=np.concatenate(scoreChunks)
+		#Stable sort keeps the order of the file for equal scores, missing scores go last
+		termIds=termIds[np.argsort(scores if ascending else -scores, kind='stable')]
+	return list(termIds)
+
+
+def removeUnknownTerms(termIdsList, gmtModel, printFile=None):
 	"""
 	Remove unknown terms
 
 	:param list termIdsList: Term IDs list
-	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
+	:param GmtModel gmtModel: GMT model of the gene sets
+	:param file printFile: Stream of the printed messages, None for the standard output
 	:return: **termIdsList** (*list*) – Term IDs list after removal of unknown terms
 	"""
 
-	termIdsList=termIdsList.copy()
-
-	idsToRemove=set()
+	gmtModel=getGmtModel(gmtModel)
+	knownTermIdsList=[]
 	for termId in termIdsList:
-		if not(termId in termIdToGenesDict.keys()):
-			idsToRemove.add(termId)
-	for idToRemove in idsToRemove:
-		print(idToRemove, 'is not in gmt file')
-		termIdsList.remove(idToRemove)
-	return termIdsList
+		if termId in gmtModel:
+			knownTermIdsList.append(termId)
+		else:
+			print(termId, 'is not in gmt file', file=printFile)
+	return knownTermIdsList
 
 
-def removeTermsSmallerThanMinTermSize(termIdsList, termIdToGenesDict, minTermSize):
+def removeTermsSmallerThanMinTermSize(termIdsList, gmtModel, minTermSize):
 	"""
 	Remove terms smaller than minTermSize
 
 	:param list termIdsList: Term IDs list
-	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
+	:param GmtModel gmtModel: GMT model of the gene sets
 	:param int minTermSize: The minimum size of the terms to be processed. Smaller terms are discarded.
 	:return: **termIdsList** (*list*) – Term IDs list after removal of small terms
 	"""
-	termIdsList=termIdsList.copy()
 
-	idsToRemove=set()
-	for termId in termIdsList:
-		if len(termIdToGenesDict[termId])<minTermSize:
-			idsToRemove.add(termId)
-	for idToRemove in idsToRemove:
-			termIdsList.remove(idToRemove)
-	return termIdsList
+	mask=getGmtModel(gmtModel).sizeMask(termIdsList, minTermSize=minTermSize)
+	return [termId for termId, keep in zip(termIdsList, mask) if keep]
 
 
-def removeTermsLargerThanMaxTermSize(termIdsList, termIdToGenesDict, maxTermSize):
+def removeTermsLargerThanMaxTermSize(termIdsList, gmtModel, maxTermSize):
 	"""
 	Remove terms larger than maxTermSize
 
 	:param list termIdsList: Term IDs list
-	:param dict termIdToGenesDict: Dictionary mapping term IDs to set of genes.
+	:param GmtModel gmtModel: GMT model of the gene sets
 	:param int maxTermSize: The maximum size of the terms to be processed. Larger terms are discarded.
 	:return: **termIdsList** (*list*) – Term IDs list after removal of large terms
 	"""
-	termIdsList=termIdsList.copy()
 
-	idsToRemove=set()
-	for termId in termIdsList:
-		if len(termIdToGenesDict[termId])>maxTermSize:
-			idsToRemove.add(termId)
-	for idToRemove in idsToRemove:
-			termIdsList.remove(idToRemove)
-	return termIdsList
+	mask=getGmtModel(gmtModel).sizeMask(termIdsList, maxTermSize=maxTermSize)
+	return [termId for termId, keep in zip(termIdsList, mask) if keep]
 
 ##############################################################################
 ##############################################################################
@@ -272,10 +1259,50 @@ def initializeTermSummary(termIdsListList):
 
 
 
-def writeTermSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases, termSummaryFile, termSummaryFile2):
+def createRankTables(termIdsListList):
+	"""
+	Creates a dictionary mapping term IDs to ranks for each enrichment result,
+	so that the writers do not search the lists for each represented term.
+
+	:param list termIdsListList: List of terms obtained from enrichment results files
+	:return: **rankTables** (*list*) – For each enrichment result, dictionary mapping term IDs to ranks (starting from 1)
+	"""
+
+	rankTables=[]
+	for termIdsList in termIdsListList:
+		rankTable=dict()
+		for idNo in range(len(termIdsList)):
+			rankTable.setdefault(termIdsList[idNo], idNo+1)
+		rankTables.append(rankTable)
+	return rankTables
+
+
+def getBestRanks(representedTerms, rankTables):
+	"""
+	For each enrichment result, finds the best rank among the represented terms.
+
+	:param list representedTerms: Terms represented by a representative term
+	:param list rankTables: Rank tables created by createRankTables
+	:return: **bestRanks** (*list*) – Best rank for each enrichment result, None if no represented term is in that result
+	"""
+
+	bestRanks=[]
+	for rankTable in rankTables:
+		found=None
+		for representedTerm in representedTerms:
+			rank=rankTable.get(representedTerm)
+			if rank is not None and (found==None or rank<found):
+				found=rank
+		bestRanks.append(found)
+	return bestRanks
+
+
+def writeTermSummaryFile(termSummary, gmtModel, termIdsListList, fileAliases, termSummaryFile, termSummaryFile2, stabilities=None):
 	'''
-	Writes the results.
+	Writes the results. If stabilities is given, the bootstrap stability of
+	each representative term is added as the last column of the summary.
 	'''
+	rankTables=createRankTables(termIdsListList)
 	try:
 		#Detailed
 		f=open(termSummaryFile, 'w')
@@ -288,26 +1315,17 @@ def writeTermSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, t
 		f.write('\n')
 
 		for ts in termSummary:#For each representation
-			f.write(ts[0]+'\t'+termIdToTermNameDict[ts[0]]+'\t'+str(ts[2])+'\n')
+			f.write(ts[0]+'\t'+gmtModel.getTermName(ts[0])+'\t'+str(ts[2])+'\n')
 
-			mtr=np.empty([len(ts[1]), len(termIdsListList)*3],dtype=(np.str_, 10000))
-			row=0
+			#Rows are written as they are created
 			for representedTerm in ts[1]:#For each represented term
-				for termIdsListNo in range(len(termIdsListList)):#For each input enrichment result
-					if representedTerm in termIdsListList[termIdsListNo]:
-						mtr[row, termIdsListNo*3]=representedTerm
-						mtr[row, termIdsListNo*3+1]=termIdToTermNameDict[representedTerm]
-						mtr[row, termIdsListNo*3+2]=termIdsListList[termIdsListNo].index(representedTerm)+1
-					else:
-						mtr[row, termIdsListNo*3]=''
-						mtr[row, termIdsListNo*3+1]=''
-						mtr[row, termIdsListNo*3+2]=''
-				row=row+1
-
-			for r in range(row):
 				f.write('\t\t')
-				for c in range(mtr.shape[1]):
-					f.write('\t'+mtr[r,c])
+				for rankTable in rankTables:#For each input enrichment result
+					rank=rankTable.get(representedTerm)
+					if rank is not None:
+						f.write('\t'+representedTerm+'\t'+gmtModel.getTermName(representedTerm)+'\t'+str(rank))
+					else:
+						f.write('\t\t\t')
 				f.write('\n')
 		f.close()
 
@@ -318,25 +1336,19 @@ def writeTermSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, t
 		f.write('Representing term id\tRepresenting term name\tRepresenting term size\tRepresenting term rank\tRepresented term number')
 		for termIdsListNo in range(len(termIdsListList)):
 			f.write('\t'+fileAliases[termIdsListNo]+ ' term rank')
+		if stabilities is not None:
+			f.write('\tRepresentative stability')
 		f.write('\n')
 
 		#For each representative term and for each input enrichment result, 
 		#find the best rank from the terms represented by that representative term
 		for ts in termSummary:
-			f.write(ts[0]+'\t'+termIdToTermNameDict[ts[0]]+'\t'+str(len(termIdToGenesDict[ts[0]]))+'\t'+str(ts[2])+'\t'+str(len(ts[1])))
+			f.write(ts[0]+'\t'+gmtModel.getTermName(ts[0])+'\t'+str(gmtModel.getTermSize(ts[0]))+'\t'+str(ts[2])+'\t'+str(len(ts[1])))
 
-			for termIdsListNo in range(len(termIdsListList)):
-				found=None
-				for representedTerm in ts[1]:#for each represented term
-					try:
-						rank=termIdsListList[termIdsListNo].index(representedTerm)
-						if found==None or rank<found:
-							found=rank
-					except ValueError:
-						pass
-				if found!=None:
-					found=found+1 #rank starts from 1
+			for found in getBestRanks(ts[1], rankTables):
 				f.write('\t'+str(found))
+			if stabilities is not None:
+				f.write('\t{:.3f}'.format(stabilities[ts[0]]))
 			f.write('\n')
 		f.close()
 
@@ -345,10 +1357,11 @@ def writeTermSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, t
 		print("I/O error while writing term summary file.")
 
 
-def writeHTMLSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases, termSummaryFile):
+def writeHTMLSummaryFile(termSummary, gmtModel, termIdsListList, fileAliases, termSummaryFile):
 	'''
 	Writes the results to an HTML file
 	'''
+	rankTables=createRankTables(termIdsListList)
 	try:
 		#Detailed
 		f=open(termSummaryFile, 'w')
@@ -360,8 +1373,7 @@ def writeHTMLSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, t
 		f.write('<body>\n')
 
 		for ts in termSummary:
-			#f.write(getTextForTSElement(ts, termIdToTermNameDict))
-			f.write(getTextForTSElementMultiEnrichment(ts, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases))
+			f.write(getTextForTSElementMultiEnrichment(ts, gmtModel, rankTables, fileAliases))
 
 		f.write('</body>\n')
 		f.write('</html>\n')
@@ -376,12 +1388,13 @@ def writeHTMLSummaryFile(termSummary, termIdToGenesDict, termIdToTermNameDict, t
 
 
 
-def writeTermSummaryFileClustered(termSummary, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases, termSummaryFile, nbTerm):
+def writeTermSummaryFileClustered(termSummary, gmtModel, termIdsListList, fileAliases, termSummaryFile, nbTerm):
 	'''
 	Writes the top results as clustered. The purpose of this file is to be
 	consumed by the plot function to create a clustered heatmap.
 	It can then be deleted (which is done by orsum.py).
 	'''
+	rankTables=createRankTables(termIdsListList)
 	try:
 				
 		ranksPerInputFile=dict()
@@ -389,18 +1402,9 @@ def writeTermSummaryFileClustered(termSummary, termIdToGenesDict, termIdToTermNa
 			ranksPerInputFile[fileAliases[termIdsListNo]]=[]
 
 		for ts in termSummary:
+			bestRanks=getBestRanks(ts[1], rankTables)
 			for termIdsListNo in range(len(termIdsListList)):
-				found=None
-				for representedTerm in ts[1]:
-					try:
-						rank=termIdsListList[termIdsListNo].index(representedTerm)
-						if found==None or rank<found:
-							found=rank
-					except ValueError:
-						pass
-				if found!=None:
-					found=found+1 #rank starts from 1
-				ranksPerInputFile[fileAliases[termIdsListNo]].append(found)
+				ranksPerInputFile[fileAliases[termIdsListNo]].append(bestRanks[termIdsListNo])
 		
 		dfRanksPerInputFile=pd.DataFrame.from_dict(ranksPerInputFile)
 		
@@ -440,7 +1444,7 @@ def writeTermSummaryFileClustered(termSummary, termIdToGenesDict, termIdToTermNa
 		
 		for leaf in dn['leaves']:
 			ts=termSummary[leaf]
-			f.write(ts[0]+'\t'+termIdToTermNameDict[ts[0]]+'\t'+str(len(termIdToGenesDict[ts[0]]))+'\t'+str(ts[2])+'\t'+str(len(ts[1])))
+			f.write(ts[0]+'\t'+gmtModel.getTermName(ts[0])+'\t'+str(gmtModel.getTermSize(ts[0]))+'\t'+str(ts[2])+'\t'+str(len(ts[1])))
 
 			for termIdsListNo in range(len(termIdsListList)):
 				found=ranksPerInputFile[fileAliases[termIdsListNo]][leaf]
@@ -451,7 +1455,7 @@ def writeTermSummaryFileClustered(termSummary, termIdToGenesDict, termIdToTermNa
 		
 		for tsNo in range(nbTerm, len(termSummary)):
 			ts=termSummary[tsNo]
-			f.write(ts[0]+'\t'+termIdToTermNameDict[ts[0]]+'\t'+str(len(termIdToGenesDict[ts[0]]))+'\t'+str(ts[2])+'\t'+str(len(ts[1])))
+			f.write(ts[0]+'\t'+gmtModel.getTermName(ts[0])+'\t'+str(gmtModel.getTermSize(ts[0]))+'\t'+str(ts[2])+'\t'+str(len(ts[1])))
 
 			for termIdsListNo in range(len(termIdsListList)):
 				found=ranksPerInputFile[fileAliases[termIdsListNo]][tsNo]
@@ -483,22 +1487,21 @@ def writeRepresentativeToRepresentedIDsFile(termSummary, outputFile):
 
 
 
-def getTextForTSElementMultiEnrichment(ts, termIdToGenesDict, termIdToTermNameDict, termIdsListList, fileAliases):
+def getTextForTSElementMultiEnrichment(ts, gmtModel, rankTables, fileAliases):
 	txt='\n'
 	txt=txt+'<details>'+'\n'
-	#txt=txt+'<summary>'+ts[0]+' '+termIdToTermNameDict[ts[0]]+' '+str(ts[2])+'</summary>'+'\n'
-	txt=txt+'<summary>'+ts[0]+' '+termIdToTermNameDict[ts[0]]+'</summary>'+'\n'
+	#txt=txt+'<summary>'+ts[0]+' '+gmtModel.getTermName(ts[0])+' '+str(ts[2])+'</summary>'+'\n'
+	txt=txt+'<summary>'+ts[0]+' '+gmtModel.getTermName(ts[0])+'</summary>'+'\n'
 
-	for termIdsListNo in range(len(termIdsListList)):
+	for termIdsListNo in range(len(rankTables)):
 		txt=txt+'\t'+'<p style="margin-left:40px">'+'\n'
 		if(len(fileAliases)>1):
 			txt=txt+'\t'+fileAliases[termIdsListNo]+'<br>'+'\n'
 		for representedTerm in ts[1]:
-			if representedTerm in termIdsListList[termIdsListNo]:
-				txt=txt+'\t'+representedTerm+' '+termIdToTermNameDict[representedTerm]+' (rank: '+str(termIdsListList[termIdsListNo].index(representedTerm)+1)+', term size: '+ str(len(termIdToGenesDict[representedTerm])) +')<br>'+'\n'
+			rank=rankTables[termIdsListNo].get(representedTerm)
+			if rank is not None:
+				txt=txt+'\t'+representedTerm+' '+gmtModel.getTermName(representedTerm)+' (rank: '+str(rank)+', term size: '+ str(gmtModel.getTermSize(representedTerm)) +')<br>'+'\n'
 		txt=txt+'\t'+'<br>'+'\n'
 		txt=txt+'\t'+'</p>'+'\n'
 	txt=txt+'</details>'+'\n'
 	return txt
-
-
@@ -0,0 +1,45 @@
+import threading
+import termCombinationLib
+from correctnessHarness import ENGINES, runHarness, runSummarize, createRandomCase, findMismatch, getSmallerCases, writeCase, readCase
+
+def test_engines():
+	#Seeds 20 and 54 have gene bitsets of two and three 64-bit words
+	for seed, numberOfWords in [(20, 2), (54, 3)]:
+		case=createRandomCase(seed)
+		genes=set().union(*[case['termIdToGenesDict'][termId] for termIdsList in case['termIdsListList'] for termId in termIdsList])
+		assert (len(genes)+63)//64==numberOfWords
+	assert runHarness(range(60), shrink=False) is None
+
+def test_threadEngines(tmp_path, monkeypatch):
+	#The rules of the thread engines run on the threads of the executor
+	for engineName in ['threads', 'threadChunks']:
+		threadNames=set()
+		for ruleName, (process, description) in list(termCombinationLib.RULES.items()):
+			def recordThreads(termIndex, idNo, candidateIdNos, process=process):
+				threadNames.add(threading.current_thread().name)
+				return process(termIndex, idNo, candidateIdNos)
+			monkeypatch.setitem(termCombinationLib.RULES, ruleName, (recordThreads, description))
+		ENGINES[engineName][0](createRandomCase(0), str(tmp_path))
+		monkeypatch.undo()
+		assert len(threadNames-{threading.current_thread().name})>1
+	assert termCombinationLib.MIN_CANDIDATES_PER_THREAD==4096
+
+def test_shrinkCase(monkeypatch):
+	#An engine with an off-by-one maximum representative term size
+	def runBrokenEngine(case, outputFolder):
+		brokenCase=dict(case)
+		brokenCase['maxRepresentativeTermSize']=case['maxRepresentativeTermSize']-1
+		return runSummarize(brokenCase, outputFolder)
+	monkeypatch.setitem(ENGINES, 'broken', (runBrokenEngine, None))
+	failure=runHarness(range(100), ['broken'])
+	assert failure is not None and failure['engine']=='broken'
+	case=failure['case']
+	assert findMismatch(case, 'broken') is not None
+	assert len(case['termIdsListList'])==1 and len(case['termIdToGenesDict'])==2
+	#The case is minimal
+	assert all(findMismatch(smallerCase, 'broken') is None for smallerCase in getSmallerCases(case))
+
+def test_writeCase(tmp_path):
+	case=createRandomCase(3)
+	writeCase(case, str(tmp_path / 'case.json'))
+	assert readCase(str(tmp_path / 'case.json'))==case
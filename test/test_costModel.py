@@ -0,0 +1,83 @@
+import json
+import pytest
+from costModel import readGmtStatistics, combineGmtStatistics, getStageFeatures, fitCostModel, readCostModel, writeCostModel, estimateRun, COST_MODEL_FEATURES, STAGES
+from orsum import getArgumentsDict, runEstimate
+
+def writeGmt(tmp_path):
+	(tmp_path / 'test.gmt').write_text('T1\tTerm 1\ta\tb\tc\td\nT2\tTerm 2\ta\tb\nT3\tTerm 3\tc\td\te\nT4\tTerm 4\tf\n')
+	return str(tmp_path / 'test.gmt')
+
+def test_readGmtStatistics(tmp_path):
+	gmtStatistics=readGmtStatistics(writeGmt(tmp_path), {'T2', 'T3', 'T5'})
+	assert gmtStatistics['gmtTerms']==4
+	assert gmtStatistics['gmtGeneEntries']==10
+	assert gmtStatistics['termSizes']=={'T2':2, 'T3':3}
+	assert gmtStatistics['keptGeneEntries']==5
+	assert gmtStatistics['keptGenes']==5
+	combinedGmtStatistics=combineGmtStatistics([gmtStatistics, gmtStatistics])
+	assert combinedGmtStatistics['gmtGeneEntries']==20
+	assert combinedGmtStatistics['termSizes']==gmtStatistics['termSizes']
+
+def test_getStageFeatures(tmp_path):
+	gmtStatistics=readGmtStatistics(writeGmt(tmp_path), {'T1', 'T2', 'T3', 'T4'})
+	termIdsListPerFile=[['T1', 'T2', 'T4', 'T1', 'T5'], ['T3', 'T2']]
+	stageFeatures, pairComparisons=getStageFeatures(gmtStatistics, termIdsListPerFile, 2, 3, ['supertermRepresentsLessSignificantSubterm'], False)
+	#T1 is larger than maxTermSize, T4 smaller than minTermSize and T5 not in the GMT
+	assert stageFeatures['readInputs']['inputTerms']==7
+	assert stageFeatures['summarize']['terms']==3
+	assert pairComparisons=={'recurringTermsUnified':3, 'supertermRepresentsLessSignificantSubterm':1}
+	assert stageFeatures['summarize']['bitsetBytes']==2*8
+	assert stageFeatures['readGmt']['loadedGmtTerms']==4
+	assert stageFeatures['writeResults']['rankCells']==4
+	stageFeatures, pairComparisons=getStageFeatures(gmtStatistics, termIdsListPerFile, 2, 3, ['supertermRepresentsLessSignificantSubterm'], True, 8)
+	assert stageFeatures['summarize']['bitsetBytes']==0
+	assert stageFeatures['readGmt']['loadedGmtGeneEntries']==10
+
+def test_fitCostModel(tmp_path):
+	measurements=[]
+	for size in range(1, 6):
+		measurement=dict()
+		for stage in STAGES:
+			features={feature:size*(featureNo+1)+(size*size if featureNo==0 else 0) for featureNo, feature in enumerate(sorted(set().union(*[COST_MODEL_FEATURES[model][stage] for model in COST_MODEL_FEATURES])))}
+			measurement[stage]=dict(features)
+			for model in COST_MODEL_FEATURES:
+				measurement[stage][model]=sum(2*features[feature] for feature in COST_MODEL_FEATURES[model][stage])
+		measurements.append(measurement)
+	costModel=fitCostModel(measurements)
+	for measurement in measurements:
+		for stage in STAGES:
+			for model in COST_MODEL_FEATURES:
+				predicted=sum(coefficient*measurement[stage][feature] for feature, coefficient in costModel[model][stage].items())
+				assert abs(predicted-measurement[stage][model])<=1E-6*max(1, measurement[stage][model])
+	writeCostModel({'seconds':{'writeResults':{'constant':1.0}}}, str(tmp_path / 'costModel.json'))
+	costModel=readCostModel(str(tmp_path / 'costModel.json'))
+	assert costModel['seconds']['writeResults']['constant']==1.0
+	assert costModel['seconds']['readGmt']==readCostModel()['seconds']['readGmt']
+
+def test_estimateRun():
+	stageFeatures={stage:{'constant':1} for stage in STAGES}
+	costModel={model:{stage:dict() for stage in STAGES} for model in COST_MODEL_FEATURES}
+	costModel['seconds']['readGmt']['constant']=2
+	costModel['seconds']['writeResults']['constant']=3
+	costModel['memory']['readGmt']['constant']=3*2**20
+	costModel['memory']['writeResults']['constant']=2**20
+	estimate=estimateRun(stageFeatures, dict(), costModel, 100)
+	assert estimate['seconds']==5
+	assert estimate['stages']['readInputs']['peakMemoryMB']==100
+	assert estimate['stages']['summarize']['peakMemoryMB']==103
+	assert estimate['peakMemoryMB']==104
+
+def test_runEstimate(tmp_path, capsys):
+	gmtPath=writeGmt(tmp_path)
+	(tmp_path / 'list.txt').write_text('T2\nT3\n')
+	estimate=runEstimate(getArgumentsDict(['--gmt', gmtPath, '--files', str(tmp_path / 'list.txt'), '--minTermSize', '1', '--estimate']))
+	assert json.loads(capsys.readouterr().out)==estimate
+	assert estimate['pairComparisons']=={'supertermRepresentsLessSignificantSubterm':1}
+	assert estimate['seconds']>0
+	assert not (tmp_path / 'log.txt').exists()
+
+def test_getArgumentsDict_estimate(tmp_path):
+	arguments=['--gmt', 'test.gmt', '--files', 'list.txt', '--estimate']
+	for extraArguments in [['--sweep'], ['--containmentIndex', str(tmp_path / 'index.npz')], ['--bootstrap', '10']]:
+		with pytest.raises(SystemExit):
+			getArgumentsDict(arguments+extraArguments)
@@ -0,0 +1,91 @@
+import os
+import pytest
+from orsum import getArgumentsDict, runFromArguments
+
+def writeGmt(path, termIdToGeneIndices):
+	genes=['g{}'.format(i) for i in range(40)]
+	with open(path, 'w') as f:
+		for termId, geneIndices in termIdToGeneIndices.items():
+			f.write('{}\tTerm {}\t{}\n'.format(termId, termId, '\t'.join(genes[i] for i in geneIndices)))
+
+def readSummaryColumn(outputFolder, column):
+	with open(os.path.join(outputFolder, 'filteredResult-Summary.tsv'), 'r') as f:
+		rows=[line.rstrip('\n').split('\t') for line in f]
+	return [row[rows[0].index(column)] for row in rows[1:]]
+
+def test_runMultiGmt_acrossNamespaces_sharedTerm(tmp_path):
+	#B is in both GMT files, it is taken from the first one and keeps rank 2
+	writeGmt(str(tmp_path / 'a.gmt'), {'A': range(0, 10), 'B': range(10, 20), 'C': range(20, 30)})
+	writeGmt(str(tmp_path / 'b.gmt'), {'B': range(10, 20), 'D': range(30, 40)})
+	(tmp_path / 'list.txt').write_text('A\nB\nD\nC\n')
+	outputFolder=str(tmp_path / 'output')
+	argsDict=getArgumentsDict(['--gmt', str(tmp_path / 'a.gmt'), str(tmp_path / 'b.gmt'), '--files', str(tmp_path / 'list.txt'), '--outputFolder', outputFolder, '--acrossNamespaces', '--minTermSize', '1'])
+	assert runFromArguments(argsDict)
+	assert readSummaryColumn(outputFolder, 'Representing term id')==['a:A', 'a:B', 'b:D', 'a:C']
+	assert readSummaryColumn(outputFolder, 'list.txt term rank')==['1', '2', '3', '4']
+	with open(os.path.join(outputFolder, 'log.txt'), 'r') as f:
+		assert '1 term of {} is in several GMT files, the namespace of the first one is used.'.format(tmp_path / 'list.txt') in f.read()
+
+def test_getArgumentsDict_cacheFolder(tmp_path):
+	arguments=['--gmt', 'a.gmt', '--files', 'list.txt', '--cacheFolder', str(tmp_path / 'cache')]
+	assert getArgumentsDict(arguments)['cacheFolder']==str(tmp_path / 'cache')
+	with pytest.raises(SystemExit):
+		getArgumentsDict(arguments+['--sweep'])
+	with pytest.raises(SystemExit):
+		getArgumentsDict(arguments[:2]+['b.gmt']+arguments[2:])
+
+def test_getArgumentsDict_topK():
+	arguments=['--gmt', 'a.gmt', '--files', 'list.txt']
+	assert getArgumentsDict(arguments+['--topK', '1'])['topK']==1
+	for topK in ['0', '-1']:
+		with pytest.raises(SystemExit):
+			getArgumentsDict(arguments+['--topK', topK])
+
+def test_getArgumentsDict_threads():
+	arguments=['--gmt', 'a.gmt', '--files', 'list.txt']
+	assert getArgumentsDict(arguments+['--threads', '1'])['threads']==1
+	for threads in ['0', '-2']:
+		with pytest.raises(SystemExit):
+			getArgumentsDict(arguments+['--threads', threads])
+
+def test_getArgumentsDict_heatmapTileRows():
+	arguments=['--gmt', 'a.gmt', '--files', 'list.txt', '--heatmapAllTerms']
+	assert getArgumentsDict(arguments+['--heatmapTileRows', '1'])['heatmapTileRows']==1
+	for heatmapTileRows in ['0', '-5']:
+		with pytest.raises(SystemExit):
+			getArgumentsDict(arguments+['--heatmapTileRows', heatmapTileRows])
+
+def test_getArgumentsDict_memoryBudget():
+	arguments=['--gmt', 'a.gmt', '--files', 'list.txt']
+	assert getArgumentsDict(arguments+['--memoryBudget', '100'])['memoryBudget']==100
+	for memoryBudget in ['0', '-100']:
+		with pytest.raises(SystemExit):
+			getArgumentsDict(arguments+['--memoryBudget', memoryBudget])
+
+def test_runSweep_fileAliases(tmp_path):
+	writeGmt(str(tmp_path / 'a.gmt'), {'A': range(0, 10), 'B': range(0, 20)})
+	(tmp_path / 'list.txt').write_text('B\nA\n')
+	arguments=['--gmt', str(tmp_path / 'a.gmt'), '--files', str(tmp_path / 'list.txt'), '--sweep', '--minTermSize', '1', '15', '--numberOfTermsToPlot', '60']
+	assert not runFromArguments(getArgumentsDict(arguments+['--outputFolder', str(tmp_path / 'output0'), '--fileAliases', 'a', 'b']))
+	assert not os.path.exists(str(tmp_path / 'output0' / 'sweepSummary.tsv'))
+	assert runFromArguments(getArgumentsDict(arguments+['--outputFolder', str(tmp_path / 'output1')]))
+	with open(str(tmp_path / 'output1' / 'sweepSummary.tsv'), 'r') as f:
+		assert [line.split('\t')[3:] for line in f.read().splitlines()[1:]]==[['2', '1'], ['1', '1']]
+	with open(str(tmp_path / 'output1' / 'log.txt'), 'r') as f:
+		assert 'Number of terms to be plotted was greater than 50, it is changed to 50.' in f.read()
+
+def test_runMultiGmt_output(tmp_path, capsys):
+	writeGmt(str(tmp_path / 'a.gmt'), {'A': range(0, 20), 'B': range(0, 10), 'C': range(20, 30)})
+	writeGmt(str(tmp_path / 'b.gmt'), {'D': range(0, 20), 'E': range(10, 20)})
+	(tmp_path / 'list.txt').write_text('A\nD\nB\nE\nC\n')
+	outputFolder=str(tmp_path / 'output')
+	argsDict=getArgumentsDict(['--gmt', str(tmp_path / 'a.gmt'), str(tmp_path / 'b.gmt'), '--files', str(tmp_path / 'list.txt'), '--outputFolder', outputFolder, '--minTermSize', '1', '--threads', '2'])
+	assert runFromArguments(argsDict)
+	assert readSummaryColumn(os.path.join(outputFolder, 'a'), 'Representing term id')==['A', 'C']
+	assert readSummaryColumn(os.path.join(outputFolder, 'b'), 'Representing term id')==['D']
+	#The messages of the parallel runs are printed after each other, in the order of the namespaces
+	output=capsys.readouterr().out
+	runOutputs=output[output.rindex('\nNamespace a\n'):].split('\nNamespace b\n')
+	assert len(runOutputs)==2
+	assert runOutputs[0].count('Initial term number: 3')==1 and runOutputs[0].count('Representing term number: 2')==1
+	assert runOutputs[1].count('Initial term number: 2')==1 and runOutputs[1].count('Representing term number: 1')==1
@@ -0,0 +1,140 @@
+import os
+import socket
+import threading
+import pytest
+import orsumServer
+from termCombinationLib import GmtModel, initializeTermSummary, applyRule, supertermRepresentsLessSignificantSubterm, writeTermSummaryFile
+from orsumServer import OrsumService, QueueFullError, JobError, createServer, sendRequest
+
+def createService(numberOfWorkers=2, queueSize=4, outputRoot=None):
+	genes=['g{}'.format(i) for i in range(40)]
+	gmtModel=GmtModel({'T{}'.format(i): set(genes[:40-i*3]) for i in range(6)}, {'T{}'.format(i): 'Term {}'.format(i) for i in range(6)})
+	return OrsumService({'test': gmtModel}, numberOfWorkers, queueSize, outputRoot), gmtModel
+
+def test_submit(tmp_path):
+	service, gmtModel=createService(outputRoot=str(tmp_path / 'root'))
+	service.start()
+	result=service.submit({'enrichmentResults': [['T1', 'T3', 'T4', 'UNKNOWN']], 'fileAliases': ['a'], 'minTermSize': 1})
+	assert result['representativeTermNumber']==1
+	assert '1 term is not in GMT, it is removed.' in result['log']
+	termSummary=applyRule(initializeTermSummary([['T1', 'T3', 'T4']]), gmtModel, int(1E6), supertermRepresentsLessSignificantSubterm)
+	writeTermSummaryFile(termSummary, gmtModel, [['T1', 'T3', 'T4']], ['a'], str(tmp_path / 'Detailed.tsv'), str(tmp_path / 'Summary.tsv'))
+	assert result['files']['filteredResult-Summary.tsv']==(tmp_path / 'Summary.tsv').read_text()
+	assert result['files']['filteredResultIDMapping.tsv'].splitlines()[1:]==['T1\tT1', 'T1\tT3', 'T1\tT4']
+	#Files written to an output folder under the output root
+	result=service.submit({'gmt': 'test', 'enrichmentResults': [['T3', 'T1']], 'minTermSize': 1, 'outputFolder': 'output'})
+	assert result['files']['filteredResult-Summary.tsv']==os.path.realpath(str(tmp_path / 'root' / 'output' / 'filteredResult-Summary.tsv'))
+	assert os.path.exists(result['files']['filteredResult-Detailed.tsv'])
+	with pytest.raises(JobError):
+		service.submit({'gmt': 'other', 'enrichmentResults': [['T1']]})
+	service.stop()
+	assert service.getMetrics()['completedJobs']==2
+
+def test_submit_output(capsys):
+	#Messages of the jobs are returned with their results, not printed by the server
+	service, gmtModel=createService()
+	service.start()
+	server=runServer(service, port=0)
+	try:
+		status, response=sendRequest('POST', '/summarize', {'enrichmentResults': [['T3', 'UNKNOWN', 'T1'], ['OTHER']], 'minTermSize': 1}, port=server.server_address[1])
+		assert status==200
+	finally:
+		server.shutdown()
+		server.server_close()
+		service.stop()
+	assert capsys.readouterr().out==''
+	assert 'UNKNOWN is not in gmt file' in response['output'] and 'OTHER is not in gmt file' in response['output']
+	assert 'Representing term number: 2' in response['output']
+
+def test_queueFull():
+	service, gmtModel=createService(numberOfWorkers=1, queueSize=2)
+	#Jobs wait in the queue until the workers are started
+	jobs=[service.enqueue({'enrichmentResults': [['T2', 'T5']], 'minTermSize': 1}) for i in range(2)]
+	with pytest.raises(QueueFullError):
+		service.enqueue({'enrichmentResults': [['T2']]})
+	metrics=service.getMetrics()
+	assert metrics['queueDepth']==2 and metrics['rejectedJobs']==1 and metrics['latency'] is None
+	service.start()
+	for job in jobs:
+		assert job.event.wait(60) and job.error is None
+	service.stop()
+	metrics=service.getMetrics()
+	assert metrics['queueDepth']==0 and metrics['completedJobs']==2 and metrics['latency']['count']==2
+
+def runServer(service, port=None, socketPath=None):
+	server=createServer(service, port, socketPath, quiet=True)
+	thread=threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	return server
+
+def test_server_http():
+	service, gmtModel=createService()
+	service.start()
+	server=runServer(service, port=0)
+	port=server.server_address[1]
+	try:
+		status, response=sendRequest('POST', '/summarize', {'enrichmentResults': [['T3', 'T1'], ['T0', 'T5']], 'minTermSize': 1}, port=port)
+		assert status==200 and response['representativeTermNumber']==2
+		status, response=sendRequest('POST', '/summarize', {'enrichmentResults': 'T1'}, port=port)
+		assert status==400
+		status, response=sendRequest('POST', '/summarize', {'enrichmentResults': [['T1']], 'minTermSize': '10'}, port=port)
+		assert status==400 and response['error']=='minTermSize must be an integer.'
+		status, metrics=sendRequest('GET', '/metrics', port=port)
+		assert status==200 and metrics['completedJobs']==1 and metrics['queueCapacity']==4
+		assert sendRequest('GET', '/health', port=port)==(200, {'gmts': ['test']})
+	finally:
+		server.shutdown()
+		server.server_close()
+		service.stop()
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix sockets are not available')
+def test_server_unixSocket(tmp_path):
+	service, gmtModel=createService()
+	service.start()
+	socketPath=str(tmp_path / 'orsum.sock')
+	server=runServer(service, socketPath=socketPath)
+	try:
+		status, response=sendRequest('POST', '/summarize', {'enrichmentResults': [['T1', 'T3']], 'minTermSize': 1}, socketPath=socketPath)
+		assert status==200 and response['representativeTermNumber']==1
+	finally:
+		server.shutdown()
+		server.server_close()
+		service.stop()
+
+def test_getJobParameters(tmp_path):
+	service, gmtModel=createService(outputRoot=str(tmp_path / 'root'))
+	job={'enrichmentResults': [['T1']]}
+	assert service.getJobParameters(dict(job, outputFolder='a/../b'))['outputFolder']==os.path.realpath(str(tmp_path / 'root' / 'b'))
+	for outputFolder in [str(tmp_path / 'output'), '../output', 'a/../../output']:
+		with pytest.raises(JobError):
+			service.getJobParameters(dict(job, outputFolder=outputFolder))
+	os.makedirs(str(tmp_path / 'root'))
+	os.symlink(str(tmp_path), str(tmp_path / 'root' / 'link'))
+	with pytest.raises(JobError):
+		service.getJobParameters(dict(job, outputFolder='link/output'))
+	for parameters in [{'minTermSize': '10'}, {'topK': 1.5}, {'topK': 0}, {'maxRepSize': True}, {'fileAliases': 'a'}, {'rules': [['supertermRepresentsLessSignificantSubterm']]}, {'outputFolder': 1}]:
+		with pytest.raises(JobError):
+			service.getJobParameters(dict(job, **parameters))
+	assert service.getJobParameters(dict(job, topK=None))['topK'] is None
+	#Without output root, the results can only be returned
+	service, gmtModel=createService()
+	with pytest.raises(JobError):
+		service.getJobParameters(dict(job, outputFolder='output'))
+
+def test_runJob_writeError(tmp_path, monkeypatch):
+	#The writers print I/O errors instead of raising them
+	monkeypatch.setattr(orsumServer, 'writeTermSummaryFile', lambda *args: print('I/O error while writing term summary file.'))
+	service, gmtModel=createService(outputRoot=str(tmp_path))
+	(tmp_path / 'output').mkdir()
+	(tmp_path / 'output' / 'filteredResult-Summary.tsv').write_text('Result of an earlier job\n')
+	with pytest.raises(IOError):
+		orsumServer.runJob(gmtModel, service.getJobParameters({'enrichmentResults': [['T1']], 'minTermSize': 1, 'outputFolder': 'output'}))
+	service.start()
+	server=runServer(service, port=0)
+	try:
+		status, response=sendRequest('POST', '/summarize', {'enrichmentResults': [['T1']], 'minTermSize': 1}, port=server.server_address[1])
+		assert status==500 and 'filteredResult-Detailed.tsv' in response['error']
+	finally:
+		server.shutdown()
+		server.server_close()
+		service.stop()
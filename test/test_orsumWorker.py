@@ -0,0 +1,95 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+from orsumWorker import submitJob, claimJob, work, requeueStaleJobs, keepClaimAlive, COMPLETION_MARKER, PENDING_FOLDER, CLAIMED_FOLDER, DONE_FOLDER, FAILED_FOLDER
+
+def writeInputs(tmp_path):
+	genes=['g{}'.format(i) for i in range(40)]
+	gmtLines=['T{}\tTerm {}\t{}'.format(i, i, '\t'.join(genes[:40-i*3])) for i in range(6)]
+	(tmp_path / 'test.gmt').write_text('\n'.join(gmtLines)+'\n')
+	(tmp_path / 'list0.txt').write_text('T3\nT1\nT4\n')
+	(tmp_path / 'list1.txt').write_text('T0\nT5\nT2\n')
+	return str(tmp_path / 'test.gmt')
+
+def test_claimJob(tmp_path):
+	queueFolder=str(tmp_path / 'queue')
+	submitJob(queueFolder, ['--gmt', 'test.gmt'], 'job1')
+	jobName, claimedPath=claimJob(queueFolder, 'worker1')
+	assert jobName=='job1'
+	assert os.path.basename(claimedPath)=='job1@worker1.json'
+	assert claimJob(queueFolder, 'worker2') is None
+	with open(claimedPath, 'r') as f:
+		assert json.load(f)['arguments']==['--gmt', 'test.gmt']
+
+def test_work(tmp_path):
+	gmtPath=writeInputs(tmp_path)
+	queueFolder=str(tmp_path / 'queue')
+	gmtCacheFolder=str(tmp_path / 'gmtCache')
+	jobNames=[]
+	for i in range(6):
+		outputFolder=str(tmp_path / 'output{}'.format(i))
+		os.makedirs(outputFolder)
+		inputFile=str(tmp_path / 'list{}.txt'.format(i%2))
+		jobNames.append(submitJob(queueFolder, ['--gmt', gmtPath, '--files', inputFile, '--outputFolder', outputFolder, '--minTermSize', '1'], 'job{}'.format(i)))
+	jobNames.append(submitJob(queueFolder, ['--gmt', gmtPath, '--files', str(tmp_path / 'missing.txt'), '--outputFolder', str(tmp_path)], 'failingJob'))
+	workers=[multiprocessing.Process(target=work, args=(queueFolder, gmtCacheFolder, True)) for i in range(3)]
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+		assert worker.exitcode==0
+	assert os.listdir(os.path.join(queueFolder, PENDING_FOLDER))==[]
+	assert os.listdir(os.path.join(queueFolder, CLAIMED_FOLDER))==[]
+	assert sorted(os.listdir(os.path.join(queueFolder, DONE_FOLDER)))==['job{}.json'.format(i) for i in range(6)]
+	assert os.listdir(os.path.join(queueFolder, FAILED_FOLDER))==['failingJob.json']
+	for i in range(6):
+		with open(os.path.join(queueFolder, DONE_FOLDER, 'job{}.json'.format(i)), 'r') as f:
+			assert json.load(f)['succeeded']
+		assert os.path.exists(str(tmp_path / 'output{}'.format(i) / COMPLETION_MARKER))
+		assert os.path.exists(str(tmp_path / 'output{}'.format(i) / 'filteredResult-Summary.tsv'))
+	with open(os.path.join(queueFolder, FAILED_FOLDER, 'failingJob.json'), 'r') as f:
+		assert 'error' in json.load(f)
+	assert [fileName.endswith('.pickle') for fileName in os.listdir(gmtCacheFolder)]==[True]
+
+def test_work_runError(tmp_path):
+	gmtPath=writeInputs(tmp_path)
+	queueFolder=str(tmp_path / 'queue')
+	outputFolder=str(tmp_path / 'output')
+	submitJob(queueFolder, ['--gmt', gmtPath, '--files', str(tmp_path / 'list0.txt'), '--fileAliases', 'a', 'b', '--outputFolder', outputFolder, '--minTermSize', '1'], 'aliasJob')
+	assert work(queueFolder, None, True)==['aliasJob']
+	assert os.listdir(os.path.join(queueFolder, DONE_FOLDER))==[]
+	assert os.listdir(os.path.join(queueFolder, FAILED_FOLDER))==['aliasJob.json']
+	with open(os.path.join(queueFolder, FAILED_FOLDER, 'aliasJob.json'), 'r') as f:
+		assert 'log.txt' in json.load(f)['error']
+	assert not os.path.exists(os.path.join(outputFolder, COMPLETION_MARKER))
+	with open(os.path.join(outputFolder, 'log.txt'), 'r') as f:
+		assert 'Number of input files and aliases do not match.' in f.read()
+
+def test_requeueStaleJobs(tmp_path):
+	queueFolder=str(tmp_path / 'queue')
+	for jobName in ['job1', 'job2']:
+		submitJob(queueFolder, ['--gmt', 'test.gmt'], jobName)
+	claimedPaths=[claimJob(queueFolder, 'worker1')[1], claimJob(queueFolder, 'worker2')[1]]
+	assert requeueStaleJobs(queueFolder, 100)==[]
+	#The worker of job1 stopped updating its claim
+	oldTime=time.time()-1000
+	os.utime(claimedPaths[0], (oldTime, oldTime))
+	assert requeueStaleJobs(queueFolder, 100)==['job1']
+	assert os.listdir(os.path.join(queueFolder, PENDING_FOLDER))==['job1.json']
+	assert os.listdir(os.path.join(queueFolder, CLAIMED_FOLDER))==['job2@worker2.json']
+	assert claimJob(queueFolder, 'worker3')[0]=='job1'
+
+def test_keepClaimAlive(tmp_path):
+	claimedPath=str(tmp_path / 'job@worker.json')
+	(tmp_path / 'job@worker.json').write_text('{}')
+	oldTime=time.time()-1000
+	os.utime(claimedPath, (oldTime, oldTime))
+	stopEvent=threading.Event()
+	heartbeat=threading.Thread(target=keepClaimAlive, args=(claimedPath, stopEvent, 0.01))
+	heartbeat.start()
+	time.sleep(0.1)
+	stopEvent.set()
+	heartbeat.join()
+	assert time.time()-os.path.getmtime(claimedPath)<100
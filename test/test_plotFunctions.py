@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as ps
+from plotFunctions import calculateQuartileFromRanks, aggregateRows, orsum_heatmap_large, orsum_heatmap_tiles
+
+def test_calculateQuartileFromRanks():
+	allRanks_array=np.array([[1, np.nan], [2, 1], [3, 5], [4, 9], [5, np.nan], [6, 12], [7, 20], [8, 30]])
+	quartiles=calculateQuartileFromRanks(allRanks_array)
+	assert np.array_equal(quartiles[:, 0], [1, 1, 2, 2, 3, 3, 4, 4])
+	assert np.array_equal(quartiles[:, 1], [np.nan, 1, 1, 2, np.nan, 3, 4, 4], equal_nan=True)
+
+def test_aggregateRows():
+	array=np.array([[4, np.nan], [2, np.nan], [3, 1], [np.nan, np.nan], [1, 4]])
+	aggregated, blockSize=aggregateRows(array, 3)
+	assert blockSize==2
+	assert np.array_equal(aggregated, [[2, np.nan], [3, 1], [1, 4]], equal_nan=True)
+	assert aggregateRows(array, 5)[1]==1
+
+def test_orsum_heatmap_large(tmp_path):
+	quartiles=calculateQuartileFromRanks(np.arange(1, 301, dtype=float).reshape(100, 3))
+	df=ps.DataFrame({'labels': ['Term {}'.format(termNo) for termNo in range(100)]})
+	plotName=orsum_heatmap_large(quartiles, df, str(tmp_path / 'HeatmapAll'), ['a', 'b', 'c'], maxRows=40)
+	assert (tmp_path / 'HeatmapAll.png').exists() and plotName==str(tmp_path / 'HeatmapAll.png')
+	plotNames=orsum_heatmap_tiles(quartiles, df, str(tmp_path / 'HeatmapAll'), ['a', 'b', 'c'], 40)
+	assert plotNames==[str(tmp_path / 'HeatmapAll-{}.png'.format(tileNo)) for tileNo in [1, 2, 3]]
+	assert all((tmp_path / 'HeatmapAll-{}.png'.format(tileNo)).exists() for tileNo in [1, 2, 3])
@@ -0,0 +1,50 @@
+import os
+from resultCache import hashFile, createCacheKey, getCachedResult, copyCachedResult, readCachedTermSummary, storeResult, getCachedFilteredList, storeFilteredList, evictLeastRecentlyUsed
+
+def test_createCacheKey():
+	assert createCacheKey('1.9.0', 'abc', ['x', 'y'], 10)==createCacheKey('1.9.0', 'abc', ['x', 'y'], 10)
+	assert createCacheKey('1.9.0', 'abc', ['x', 'y'], 10)!=createCacheKey('1.9.0', 'abc', ['y', 'x'], 10)
+
+def test_hashFile(tmp_path):
+	(tmp_path / 'a.txt').write_text('term1\nterm2\n')
+	(tmp_path / 'b.txt').write_text('term1\nterm2\n')
+	(tmp_path / 'c.txt').write_text('term2\nterm1\n')
+	assert hashFile(str(tmp_path / 'a.txt'))==hashFile(str(tmp_path / 'b.txt'))
+	assert hashFile(str(tmp_path / 'a.txt'))!=hashFile(str(tmp_path / 'c.txt'))
+
+def test_storeResult(tmp_path):
+	outputFolder=tmp_path / 'output'
+	outputFolder.mkdir()
+	(outputFolder / 'filteredResult-Summary.tsv').write_text('summary')
+	cacheFolder=str(tmp_path / 'cache')
+	termSummary=[['term1', ['term1', 'term2'], 1]]
+	assert getCachedResult(cacheFolder, 'key1') is None
+	storeResult(cacheFolder, 'key1', str(outputFolder), ['filteredResult-Summary.tsv'], termSummary)
+	resultFolder=getCachedResult(cacheFolder, 'key1')
+	assert readCachedTermSummary(resultFolder)==termSummary
+	newOutputFolder=tmp_path / 'newOutput'
+	newOutputFolder.mkdir()
+	copyCachedResult(resultFolder, str(newOutputFolder))
+	assert os.listdir(str(newOutputFolder))==['filteredResult-Summary.tsv']
+	assert (newOutputFolder / 'filteredResult-Summary.tsv').read_text()=='summary'
+
+def test_filteredList(tmp_path):
+	cacheFolder=str(tmp_path / 'cache')
+	assert getCachedFilteredList(cacheFolder, 'key1') is None
+	storeFilteredList(cacheFolder, 'key1', ['term1', 'term3'], [['1 term is not in GMT, it is removed.', '1 term is not in GMT, it is removed.\n']])
+	termIdsList, messages=getCachedFilteredList(cacheFolder, 'key1')
+	assert termIdsList==['term1', 'term3']
+	assert len(messages)==1
+
+def test_evictLeastRecentlyUsed(tmp_path):
+	cacheFolder=str(tmp_path / 'cache')
+	for keyNo in range(3):
+		storeFilteredList(cacheFolder, 'key{}'.format(keyNo), ['term']*100, [])
+		filePath=os.path.join(cacheFolder, 'filteredLists', 'key{}.json'.format(keyNo))
+		os.utime(filePath, (1000+keyNo, 1000+keyNo))
+	getCachedFilteredList(cacheFolder, 'key0')#key0 becomes the most recently used
+	entrySize=os.path.getsize(os.path.join(cacheFolder, 'filteredLists', 'key0.json'))
+	removedPaths=evictLeastRecentlyUsed(cacheFolder, 2*entrySize)
+	assert [os.path.basename(path) for path in removedPaths]==['key1.json']
+	assert getCachedFilteredList(cacheFolder, 'key0') is not None
+	assert getCachedFilteredList(cacheFolder, 'key2') is not None
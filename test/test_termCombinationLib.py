@@ -1,4 +1,11 @@
-from termCombinationLib import initializeTermSummary, applyRule, recurringTermsUnified, supertermRepresentsLessSignificantSubterm, subtermRepresentsLessSignificantSimilarSuperterm, subtermRepresentsSupertermWithLessSignificanceAndLessRepresentativePower, commonSupertermInListRepresentsSubtermsWithLessRepresentativePower, supertermRepresentsSubtermLargerThanMaxRep
+import numpy as np
+import termCombinationLib
+from benchmark import createRandomGeneSets, createRandomEnrichmentResults
+from termCombinationLib import initializeTermSummary, applyRule, generateRepresentatives, indexTermSummary, recurringTermsUnified, supertermRepresentsLessSignificantSubterm
+from termCombinationLib import reduceEnrichmentResult, summarizeMapReduce, combineGmtModels
+from termCombinationLib import GmtModel, removeUnknownTerms, removeTermsSmallerThanMinTermSize, removeTermsLargerThanMaxTermSize, createRankTables, getBestRanks, readGmtModel, buildContainmentIndex, readEnrichmentTable
+from termCombinationLib import updateContainmentIndex, writeContainmentIndex, readContainmentIndex, bootstrapRepresentatives, getJitteredRanks
+import random
 
 def test_initializeTermSummary_singleInput():
 	tbsGsIDsList=[['term1', 'term2', 'term3']]
@@ -56,3 +63,224 @@ def test_rule_supertermRepresentsLessSignificantSubterm():
 		['term4', ['term4', 'term6'], 4],
 		]
 
+
+def test_rule_supertermRepresentsLessSignificantSubterm_maxRepresentativeTermSize():
+	tbsGsIDsList=[['term1', 'term2', 'term3', 'term4']]
+	termSummary=initializeTermSummary(tbsGsIDsList)
+	geneSetsDict={
+		'term1':{'A','B','C','D','E'},
+		'term2':{'A','B','C'},
+		'term3':{'A','B'},
+		'term4':{'C'}
+		}
+	termSummary=applyRule(termSummary, geneSetsDict, 3, supertermRepresentsLessSignificantSubterm)
+	assert termSummary==[
+		['term1', ['term1'], 1],
+		['term2', ['term2', 'term3', 'term4'], 2],
+		]
+
+def test_rule_batchMask():
+	tbsGsIDsList=[['term1', 'term2', 'term3', 'term4']]
+	termSummary=initializeTermSummary(tbsGsIDsList)
+	geneSetsDict={
+		'term1':{'A','B','C'},
+		'term2':{'A','B','C','D'},
+		'term3':{'A','C'},
+		'term4':{'A','B','C'}
+		}
+	termIndex=indexTermSummary(termSummary, geneSetsDict, 2000)
+	isRepresented=supertermRepresentsLessSignificantSubterm(termIndex, 0, np.array([1, 2, 3]))
+	assert isRepresented.tolist()==[False, True, True]
+
+def test_rule_chained():
+	tbsGsIDsList=[['term1', 'term2', 'term3'], ['term3', 'term4', 'term1']]
+	termSummary=initializeTermSummary(tbsGsIDsList)
+	geneSetsDict={
+		'term1':{'A','B','C'},
+		'term2':{'D','E'},
+		'term3':{'A','B'},
+		'term4':{'D'}
+		}
+	termSummary=applyRule(termSummary, geneSetsDict, 2000, recurringTermsUnified)
+	termSummary=applyRule(termSummary, geneSetsDict, 2000, supertermRepresentsLessSignificantSubterm)
+	assert termSummary==[
+		['term1', ['term1', 'term3'], 1],
+		['term2', ['term2', 'term4'], 2],
+		]
+
+def test_applyRule_threads(monkeypatch):
+	geneSetsDict, termNamesDict=createRandomGeneSets(400, 200, 3)
+	tbsGsIDsList=createRandomEnrichmentResults(geneSetsDict.keys(), 2, 300, 3)
+	termSummaries=[]
+	#Batches of representative terms, then candidates split into chunks
+	for numberOfThreads, minCandidatesPerThread in [(1, 4096), (4, 4096), (4, 8)]:
+		monkeypatch.setattr(termCombinationLib, 'MIN_CANDIDATES_PER_THREAD', minCandidatesPerThread)
+		termSummary=initializeTermSummary(tbsGsIDsList)
+		termSummary=applyRule(termSummary, geneSetsDict, 2000, recurringTermsUnified, numberOfThreads)
+		termSummary=applyRule(termSummary, geneSetsDict, 50, supertermRepresentsLessSignificantSubterm, numberOfThreads)
+		termSummaries.append(termSummary)
+	assert termSummaries[0]==termSummaries[1]==termSummaries[2]
+
+def test_gmtModel():
+	gmtModel=GmtModel({'term1':{'A','B','C'}, 'term2':{'B'}, 'term3':{'A','B','C','D','E'}}, {'term1':'Term 1', 'term2':'Term 2', 'term3':'Term 3'})
+	assert gmtModel.getTermSize('term3')==5
+	assert gmtModel.getTermName('term2')=='Term 2'
+	assert gmtModel['term1']=={'A','B','C'}
+	assert 'term4' not in gmtModel
+	assert gmtModel.sizeMask(['term3', 'term2', 'term1'], minTermSize=2).tolist()==[True, False, True]
+	assert gmtModel.sizeMask(['term3', 'term2', 'term1'], minTermSize=2, maxRepresentativeTermSize=4).tolist()==[False, False, True]
+
+def test_removeTerms():
+	gmtModel=GmtModel({'term1':{'A','B','C'}, 'term2':{'B'}, 'term3':{'A','B','C','D','E'}})
+	termIdsList=removeUnknownTerms(['term3', 'term4', 'term2', 'term1'], gmtModel)
+	assert termIdsList==['term3', 'term2', 'term1']
+	assert removeTermsSmallerThanMinTermSize(termIdsList, gmtModel, 2)==['term3', 'term1']
+	assert removeTermsLargerThanMaxTermSize(termIdsList, gmtModel, 3)==['term2', 'term1']
+
+def test_getBestRanks():
+	rankTables=createRankTables([['term1', 'term2', 'term3'], ['term3', 'term4']])
+	assert getBestRanks(['term2', 'term3'], rankTables)==[2, 1]
+	assert getBestRanks(['term1'], rankTables)==[1, None]
+
+def test_applyRule_maxMemory():
+	geneSetsDict, termNamesDict=createRandomGeneSets(400, 200, 5)
+	tbsGsIDsList=createRandomEnrichmentResults(geneSetsDict.keys(), 1, 300, 5)
+	termSummaries=[]
+	for maxMemory in [None, 0]:
+		termSummary=initializeTermSummary(tbsGsIDsList)
+		termSummary=applyRule(termSummary, geneSetsDict, 50, supertermRepresentsLessSignificantSubterm, maxMemory=maxMemory)
+		termSummaries.append(termSummary)
+	assert termSummaries[0]==termSummaries[1]
+
+def test_readGmtModel_termIdsToKeep(tmp_path):
+	gmtPath=tmp_path / 'test.gmt'
+	gmtPath.write_text('term1\tTerm 1\tA\tB\nterm2\tTerm 2\tB\tC\tD\nterm3\tTerm 3\tE\n')
+	gmtModel=readGmtModel(str(gmtPath), {'term2', 'term3'})
+	assert list(gmtModel)==['term2', 'term3']
+	assert gmtModel.getTermSize('term2')==3
+	assert gmtModel.getTermName('term3')=='Term 3'
+
+def test_generateRepresentatives_topK():
+	geneSetsDict, termNamesDict=createRandomGeneSets(400, 200, 7)
+	tbsGsIDsList=createRandomEnrichmentResults(geneSetsDict.keys(), 1, 300, 7)
+	termSummary=applyRule(initializeTermSummary(tbsGsIDsList), geneSetsDict, 50, supertermRepresentsLessSignificantSubterm)
+	topTermSummary=[]
+	for representative in generateRepresentatives(initializeTermSummary(tbsGsIDsList), geneSetsDict, 50, supertermRepresentsLessSignificantSubterm):
+		topTermSummary.append(representative)
+		if len(topTermSummary)==10:
+			break
+	assert topTermSummary==termSummary[:10]
+
+def test_buildContainmentIndex():
+	geneSetsDict, termNamesDict=createRandomGeneSets(300, 100, 11)
+	gmtModel=GmtModel(geneSetsDict)
+	termIds=list(geneSetsDict)[:200]
+	containmentIndex=buildContainmentIndex(gmtModel, termIds, blockSize=64)
+	for termId in termIds:
+		subterms={otherTermId for otherTermId in termIds if otherTermId!=termId and geneSetsDict[otherTermId].issubset(geneSetsDict[termId])}
+		assert set(containmentIndex.getSubterms(termId))==subterms
+
+def test_applyRule_containmentIndex():
+	geneSetsDict, termNamesDict=createRandomGeneSets(400, 200, 13)
+	tbsGsIDsList=createRandomEnrichmentResults(geneSetsDict.keys(), 2, 300, 13)
+	gmtModel=GmtModel(geneSetsDict)
+	containmentIndex=buildContainmentIndex(gmtModel, list(geneSetsDict))
+	for maxRepresentativeTermSize in [30, int(1E6)]:
+		termSummary=applyRule(initializeTermSummary(tbsGsIDsList), gmtModel, maxRepresentativeTermSize, supertermRepresentsLessSignificantSubterm)
+		termSummaryIndexed=applyRule(initializeTermSummary(tbsGsIDsList), gmtModel, maxRepresentativeTermSize, supertermRepresentsLessSignificantSubterm, containmentIndex=containmentIndex)
+		assert termSummary==termSummaryIndexed
+
+def test_updateContainmentIndex(tmp_path):
+	geneSetsDict, termNamesDict=createRandomGeneSets(300, 100, 17)
+	geneSetsDict['TERM:EMPTY']=set()
+	containmentIndex, addedTermIds, removedTermIds, changedTermIds=updateContainmentIndex(None, GmtModel(geneSetsDict), blockSize=64)
+	assert len(addedTermIds)==len(geneSetsDict) and removedTermIds==[] and changedTermIds==[]
+	writeContainmentIndex(containmentIndex, str(tmp_path / 'index.npz'))
+	containmentIndex=readContainmentIndex(str(tmp_path / 'index.npz'))
+	#Next release, with removed, changed and added terms in a different order
+	rng=random.Random(17)
+	termIds=list(geneSetsDict)
+	rng.shuffle(termIds)
+	removed=set(termIds[:20])
+	changed=set(termIds[20:40])
+	newGeneSetsDict={termId:(set(sorted(geneSetsDict[termId])[1:]) if termId in changed else geneSetsDict[termId]) for termId in termIds if termId not in removed}
+	newGeneSetsDict.update({'TERM:NEW{}'.format(termNo):set(rng.sample(sorted(geneSetsDict[termIds[termNo]] | {'GENE1'}), 1)) for termNo in range(40, 50)})
+	newGmtModel=GmtModel(newGeneSetsDict)
+	updatedContainmentIndex, addedTermIds, removedTermIds, changedTermIds=updateContainmentIndex(containmentIndex, newGmtModel, blockSize=8)
+	assert set(addedTermIds)=={'TERM:NEW{}'.format(termNo) for termNo in range(40, 50)}
+	assert set(removedTermIds)==removed
+	assert set(changedTermIds)=={termId for termId in changed if geneSetsDict[termId]!=newGeneSetsDict[termId]}
+	rebuiltContainmentIndex=buildContainmentIndex(newGmtModel, newGmtModel.termIds)
+	assert updatedContainmentIndex.termIds==rebuiltContainmentIndex.termIds
+	assert updatedContainmentIndex.getRelations()==rebuiltContainmentIndex.getRelations()
+
+def test_bootstrapRepresentatives():
+	geneSetsDict, termNamesDict=createRandomGeneSets(500, 200, 19)
+	tbsGsIDsList=createRandomEnrichmentResults(geneSetsDict.keys(), 3, 150, 19)
+	gmtModel=GmtModel(geneSetsDict)
+	representativeCounts=bootstrapRepresentatives(tbsGsIDsList, gmtModel, 50, 20, 0.5, 19, numberOfThreads=2, maxChunkSize=5000)
+	#Each replicate summarized with the rules
+	jitteredRanks=getJitteredRanks([len(termIdsList) for termIdsList in tbsGsIDsList], 0.5, np.random.SeedSequence(19).spawn(20))
+	expectedCounts=dict.fromkeys(representativeCounts, 0)
+	for replicateNo in range(20):
+		jitteredLists=[]
+		start=0
+		for termIdsList in tbsGsIDsList:
+			jitteredLists.append([termIdsList[termNo] for termNo in np.argsort(jitteredRanks[replicateNo, start:start+len(termIdsList)])])
+			start+=len(termIdsList)
+		termSummary=applyRule(initializeTermSummary(jitteredLists), gmtModel, 50, recurringTermsUnified)
+		termSummary=applyRule(termSummary, gmtModel, 50, supertermRepresentsLessSignificantSubterm)
+		for ts in termSummary:
+			expectedCounts[ts[0]]+=1
+	assert representativeCounts==expectedCounts
+	#Without jitter, the replicates are the same as the summary
+	representativeCounts=bootstrapRepresentatives(tbsGsIDsList, gmtModel, 50, 3, 0.0)
+	termSummary=applyRule(initializeTermSummary(tbsGsIDsList), gmtModel, 50, recurringTermsUnified)
+	termSummary=applyRule(termSummary, gmtModel, 50, supertermRepresentsLessSignificantSubterm)
+	assert {termId for termId, count in representativeCounts.items() if count==3}=={ts[0] for ts in termSummary}
+	assert set(representativeCounts.values())=={0, 3}
+
+def test_reduceEnrichmentResult():
+	gmtModel=GmtModel({'term1':{'A','B','C'}, 'term2':{'B'}, 'term3':{'A','B','C','D','E'}, 'term4':{'D','F'}})
+	candidateTermIds, rankTable=reduceEnrichmentResult(['term1', 'term3', 'term2', 'term4'], gmtModel, int(1E6))
+	assert candidateTermIds==['term1', 'term3', 'term4']
+	assert rankTable=={'term1':1, 'term3':2, 'term2':3, 'term4':4}
+	candidateTermIds, rankTable=reduceEnrichmentResult(['term3', 'term1', 'term2'], gmtModel, 4)
+	assert candidateTermIds==['term3', 'term1']
+
+def test_summarizeMapReduce():
+	geneSetsDict, termNamesDict=createRandomGeneSets(400, 100, 17)
+	geneSetsDict['emptyTerm']=set()
+	gmtModel=GmtModel(geneSetsDict)
+	for seed in range(3):
+		tbsGsIDsList=createRandomEnrichmentResults(geneSetsDict.keys(), 4, 250, seed)
+		for maxRepresentativeTermSize in [10, int(1E6)]:
+			termSummary=applyRule(initializeTermSummary(tbsGsIDsList), gmtModel, maxRepresentativeTermSize, recurringTermsUnified)
+			termSummary=applyRule(termSummary, gmtModel, maxRepresentativeTermSize, supertermRepresentsLessSignificantSubterm)
+			assert summarizeMapReduce(tbsGsIDsList, gmtModel, maxRepresentativeTermSize, numberOfThreads=2)==termSummary
+
+def test_combineGmtModels_sharedGenes(tmp_path):
+	gmtPath1=tmp_path / 'first.gmt'
+	gmtPath1.write_text('term1\tTerm 1\tA\tB\nterm2\tTerm 2\tB\n')
+	gmtPath2=tmp_path / 'second.gmt'
+	gmtPath2.write_text('term1\tOther term 1\tB\tC\nterm3\tTerm 3\tA\tB\tC\n')
+	geneIds=[]
+	geneIdToIndex=dict()
+	gmtModels=[readGmtModel(str(gmtPath), None, geneIds, geneIdToIndex) for gmtPath in [gmtPath1, gmtPath2]]
+	assert sorted(geneIds)==['A', 'B', 'C']
+	assert gmtModels[0].geneIds is gmtModels[1].geneIds
+	gmtModel=combineGmtModels(gmtModels, ['first', 'second'])
+	assert list(gmtModel)==['first:term1', 'first:term2', 'second:term1', 'second:term3']
+	assert gmtModel['second:term1']=={'B', 'C'}
+	assert gmtModel.getTermName('second:term1')=='Other term 1'
+	termSummary=applyRule(initializeTermSummary([['second:term3', 'first:term1', 'second:term1', 'first:term2']]), gmtModel, int(1E6), supertermRepresentsLessSignificantSubterm)
+	assert termSummary==[['second:term3', ['second:term3', 'first:term1', 'second:term1', 'first:term2'], 1]]
+
+def test_readEnrichmentTable(tmp_path):
+	tablePath=tmp_path / 'table.csv'
+	tablePath.write_text('ID,Description,pvalue,p.adjust\nterm3,"Term 3, c",0.01,0.2\nterm1,Term 1,0.001,0.01\n"term2",Term 2,0.0005,NA\nterm4,Term 4,0.002,0.04\n')
+	assert readEnrichmentTable(str(tablePath), 'ID', delimiter=',')==['term3', 'term1', 'term2', 'term4']
+	assert readEnrichmentTable(str(tablePath), 'ID', 'pvalue', delimiter=',')==['term2', 'term1', 'term4', 'term3']
+	assert readEnrichmentTable(str(tablePath), 'ID', 'pvalue', ascending=False, delimiter=',')==['term3', 'term4', 'term1', 'term2']
+	assert readEnrichmentTable(str(tablePath), 'ID', 'pvalue', delimiter=',', cutoffs=[('p.adjust', 0.05)], chunkSize=2)==['term1', 'term4']
+	assert readEnrichmentTable(str(tablePath), 'ID', 'pvalue', delimiter=',', cutoffs=[('pvalue', 0.001), ('p.adjust', 0.05)])==['term1']